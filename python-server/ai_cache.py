@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AI回复的持久化缓存
+
+同一个班级里常见的错误答案会反复出现，评估、提示和解决方案的回复按
+操作 + 模型名称 + 规范化后的用户代码、示例代码和输出 缓存在SQLite数据库中（WAL模式，
+IPC服务器与HTTP服务器可同时读写）。代码按AST规范化，注释、空白和格式差异不影响命中。
+条目超过有效期后失效，总数超过上限时按最近使用时间淘汰。
+"""
+
+import os
+import ast
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from config_loader import get_server_option, get_cache_dir
+
+OP_EVALUATE = "evaluate"
+OP_HINT = "hint"
+OP_SOLUTION = "solution"
+
+# 每写入多少条检查一次过期与容量
+_PRUNE_EVERY = 50
+
+
+def normalize_code(source):
+    """按AST规范化代码；无法解析时去掉注释行和每行首尾空白"""
+    source = source or ""
+    try:
+        return ast.dump(ast.parse(source), include_attributes=False)
+    except (SyntaxError, ValueError):
+        lines = (line.strip() for line in source.replace("\r\n", "\n").split("\n"))
+        return "\n".join(line for line in lines if line and not line.startswith("#"))
+
+
+def normalize_output(output):
+    """去掉每行末尾和整体末尾的空白"""
+    lines = str(output or "").replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).rstrip()
+
+
+def make_key(operation, model_name, user_code, expected_code, output):
+    """缓存键"""
+    parts = [operation, model_name, normalize_code(user_code), normalize_code(expected_code),
+             normalize_output(output)]
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+
+class AIResponseCache:
+    """SQLite存储的AI回复缓存"""
+
+    def __init__(self, path=None, max_entries=None, ttl_hours=None):
+        if max_entries is None:
+            max_entries = get_server_option("ai_cache", "max_entries", 5000)
+        if ttl_hours is None:
+            ttl_hours = get_server_option("ai_cache", "ttl_hours", 168.0)
+        self.path = path or os.path.join(get_cache_dir(), "ai_cache.sqlite3")
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl_hours * 3600
+        self.enabled_operations = {
+            op for op in (OP_EVALUATE, OP_HINT, OP_SOLUTION)
+            if get_server_option("ai_cache", op, True)
+        }
+
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = {op: 0 for op in (OP_EVALUATE, OP_HINT, OP_SOLUTION)}
+        self.misses = dict(self.hits)
+        try:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, operation TEXT NOT NULL, model TEXT NOT NULL,"
+                " response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+            self._conn.commit()
+        except sqlite3.Error:
+            # 缓存目录不可写或数据库损坏时不使用缓存
+            self._conn = None
+
+    def enabled(self, operation):
+        return self._conn is not None and operation in self.enabled_operations
+
+    def get(self, operation, key):
+        """返回缓存的回复，未命中或已过期时返回None"""
+        if not self.enabled(operation):
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                row = self._conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self.hits[operation] += 1
+                    return row[0]
+            except sqlite3.Error:
+                pass
+            self.misses[operation] += 1
+            return None
+
+    def put(self, operation, key, model_name, response):
+        """保存一条回复"""
+        if not self.enabled(operation):
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, operation, model, response, created, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, operation, model_name, response, now, now)
+                )
+                self._writes += 1
+                if self._writes % _PRUNE_EVERY == 0:
+                    self._prune_locked(now)
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def _prune_locked(self, now):
+        self._conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        # 超出上限的部分按最近使用时间淘汰
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def prune(self):
+        """删除过期条目并把总数限制在上限以内"""
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._prune_locked(time.time())
+                self._conn.commit()
+            except sqlite3.Error:
+                pass
+
+    def clear(self):
+        """清空缓存"""
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        """返回条目数与各操作的命中统计"""
+        entries = None
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            hits = dict(self.hits)
+            misses = dict(self.misses)
+        total_hits = sum(hits.values())
+        total = total_hits + sum(misses.values())
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_hours": self.ttl / 3600,
+            "enabled": sorted(self.enabled_operations) if self._conn is not None else [],
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": total_hits / total if total else 0.0
+        }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_ai_cache():
+    """返回进程内共享的AI回复缓存"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = AIResponseCache()
+        return _shared_cache
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AI服务的可用性状态
+
+熔断器记录连续失败次数：达到阈值后断开，断开期间的请求立即失败，不再等待网络超时；
+断开时间按指数退避增长，到期后进入半开状态，只放行一次试探请求，成功则恢复，失败则继续断开。
+后台健康检查直接探测配置的base_url，只有连接失败、超时和服务端5xx错误才计为失败，
+密钥错误等4xx响应说明网络可达，不影响熔断状态。
+"""
+
+import time
+import threading
+from config_loader import get_server_option
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """带指数退避与半开试探的熔断器"""
+
+    def __init__(self, failure_threshold=None, base_backoff=None, max_backoff=None):
+        if failure_threshold is None:
+            failure_threshold = get_server_option("ai_health", "failure_threshold", 2)
+        if base_backoff is None:
+            base_backoff = get_server_option("ai_health", "base_backoff", 5.0)
+        if max_backoff is None:
+            max_backoff = get_server_option("ai_health", "max_backoff", 300.0)
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.trips = 0            # 连续断开的次数，决定退避时长
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self.last_error = None
+        self.last_success = None
+        self.last_failure = None
+
+    def allow(self):
+        """是否放行一次请求；断开期满后只放行一次试探请求"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() >= self.open_until:
+                self.state = STATE_HALF_OPEN
+                self.trial_in_flight = False
+            if self.state == STATE_HALF_OPEN and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = STATE_CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.trial_in_flight = False
+            self.last_success = time.time()
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self.last_failure = time.time()
+            if self.state == STATE_HALF_OPEN or self.failures >= self.failure_threshold:
+                self.trips += 1
+                backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.trips - 1))
+                self.state = STATE_OPEN
+                self.open_until = time.monotonic() + backoff
+                self.trial_in_flight = False
+
+    def release_trial(self):
+        """试探请求既未成功也未失败（例如密钥错误）时归还试探名额"""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def retry_in(self):
+        """距离允许下一次试探的秒数，未断开时为0"""
+        with self._lock:
+            if self.state != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.open_until - time.monotonic())
+
+    def snapshot(self):
+        """返回当前状态"""
+        with self._lock:
+            retry_in = max(0.0, self.open_until - time.monotonic()) if self.state == STATE_OPEN else 0.0
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "retry_in": round(retry_in, 1),
+                "last_error": self.last_error,
+                "last_success": self.last_success,
+                "last_failure": self.last_failure
+            }
+
+
+class HealthMonitor:
+    """定期探测模型服务地址，把结果记录到熔断器"""
+
+    def __init__(self, probe, breaker, interval=None):
+        """
+        probe: 执行一次探测的函数，不可达时抛出异常，返回False表示未配置、跳过本次探测
+        """
+        if interval is None:
+            interval = get_server_option("ai_health", "probe_interval", 30.0)
+        self.probe = probe
+        self.breaker = breaker
+        self.interval = interval
+        self.last_probe = None
+        self.last_latency_ms = None
+        self.configured = None
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def start(self, warm_up=True):
+        """
+        启动后台线程
+        warm_up为真时立即进行第一次探测（同时预先建立连接），否则等待一个探测间隔后才第一次探测
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(warm_up,), daemon=True, name="ai-health")
+            self._thread.start()
+
+    def check_now(self):
+        """请求立即探测一次，例如保存了新的密钥之后"""
+        self._wakeup.set()
+
+    def stop(self):
+        self._stopped = True
+        self._wakeup.set()
+
+    def _run(self, warm_up):
+        if not warm_up:
+            # check_now可以提前唤醒第一次探测
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+        while not self._stopped:
+            self.probe_once()
+            # 断开时在退避期满后立即试探，正常时按固定间隔探测
+            retry_in = self.breaker.retry_in()
+            delay = min(self.interval, retry_in) if retry_in else self.interval
+            self._wakeup.wait(delay)
+            self._wakeup.clear()
+
+    def probe_once(self):
+        """探测一次，熔断器不放行时跳过"""
+        if not self.breaker.allow():
+            return
+        start = time.perf_counter()
+        try:
+            configured = self.probe()
+        except Exception as e:
+            self.breaker.record_failure(e)
+            self.configured = True
+        else:
+            self.configured = configured is not False
+            if self.configured:
+                self.breaker.record_success()
+                self.last_latency_ms = round((time.perf_counter() - start) * 1000, 1)
+            else:
+                self.breaker.release_trial()
+        self.last_probe = time.time()
+
+    def status(self):
+        """返回可供界面轮询的状态，不发起网络请求"""
+        state = self.breaker.snapshot()
+        state.update({
+            "configured": self.configured,
+            "available": bool(self.configured) and state["state"] != STATE_OPEN,
+            "last_probe": self.last_probe,
+            "latency_ms": self.last_latency_ms
+        })
+        return state
@@ -1,96 +1,361 @@
-from openai import OpenAI
-from config_loader import get_api_key, get_base_url
-import configparser
-from pathlib import Path
-import socket
+import time
+import httpx
+import itertools
+import threading
+from contextlib import ExitStack
+from openai import OpenAI, APIConnectionError, InternalServerError, RateLimitError
+from config_loader import get_model_config, get_server_option
+from ai_health import CircuitBreaker, HealthMonitor
+from ai_scheduler import AIScheduler
+from cancellation import RequestCancelled
+from golden_outputs import expected_output as example_output
+from ai_cache import get_ai_cache, make_key, OP_EVALUATE, OP_HINT, OP_SOLUTION
+from prompt_builder import (hint_prompt, solution_prompt, evaluate_prompt, plain_prompt,
+                            UsageStats, usage_to_dict)
 class AITutor:
+    """
+    进程内共享的AI助手
+    HTTP连接池在多次调用之间保持长连接，模型配置按config.ini的修改自动重新加载，
+    密钥或地址变化时才重建客户端；网络不可用时由熔断器直接返回，不再逐次等待超时
+    """
+
     def __init__(self):
-        api_key = get_api_key()
-        base_url = get_base_url()
-        if not api_key:
+        self._lock = threading.Lock()
+        self._client = None
+        self._client_config = None
+        self._http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=get_server_option("ai", "max_connections", 8),
+                max_keepalive_connections=get_server_option("ai", "max_keepalive_connections", 4),
+                keepalive_expiry=get_server_option("ai", "keepalive_expiry", 120.0)
+            ),
+            timeout=httpx.Timeout(get_server_option("ai", "timeout", 60.0), connect=10.0)
+        )
+        self.breaker = CircuitBreaker()
+        self.health = HealthMonitor(self._probe, self.breaker)
+        self.usage = UsageStats()
+        self.scheduler = AIScheduler()
+
+    def _get_client(self):
+        """返回(客户端, 模型名称)，未配置密钥时抛出ValueError"""
+        config = get_model_config()
+        if not config["api_key"]:
             raise ValueError("DeepSeek API密钥未配置")
+        with self._lock:
+            previous = self._client_config
+            if previous is None or (previous["api_key"], previous["base_url"]) != (config["api_key"], config["base_url"]):
+                # 客户端共用同一个连接池，重建客户端不会断开已有连接；
+                # 429和5xx由调度器退避重试，关闭SDK自带的重试
+                self._client = OpenAI(
+                    api_key=config["api_key"],
+                    base_url=config["base_url"],
+                    http_client=self._http_client,
+                    max_retries=0
+                )
+            self._client_config = config
+            return self._client, config["model_name"]
 
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url= base_url
+    def _probe(self):
+        """
+        探测配置的服务地址，同时在连接池中保留一条连接，下一次请求不再等待TCP与TLS握手
+        未配置密钥时返回False；连接失败、超时或5xx时抛出异常
+        """
+        config = get_model_config()
+        if not config["api_key"]:
+            return False
+        response = self._http_client.head(
+            config["base_url"], timeout=get_server_option("ai_health", "probe_timeout", 5.0)
         )
+        if response.status_code >= 500:
+            raise RuntimeError(f"服务端错误 {response.status_code}")
+        return True
+
+    def close(self):
+        """关闭连接池"""
+        self._http_client.close()
 
-    def generate_hint(self, user_code, expected_output, actual_output):
+    def generate_hint(self, user_code, expected_output, actual_output, cancel=None):
         """生成智能提示"""
-        prompt = f"""根据以下信息提供简短的代码提示（1-2句话）：
-        - 用户代码：{user_code}
-        - 预期输出：{expected_output}
-        - 实际输出：{actual_output}
-        请指出问题关键，忽略用户代码中注释的部分，不要提供完整代码"""
+        prompt = hint_prompt(user_code, expected_output, actual_output, example_output(expected_output))
+        return self._call_api(prompt, max_tokens=100,
+                              cache=(OP_HINT, user_code, expected_output, actual_output), cancel=cancel)
 
-        return self._call_api(prompt, max_tokens=100)
+    def stream_hint(self, user_code, expected_output, actual_output, cancel=None):
+        """逐段生成智能提示，事件格式见_stream_api"""
+        prompt = hint_prompt(user_code, expected_output, actual_output, example_output(expected_output))
+        return self._stream_api(prompt, max_tokens=100,
+                                cache=(OP_HINT, user_code, expected_output, actual_output), cancel=cancel)
 
     def test(self):
         """测试AI可用性"""
-        prompt = "Hello, AI!"
-        return self._call_api(prompt, max_tokens=100)
+        return self._call_api(plain_prompt("test", "Hello, AI!"), max_tokens=100)
 
-    def generate_solution(self, user_code, expected_output, actual_output):
+    def generate_solution(self, user_code, expected_output, actual_output, cancel=None):
         """生成完整解决方案"""
-        prompt = f"""根据以下信息提供详细解决方案：
-        - 用户代码：{user_code}
-        - 预期输出：{expected_output}
-        - 实际输出：{actual_output}
-        只需要包含正确代码, 不需要解释"""
-
-        return self._call_api(prompt, max_tokens=500)
-
-    def evaluate_code(self, expected_code, user_code, user_output=None):
-        """使用AI评估用户代码是否正确实现了预期功能"""
-        prompt = f"""请评估用户代码是否正确实现了预期功能：
-        - 示例代码：{expected_code}
-        - 用户代码：{user_code}
-        - 用户代码输出：{user_output}
-
-        请分析两段代码的功能是否等价，不要只关注代码的相似性和返回结果的一致性，而是关注功能的一致性。
-        当返回结果相同时，请检查用户代码是否实现了与示例代码相同的功能以及输出的内容是否和上下文产生联系。
-        如果用户代码实现了与示例代码相同的功能，请回复：'通过'
-        如果用户代码没有实现预期功能，请回复：'不通过，原因：<简要说明原因>'
-        """
+        prompt = solution_prompt(user_code, expected_output, actual_output, example_output(expected_output))
+        return self._call_api(prompt, max_tokens=500,
+                              cache=(OP_SOLUTION, user_code, expected_output, actual_output), cancel=cancel)
 
-        result = self._call_api(prompt, max_tokens=200)
+    def stream_solution(self, user_code, expected_output, actual_output, cancel=None):
+        """逐段生成完整解决方案，事件格式见_stream_api"""
+        prompt = solution_prompt(user_code, expected_output, actual_output, example_output(expected_output))
+        return self._stream_api(prompt, max_tokens=500,
+                                cache=(OP_SOLUTION, user_code, expected_output, actual_output), cancel=cancel)
+
+    def evaluate_code(self, expected_code, user_code, user_output=None, cancel=None, operation=OP_EVALUATE):
+        """
+        使用AI评估用户代码是否正确实现了预期功能
+        operation为调度器和用量统计中使用的操作名，批量评估使用batch_evaluate；回复缓存与单次评估共用
+        """
+        prompt = evaluate_prompt(expected_code, user_code, user_output, example_output(expected_code))
+        prompt["operation"] = operation
+        result = self._call_api(prompt, max_tokens=200, cache=(OP_EVALUATE, user_code, expected_code, user_output),
+                                cancel=cancel)
         # 检查result是否为None
         if result is None:
             return False
         return str(result).startswith('通过')
-    def check_internet_connection(self, timeout=3):
-        """检查网络连通性"""
+    @staticmethod
+    def _cache_key(cache):
+        """cache为(操作, 用户代码, 示例代码或预期输出, 实际输出)，该操作未启用缓存时返回None"""
+        if cache is None or not get_ai_cache().enabled(cache[0]):
+            return None
+        return make_key(cache[0], get_model_config()["model_name"], *cache[1:])
+
+    @staticmethod
+    def _retry_after(error):
+        """服务端在Retry-After响应头中建议的等待秒数"""
+        response = getattr(error, "response", None)
         try:
-            # 使用稳定的网站进行连接测试
-            socket.create_connection(("8.8.8.8", 53), timeout=timeout)
-            return True
-        except Exception:
-            return False
-    def _call_api(self, prompt, max_tokens=300):
-        """调用API核心方法"""
+            return float(response.headers.get("retry-after"))
+        except (AttributeError, TypeError, ValueError):
+            return None
+
+    def _request(self, stack, prompt, max_tokens, cancel=None, **options):
+        """
+        在调度器中排队后发起请求，返回(响应, 模型名称)
+        占用的名额登记到stack，stack关闭时归还（流式响应读完后才归还）；
+        429和5xx在退避后重试，等待期间不占用名额，重试次数用完后抛出最后一次的异常
+        排队或退避期间被取消时抛出RequestCancelled
+        """
+        client, model_name = self._get_client()
+        operation = prompt["operation"]
+        tokens = prompt["prompt_tokens"] + max_tokens
+        for attempt in itertools.count():
+            slot = ExitStack()
+            slot.enter_context(self.scheduler.slot(operation, tokens, cancel))
+            try:
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=prompt["messages"],
+                    max_tokens=max_tokens,
+                    temperature=0.7,
+                    **options
+                )
+            except (RateLimitError, InternalServerError) as e:
+                slot.close()
+                if attempt >= self.scheduler.max_retries:
+                    raise
+                delay = self.scheduler.retry_delay(operation, attempt, self._retry_after(e))
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise RequestCancelled(cancel.reason)
+                continue
+            except BaseException:
+                slot.close()
+                raise
+            stack.enter_context(slot)
+            return response, model_name
+
+    def _call_api(self, prompt, max_tokens=300, cache=None, cancel=None):
+        """
+        调用API核心方法，prompt为prompt_builder构建的提示词
+        提供cache时先查询AI回复缓存，成功的回复写入缓存；每次实际请求的token用量计入self.usage
+        提供cancel时改用流式接口，取消时可以立即关闭连接，被取消时抛出RequestCancelled
+        """
+        if cancel is not None:
+            for kind, value in self._stream_api(prompt, max_tokens, cache, cancel):
+                if kind == "done":
+                    return value["text"]
+        cache_key = self._cache_key(cache)
+        if cache_key is not None:
+            cached = get_ai_cache().get(cache[0], cache_key)
+            if cached is not None:
+                return cached
+        if not self.breaker.allow():
+            return f"网络连接失败，请检查网络设置（约{max(1, round(self.breaker.retry_in()))}秒后自动重试）"
         try:
-            if not self.check_internet_connection():
-                return "网络连接失败，请检查网络设置"
-            # 读取配置文件
-            config_file_path = Path(__file__).parent / "config.ini"
-            config = configparser.ConfigParser()
-            config.read(config_file_path)
-
-            # 获取第一个节点的名称
-            # 如果没有节点，使用默认值 "deepseek-chat"
-            model_name = config.sections()[0] if config.sections() else "deepseek-chat"
-
-            response = self.client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "你是一个资深的Python编程助手"},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=0.7
-            )
-            return response.choices[0].message.content
+            with ExitStack() as stack:
+                response, model_name = self._request(stack, prompt, max_tokens)
+        except RateLimitError as e:
+            # 重试后仍被限流，说明网络可达，不计入熔断
+            self.breaker.release_trial()
+            return f"请求过于频繁，请稍后再试：{str(e)}"
+        except (APIConnectionError, InternalServerError) as e:
+            # 只有网络和服务端故障计入熔断
+            self.breaker.record_failure(e)
+            return f"无法获取AI建议：{str(e)}"
         except Exception as e:
+            self.breaker.release_trial()
             return f"无法获取AI建议：{str(e)}"
+        self.breaker.record_success()
+        self.usage.record(prompt, usage_to_dict(getattr(response, "usage", None)))
+        content = response.choices[0].message.content
+        if cache_key is not None and content:
+            get_ai_cache().put(cache[0], cache_key, model_name, content)
+        return content
+
+    def _stream_api(self, prompt, max_tokens=300, cache=None, cancel=None):
+        """
+        以流式接口调用API，返回生成器：
+            ("delta", 文本片段) 若干次，最后一次 ("done", 统计)
+        统计为{"text", "usage", "first_token_ms", "elapsed_ms", "error", "cached"}，text为完整回复；
+        出错时text为错误说明，与_call_api的返回值一致；命中缓存时整段回复作为一个片段返回
+        cancel被取消时关闭进行中的响应并抛出RequestCancelled
+        """
+        start = time.perf_counter()
+        stats = {"text": "", "usage": None, "first_token_ms": None, "elapsed_ms": None, "error": None,
+                 "cached": False}
+        cache_key = self._cache_key(cache)
+        if cache_key is not None:
+            cached = get_ai_cache().get(cache[0], cache_key)
+            if cached is not None:
+                stats.update(text=cached, cached=True)
+                stats["first_token_ms"] = stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                yield "delta", cached
+                yield "done", stats
+                return
+        if not self.breaker.allow():
+            stats["error"] = stats["text"] = \
+                f"网络连接失败，请检查网络设置（约{max(1, round(self.breaker.retry_in()))}秒后自动重试）"
+            stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+            yield "done", stats
+            return
+
+        parts = []
+        try:
+            with ExitStack() as stack:
+                stream, model_name = self._request(stack, prompt, max_tokens, cancel, stream=True,
+                                                   stream_options={"include_usage": True})
+                if cancel is not None:
+                    # 在其他线程中关闭连接，阻塞中的读取随即结束
+                    stack.callback(cancel.on_cancel(stream.close))
+                try:
+                    for chunk in stream:
+                        if cancel is not None:
+                            cancel.check()
+                        if chunk.usage is not None:
+                            stats["usage"] = usage_to_dict(chunk.usage)
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if stats["first_token_ms"] is None:
+                                stats["first_token_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                            parts.append(delta)
+                            yield "delta", delta
+                    if cancel is not None:
+                        # 连接被关闭时流可能正常结束，不能把不完整的回复当作成功
+                        cancel.check()
+                finally:
+                    # 调用方提前停止迭代时释放连接
+                    stream.close()
+        except (GeneratorExit, RequestCancelled):
+            # 调用方不再需要结果（例如HTTP客户端断开或请求被取消），不计入成功或失败
+            self.breaker.release_trial()
+            raise
+        except RateLimitError as e:
+            self.breaker.release_trial()
+            stats["error"] = f"请求过于频繁，请稍后再试：{str(e)}"
+        except Exception as e:
+            if cancel is not None and cancel.cancelled:
+                # 连接被取消回调关闭后，读取抛出的异常不代表服务故障
+                self.breaker.release_trial()
+                raise RequestCancelled(cancel.reason)
+            if isinstance(e, (APIConnectionError, InternalServerError)):
+                self.breaker.record_failure(e)
+            else:
+                self.breaker.release_trial()
+            stats["error"] = f"无法获取AI建议：{str(e)}"
+        else:
+            self.breaker.record_success()
+            self.usage.record(prompt, stats["usage"])
+            if cache_key is not None and parts:
+                get_ai_cache().put(cache[0], cache_key, model_name, ''.join(parts))
+        stats["text"] = stats["error"] or ''.join(parts)
+        stats["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        yield "done", stats
+
+
+_shared_tutor = None
+_shared_lock = threading.Lock()
+
+
+def coalesce_deltas(events, batch_chars=None, interval=None):
+    """
+    合并_stream_api产生的文本片段，减少消息数量
+    首个片段立即转发；之后积攒到batch_chars个字符，或距上次转发超过interval秒时转发
+    """
+    if batch_chars is None:
+        batch_chars = get_server_option("ai_streaming", "batch_chars", 24)
+    if interval is None:
+        interval = get_server_option("ai_streaming", "interval_ms", 50) / 1000
+    pending = []
+    pending_chars = 0
+    last_flush = 0.0
+    for kind, value in events:
+        if kind != "delta":
+            if pending:
+                yield "delta", ''.join(pending)
+                pending = []
+            yield kind, value
+            continue
+        pending.append(value)
+        pending_chars += len(value)
+        now = time.monotonic()
+        if pending_chars >= batch_chars or now - last_flush >= interval:
+            yield "delta", ''.join(pending)
+            pending = []
+            pending_chars = 0
+            last_flush = now
+
+
+def _get_shared_tutor():
+    global _shared_tutor
+    with _shared_lock:
+        if _shared_tutor is None:
+            _shared_tutor = AITutor()
+        return _shared_tutor
+
+
+def get_ai_tutor():
+    """返回进程内共享的AI助手，未配置密钥时抛出ValueError"""
+    tutor = _get_shared_tutor()
+    # 与原先每次新建AITutor时一样，在调用前检查配置
+    tutor._get_client()
+    return tutor
+
+
+def start_ai_health_monitor():
+    """
+    启动后台健康检查
+    server.ini中[ai] warm_up为真时立即进行第一次探测，同时预先建立连接；为假时按探测间隔进行第一次探测
+    """
+    _get_shared_tutor().health.start(get_server_option("ai", "warm_up", True))
+
+
+def get_ai_status():
+    """返回AI服务的可用性状态（只读取缓存的探测结果）和调度器的排队情况"""
+    tutor = _get_shared_tutor()
+    return dict(tutor.health.status(), scheduler=tutor.scheduler.stats())
+
+
+def get_ai_usage():
+    """返回按操作累计的token用量"""
+    return _get_shared_tutor().usage.snapshot()
 
 
+def refresh_ai_status():
+    """请求立即重新探测，例如修改了模型配置之后"""
+    _get_shared_tutor().health.check_now()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AI请求调度
+
+所有模型调用先在调度器中排队：交互式的提示和解决方案优先于后台的代码评估，
+每种操作有各自的并发上限，整体受每分钟请求数和token数的令牌桶限制（见server.ini的[ai_scheduler]）。
+服务端返回429或5xx时按带随机抖动的指数退避重试，重试等待期间不占用并发名额。
+"""
+
+import time
+import random
+import bisect
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from config_loader import get_server_option
+from ai_cache import OP_EVALUATE, OP_HINT, OP_SOLUTION
+
+# 批量评估中的AI调用，与单次评估分开限制并发
+OP_BATCH_EVALUATE = "batch_evaluate"
+
+# 数字越小越优先；未列出的操作（例如可用性测试）按交互式处理
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+OPERATION_PRIORITIES = {
+    OP_HINT: PRIORITY_INTERACTIVE,
+    OP_SOLUTION: PRIORITY_INTERACTIVE,
+    OP_EVALUATE: PRIORITY_BACKGROUND,
+    OP_BATCH_EVALUATE: PRIORITY_BACKGROUND,
+}
+
+# 统计排队时间分位数时保留的最近样本数
+_WAIT_SAMPLES = 200
+
+
+class TokenBucket:
+    """令牌桶，per_minute为每分钟补充的令牌数（也是桶的容量），0表示不限制"""
+
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self._available = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_take(self, tokens):
+        """令牌足够时取出并返回0，否则不取出，返回还需等待的秒数；单次需求超过容量时按容量计"""
+        if not self.per_minute:
+            return 0.0
+        tokens = min(tokens, self.per_minute)
+        rate = self.per_minute / 60.0
+        with self._lock:
+            now = time.monotonic()
+            self._available = min(self.per_minute, self._available + (now - self._updated) * rate)
+            self._updated = now
+            if self._available >= tokens:
+                self._available -= tokens
+                return 0.0
+            return (tokens - self._available) / rate
+
+    def refund(self, tokens):
+        """归还取出但未使用的令牌"""
+        if not self.per_minute:
+            return
+        with self._lock:
+            self._available = min(self.per_minute, self._available + tokens)
+
+
+class _OperationStats:
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.retries = 0
+        self.waits = deque(maxlen=_WAIT_SAMPLES)
+
+
+def _percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000, 1)
+
+
+class AIScheduler:
+    """按优先级排队、限制并发和速率的模型调用调度器"""
+
+    def __init__(self, max_concurrency=None, operation_limits=None, requests_per_minute=None,
+                 tokens_per_minute=None):
+        """
+        max_concurrency: 同时进行的模型调用总数
+        operation_limits: {操作: 并发上限}，未提供时读取server.ini
+        requests_per_minute / tokens_per_minute: 令牌桶容量，0表示不限制
+        """
+        if max_concurrency is None:
+            max_concurrency = get_server_option("ai_scheduler", "max_concurrency", 6)
+        if operation_limits is None:
+            operation_limits = {
+                OP_HINT: get_server_option("ai_scheduler", "hint_concurrency", 4),
+                OP_SOLUTION: get_server_option("ai_scheduler", "solution_concurrency", 2),
+                OP_EVALUATE: get_server_option("ai_scheduler", "evaluate_concurrency", 2),
+                OP_BATCH_EVALUATE: get_server_option("batch", "llm_concurrency", 4),
+            }
+        if requests_per_minute is None:
+            requests_per_minute = get_server_option("ai_scheduler", "requests_per_minute", 0)
+        if tokens_per_minute is None:
+            tokens_per_minute = get_server_option("ai_scheduler", "tokens_per_minute", 0)
+        self.max_concurrency = max(1, max_concurrency)
+        self.operation_limits = {op: max(1, limit) for op, limit in operation_limits.items()}
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = get_server_option("ai_scheduler", "max_retries", 3)
+        self.base_delay = get_server_option("ai_scheduler", "retry_base_delay", 0.5)
+        self.max_delay = get_server_option("ai_scheduler", "retry_max_delay", 8.0)
+
+        self._cond = threading.Condition()
+        self._waiting = []   # 按(优先级, 序号)排序的 (优先级, 序号, 操作)
+        self._seq = itertools.count()
+        self._running = 0
+        self._stats = {}
+
+    def _op_stats(self, operation):
+        stats = self._stats.get(operation)
+        if stats is None:
+            stats = self._stats[operation] = _OperationStats()
+        return stats
+
+    def _has_capacity(self, operation):
+        limit = self.operation_limits.get(operation)
+        return (self._running < self.max_concurrency
+                and (limit is None or self._op_stats(operation).running < limit))
+
+    def _next_eligible(self):
+        """排在最前、且其操作还有并发名额的等待者"""
+        for entry in self._waiting:
+            if self._has_capacity(entry[2]):
+                return entry
+        return None
+
+    def _wake(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, operation, tokens=0, cancel=None):
+        """
+        占用一个调用名额，离开with块时归还
+        tokens为本次调用的估算token数，用于每分钟token限制
+        cancel为CancelToken时，排队期间被取消会离开队列并抛出RequestCancelled
+        """
+        priority = OPERATION_PRIORITIES.get(operation, PRIORITY_INTERACTIVE)
+        entry = (priority, next(self._seq), operation)
+        start = time.monotonic()
+        unregister = cancel.on_cancel(self._wake) if cancel is not None else None
+        with self._cond:
+            stats = self._op_stats(operation)
+            stats.queued += 1
+            bisect.insort(self._waiting, entry)
+            try:
+                while True:
+                    if cancel is not None:
+                        cancel.check()
+                    timeout = None
+                    if self._next_eligible() == entry:
+                        # 轮到自己时检查速率限制；等待令牌期间仍排在前面，后来的请求不会插队
+                        timeout = self.requests.try_take(1)
+                        if not timeout:
+                            timeout = self.tokens.try_take(tokens)
+                            if timeout:
+                                # 请求令牌已取出，只差token令牌，归还后重新等待
+                                self.requests.refund(1)
+                        if not timeout:
+                            break
+                    self._cond.wait(timeout)
+            finally:
+                self._waiting.remove(entry)
+                stats.queued -= 1
+                # 队首变化，后面的等待者可能可以开始
+                self._cond.notify_all()
+                if unregister is not None:
+                    unregister()
+            self._running += 1
+            stats.running += 1
+            stats.waits.append(time.monotonic() - start)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                stats.running -= 1
+                stats.completed += 1
+                self._cond.notify_all()
+
+    def retry_delay(self, operation, attempt, retry_after=None):
+        """
+        第attempt次（从0开始）重试前的等待秒数：服务端给出Retry-After时按其等待，
+        否则为带随机抖动的指数退避
+        """
+        with self._cond:
+            self._op_stats(operation).retries += 1
+        if retry_after is not None:
+            return min(self.max_delay, max(0.0, retry_after))
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self):
+        """各操作的排队数、运行数、完成数、重试次数与排队时间分位数"""
+        with self._cond:
+            operations = {
+                operation: {
+                    "queued": stats.queued,
+                    "running": stats.running,
+                    "completed": stats.completed,
+                    "retries": stats.retries,
+                    "limit": self.operation_limits.get(operation),
+                    "wait_ms_p50": _percentile(stats.waits, 0.5),
+                    "wait_ms_p95": _percentile(stats.waits, 0.95)
+                }
+                for operation, stats in self._stats.items()
+            }
+            return {
+                "queued": len(self._waiting),
+                "running": self._running,
+                "max_concurrency": self.max_concurrency,
+                "operations": operations
+            }
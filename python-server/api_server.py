@@ -8,13 +8,21 @@ Python代码跟练系统API服务器
 """
 
 import os
-import re
 import json
+import queue
 import traceback
+import threading
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
-from ai_helper import AITutor
+from ai_helper import get_ai_tutor, get_ai_status, get_ai_usage, start_ai_health_monitor, coalesce_deltas
+from tutorial_cache import TutorialCache
+from md_parser import parse_document
+from search_index import get_search_index
+from executor import get_execution_engine
+from limits import resolve_limits
+from grader import grade
+from batch_grader import BatchGrader
 import configparser
 import base64
 from Crypto.Cipher import AES
@@ -38,57 +46,14 @@ TUTORIALS = {
 }
 
 
-def extract_code_blocks(md_content):
-    """从Markdown内容中提取Python代码块"""
-    pattern = r'```python\n(.+?)\n```'
-    return re.findall(pattern, md_content, re.DOTALL)
+# 教程解析结果缓存，IPC服务器同样使用该实例；缓存的是基于偏移的文档，序列化时调用to_dict()
+tutorial_cache = TutorialCache(parse_document)
 
 
-def extract_sections(md_content):
-    """从Markdown内容中提取章节"""
-    sections = []
-    current_section = {"title": "", "content": "", "code_blocks": []}
-
-    lines = md_content.split('\n')
-    for line in lines:
-        if line.startswith('## '):
-            if current_section["title"]:
-                sections.append(current_section)
-            current_section = {"title": line[3:], "content": line + '\n', "code_blocks": []}
-        elif line.startswith('### '):
-            current_section["content"] += line + '\n'
-        else:
-            current_section["content"] += line + '\n'
-
-    if current_section["title"]:
-        sections.append(current_section)
-
-    # 提取每个章节中的代码块
-    for section in sections:
-        section["code_blocks"] = extract_code_blocks(section["content"])
-
-    return sections
-
-
-def run_code(code):
-    """运行用户输入的代码并捕获输出和错误"""
-    # 创建一个临时的命名空间，同时用于全局和本地
-    namespace = {}
-
-    try:
-        # 重定向标准输出以捕获print输出
-        import io
-        from contextlib import redirect_stdout
-
-        f = io.StringIO()
-        with redirect_stdout(f):
-            exec(code, namespace, namespace)
-
-        output = f.getvalue()
-        return {"success": True, "output": output, "vars": namespace}
-    except Exception as e:
-        error_msg = traceback.format_exc()
-        return {"success": False, "output": error_msg, "vars": namespace}
+def run_code(code, command=None, tutorial_key=None, use_cache=True):
+    """在执行引擎的工作进程中运行用户代码，资源限制按命令和教程从server.ini读取"""
+    limits = resolve_limits(command, tutorial_key)
+    return get_execution_engine().run(code, limits, use_cache=use_cache)
 
 #解密函数
 def decrypt_key(encrypted_api_key, iv, aes_key):
@@ -198,19 +163,68 @@ def get_tutorial(tutorial_key):
     if not md_file.exists():
         return jsonify({"error": f"未找到Markdown文件 '{md_file}'"}), 404
 
-    with open(md_file, 'r', encoding='utf-8') as f:
-        md_content = f.read()
+    # 从缓存读取解析结果，文件修改后自动重新解析
+    return jsonify(tutorial_cache.get(md_file).to_dict())
 
-    # 提取章节
-    sections = extract_sections(md_content)
 
-    # 获取教程标题
-    title = md_content.split('\n')[0].lstrip('#').strip()
+def _tutorial_file(tutorial_key):
+    """定位教程对应的Markdown文件，不存在时返回None"""
+    if tutorial_key not in TUTORIALS:
+        return None
+    md_file = Path(__file__).parent / "notes" / TUTORIALS[tutorial_key]
+    return md_file if md_file.exists() else None
 
-    return jsonify({
-        "title": title,
-        "sections": sections
-    })
+
+@app.route('/api/tutorial/<tutorial_key>/outline', methods=['GET'])
+def get_tutorial_outline(tutorial_key):
+    """获取教程目录（章节标题、id、大小和练习数量）"""
+    md_file = _tutorial_file(tutorial_key)
+    if md_file is None:
+        return jsonify({"error": f"未找到教程 '{tutorial_key}'"}), 404
+    return jsonify(tutorial_cache.get(md_file).outline())
+
+
+@app.route('/api/tutorial/<tutorial_key>/section/<int:section_id>', methods=['GET'])
+def get_section(tutorial_key, section_id):
+    """获取单个章节"""
+    md_file = _tutorial_file(tutorial_key)
+    if md_file is None:
+        return jsonify({"error": f"未找到教程 '{tutorial_key}'"}), 404
+    try:
+        return jsonify(tutorial_cache.get(md_file).section(section_id))
+    except IndexError:
+        return jsonify({"error": f"未找到章节 '{section_id}'"}), 404
+
+
+@app.route('/api/tutorial/<tutorial_key>/prefetch', methods=['POST'])
+def prefetch_sections(tutorial_key):
+    """一次获取多个章节，供客户端预热相邻章节，不存在的id会被忽略"""
+    md_file = _tutorial_file(tutorial_key)
+    if md_file is None:
+        return jsonify({"error": f"未找到教程 '{tutorial_key}'"}), 404
+    document = tutorial_cache.get(md_file)
+    sections = []
+    for section_id in (request.json or {}).get('section_ids', []):
+        try:
+            sections.append(document.section(section_id))
+        except IndexError:
+            continue
+    return jsonify({"sections": sections})
+
+
+@app.route('/api/search', methods=['GET'])
+def search_tutorials():
+    """全文搜索教程"""
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', 20, type=int)
+    if not query.strip():
+        return jsonify({"error": "缺少必要参数"}), 400
+
+    keys = {file_name: key for key, file_name in TUTORIALS.items()}
+    results = get_search_index().search(query, limit)
+    for result in results:
+        result["tutorialKey"] = keys.get(result["file"])
+    return jsonify({"results": results})
 
 
 @app.route('/api/run-code', methods=['POST'])
@@ -224,24 +238,65 @@ def execute_code():
         return jsonify({"error": "没有提供代码"}), 400
 
     # 运行代码
-    result = run_code(user_code)
+    result = run_code(user_code, "run_code", data.get('tutorialKey'), not data.get('no_cache'))
 
-    # 如果有预期代码，使用AI评估
+    # 如果有预期代码，先在本地评估，无法确认时再使用AI评估
     ai_evaluation = None
     if expected_code and result["success"]:
-        try:
-            ai_tutor = AITutor()
-            ai_result = ai_tutor.evaluate_code(expected_code, user_code, result["output"])
-            ai_evaluation = {"passed": ai_result}
-        except Exception as e:
-            ai_evaluation = {"error": str(e)}
+        run_expected = lambda code: run_code(code, "run_code", data.get('tutorialKey'))
+        ai_evaluation = grade(expected_code, user_code, result, run_expected, get_ai_tutor)
 
     return jsonify({
         "success": result["success"],
         "output": result["output"],
+        "stderr": result["stderr"],
+        "limit": result["limit"],
+        "usage": result["usage"],
+        "cached": result.get("cached", False),
+        "vars": result["vars"],
+        "vars_handle": result["vars_handle"],
         "ai_evaluation": ai_evaluation
     })
 
+@app.route('/api/batch-evaluate', methods=['POST'])
+def batch_evaluate():
+    """
+    批量评估多份代码，submissions为[{"id", "code", "expected_code"}]
+    请求体中stream为真时以Server-Sent Events返回：每份结果一个 event: item，最后一个 event: done（汇总）
+    """
+    data = request.json
+    default_expected = data.get('expected_code', '')
+    submissions = [dict(s, expected_code=s.get('expected_code', default_expected))
+                   for s in data.get('submissions') or []]
+    if not submissions:
+        return jsonify({"error": "没有提供代码"}), 400
+
+    tutorial_key = data.get('tutorialKey')
+    grader = BatchGrader(lambda code: run_code(code, "batch_evaluate", tutorial_key), get_ai_tutor)
+    if not data.get('stream'):
+        results, summary = grader.grade_all(submissions)
+        return jsonify({"results": results, "summary": summary})
+
+    # 评估在后台线程中进行，结果经队列按完成顺序写出
+    events = queue.Queue()
+    def grade_all():
+        try:
+            _, summary = grader.grade_all(submissions, lambda item: events.put(("item", item)))
+            events.put(("done", {"summary": summary}))
+        except Exception as e:
+            events.put(("done", {"error": str(e)}))
+    threading.Thread(target=grade_all, daemon=True).start()
+
+    def generate():
+        while True:
+            kind, payload = events.get()
+            yield f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            if kind == "done":
+                break
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/run-code-simple', methods=['POST'])
 def execute_code_simple():
     """运行用户提交的代码"""
@@ -252,13 +307,70 @@ def execute_code_simple():
         return jsonify({"error": "没有提供代码"}), 400
 
     # 运行代码
-    result = run_code(user_code)
+    result = run_code(user_code, "run_code_simple", data.get('tutorialKey'), not data.get('no_cache'))
 
     return jsonify({
         "success": result["success"],
-        "output": result["output"]
+        "output": result["output"],
+        "stderr": result["stderr"],
+        "limit": result["limit"],
+        "usage": result["usage"],
+        "cached": result.get("cached", False),
+        "vars": result["vars"],
+        "vars_handle": result["vars_handle"]
     })
 
+@app.route('/api/inspect-var', methods=['POST'])
+def inspect_var():
+    """展开运行结果中的变量，按页返回容器的子项"""
+    data = request.json
+    handle = data.get('vars_handle')
+    name = data.get('name')
+
+    if not handle or not name:
+        return jsonify({"error": "缺少必要参数"}), 400
+
+    try:
+        result = get_execution_engine().inspect(
+            handle, name, data.get('path') or [], data.get('offset', 0), data.get('limit')
+        )
+        return jsonify(result)
+    except LookupError as e:
+        return jsonify({"error": str(e).strip("'\"")}), 404
+
+@app.route('/api/ai-status', methods=['GET'])
+def ai_status():
+    """获取AI服务的可用性状态（读取后台探测的结果，不发起网络请求）"""
+    return jsonify(get_ai_status())
+
+@app.route('/api/ai-usage', methods=['GET'])
+def ai_usage():
+    """获取按操作累计的token用量（服务端返回的用量、命中提示词缓存的部分和压缩节省的估算值）"""
+    return jsonify(get_ai_usage())
+
+def _sse_response(events, result_key):
+    """
+    以Server-Sent Events返回流式生成的内容：
+    若干个 event: delta（data为{"text"}），最后一个 event: done（data为完整文本和用量统计）
+    """
+    def generate():
+        for kind, value in coalesce_deltas(events):
+            if kind == "delta":
+                payload = {"text": value}
+            else:
+                payload = {
+                    result_key: value["text"],
+                    "usage": value["usage"],
+                    "first_token_ms": value["first_token_ms"],
+                    "elapsed_ms": value["elapsed_ms"],
+                    "error": value["error"],
+                    "cached": value["cached"]
+                }
+            yield f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/hint', methods=['POST'])
 def get_hint():
     """获取代码提示"""
@@ -272,7 +384,9 @@ def get_hint():
         return jsonify({"error": "缺少必要参数"}), 400
 
     try:
-        ai_tutor = AITutor()
+        ai_tutor = get_ai_tutor()
+        if data.get('stream'):
+            return _sse_response(ai_tutor.stream_hint(user_code, expected_code, actual_output), "hint")
         hint = ai_tutor.generate_hint(
             user_code=user_code,
             expected_output=expected_code,
@@ -286,7 +400,7 @@ def get_hint():
 def test():
     """获取代码提示"""
     try:
-        ai_tutor = AITutor()
+        ai_tutor = get_ai_tutor()
         result = ai_tutor.test()
         return jsonify({"test": result})
     except Exception as e:
@@ -304,7 +418,9 @@ def get_solution():
         return jsonify({"error": "缺少必要参数"}), 400
 
     try:
-        ai_tutor = AITutor()
+        ai_tutor = get_ai_tutor()
+        if data.get('stream'):
+            return _sse_response(ai_tutor.stream_solution(user_code, expected_code, actual_output), "solution")
         solution = ai_tutor.generate_solution(
             user_code=user_code,
             expected_output=expected_code,
@@ -337,4 +453,5 @@ def serve(path):
 
 
 if __name__ == "__main__":
+    start_ai_health_monitor()
     app.run(debug=True, port=5000)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+批量评估
+
+一次提交多份代码：各份代码并发交给执行引擎运行并先在本地评估，
+需要AI判断的部分同时调用模型：AI调用经AITutor的调度器排队，使用单独的batch_evaluate并发上限
+（[batch] llm_concurrency），每分钟token限制统一由调度器执行（[ai_scheduler] tokens_per_minute）。
+每份代码评估完成后立即回调，全部完成后返回汇总。
+总耗时约为 单份最长耗时 × 批次数，而不是所有耗时之和。
+"""
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config_loader import get_server_option
+from grader import grade
+from ai_scheduler import OP_BATCH_EVALUATE
+from cancellation import RequestCancelled
+
+
+class _BatchTutor:
+    """以batch_evaluate操作调用AITutor.evaluate_code，并统计调用次数"""
+
+    def __init__(self, tutor, counter):
+        self._tutor = tutor
+        self._counter = counter
+
+    def evaluate_code(self, expected_code, user_code, user_output=None, cancel=None):
+        self._counter()
+        return self._tutor.evaluate_code(expected_code, user_code, user_output, cancel=cancel,
+                                         operation=OP_BATCH_EVALUATE)
+
+
+class BatchGrader:
+    """并发评估多份提交"""
+
+    def __init__(self, run, get_tutor=None, workers=None, cancel=None):
+        """
+        run: 运行代码的函数，返回执行引擎格式的结果
+        get_tutor: 返回AITutor的函数，为None时不调用AI
+        workers: 同时评估的提交数（运行代码的并行度还受执行引擎工作进程数限制）
+        cancel: 整个批次的CancelToken，被取消时grade_all抛出RequestCancelled
+        """
+        if workers is None:
+            workers = get_server_option("batch", "workers", 16)
+        self.run = run
+        self.get_tutor = get_tutor
+        self.cancel = cancel
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._llm_calls = 0
+        self._tutor = None
+
+    def _count_llm_call(self):
+        with self._lock:
+            self._llm_calls += 1
+
+    def _batch_tutor(self):
+        # 同一批次共用一个包装后的AITutor，首次需要AI判断时才创建
+        with self._lock:
+            if self._tutor is None:
+                self._tutor = _BatchTutor(self.get_tutor(), self._count_llm_call)
+            return self._tutor
+
+    def _grade_one(self, index, submission):
+        start = time.perf_counter()
+        item = {"index": index, "id": submission.get("id", index)}
+        code = submission.get("code", "")
+        expected_code = submission.get("expected_code", "")
+        try:
+            if self.cancel is not None:
+                # 批次已取消时排队中的提交不再运行
+                self.cancel.check()
+            if not code:
+                raise ValueError("No code provided")
+            result = self.run(code)
+            item.update({
+                "success": result["success"],
+                "output": result["output"],
+                "stderr": result["stderr"],
+                "limit": result["limit"],
+                "cached": result.get("cached", False)
+            })
+            evaluation = None
+            if expected_code and result["success"]:
+                get_tutor = self._batch_tutor if self.get_tutor is not None else None
+                evaluation = grade(expected_code, code, result, self.run, get_tutor, self.cancel)
+            item["evaluation"] = evaluation
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            item.update({"success": False, "evaluation": None, "error": str(e)})
+        item["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return item
+
+    def grade_all(self, submissions, on_result=None):
+        """
+        评估submissions（[{"id", "code", "expected_code"}]），返回(按提交顺序排列的结果, 汇总)
+        on_result: 每份提交评估完成时在工作线程中调用，参数为该份结果
+        """
+        start = time.perf_counter()
+        results = [None] * len(submissions)
+
+        def task(index, submission):
+            item = self._grade_one(index, submission)
+            results[index] = item
+            if on_result is not None:
+                on_result(item)
+
+        with ThreadPoolExecutor(max_workers=min(self.workers, max(1, len(submissions))),
+                                thread_name_prefix="batch") as pool:
+            for future in [pool.submit(task, i, s) for i, s in enumerate(submissions)]:
+                future.result()
+
+        return results, self._summarize(results, time.perf_counter() - start)
+
+    def _summarize(self, results, elapsed):
+        summary = {
+            "total": len(results),
+            "passed": 0,
+            "failed": 0,
+            "undecided": 0,
+            "run_errors": 0,
+            "tiers": {},
+            "llm_calls": self._llm_calls,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "max_item_ms": max((item["elapsed_ms"] for item in results), default=0.0)
+        }
+        for item in results:
+            evaluation = item["evaluation"]
+            if not item["success"]:
+                summary["run_errors"] += 1
+            if evaluation is None:
+                continue
+            summary["tiers"][evaluation["tier"]] = summary["tiers"].get(evaluation["tier"], 0) + 1
+            if evaluation["passed"] is None:
+                summary["undecided"] += 1
+            elif evaluation["passed"]:
+                summary["passed"] += 1
+            else:
+                summary["failed"] += 1
+        return summary
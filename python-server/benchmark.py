@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+热点路径的微基准测试
+
+覆盖三类路径：
+    parser  md_parser.extract_sections / extract_code_blocks，逐个解析notes中的教程，
+            以及由教程内容重复拼接成的数MB合成教程
+    run     执行引擎运行空代码、大量print和纯计算代码的开销（不使用运行结果缓存）
+    send    IPCServer._send_response在按行（line）、帧（frame）和帧+zlib模式下
+            序列化并写出1KB到10MB响应的耗时，输出写入丢弃数据的流
+每个用例先预热一次，再按timeit.autorange确定每轮调用次数，重复多轮取中位数。
+
+结果可以保存为基线JSON，之后与基线比较：中位数慢于基线超过阈值（默认20%）的用例记为退化，
+有退化时以状态码1退出，便于在修改这些路径前后对比。
+
+使用方法：
+    python benchmark.py [--filter 子串] [--quick] [--save 结果.json] [--compare 基线.json] [--threshold 0.2]
+"""
+
+import io
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+import statistics
+import threading
+from pathlib import Path
+from md_parser import extract_sections, extract_code_blocks
+
+NOTES_DIR = Path(__file__).parent / "notes"
+RESULT_VERSION = 1
+
+# 合成教程的目标大小（字节）
+SYNTHETIC_SIZES = (2 * 1024 * 1024, 8 * 1024 * 1024)
+# 响应正文的目标大小（字节）
+PAYLOAD_SIZES = (1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+RUN_SNIPPETS = {
+    "empty": "pass",
+    "print_heavy": "for i in range(20000):\n    print(i, 'x' * 20)",
+    "cpu_heavy": "total = 0\nfor i in range(300000):\n    total += i * i % 7\nprint(total)"
+}
+
+
+def _format_size(size):
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}MB"
+    return f"{size // 1024}KB"
+
+
+class Case:
+    """一个基准用例：name为唯一名称，func为被测函数，size为每次处理的字节数（用于计算吞吐量）"""
+
+    def __init__(self, name, func, size=None, setup=None, teardown=None):
+        self.name = name
+        self.func = func
+        self.size = size
+        self.setup = setup
+        self.teardown = teardown
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    测量func单次调用的耗时，返回{"runs", "min_ms", "median_ms", "mean_ms", "stdev_ms"}
+    每轮调用次数按timeit.autorange确定（每轮至少min_time秒），重复repeat轮
+    """
+    func()
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)) + 1)
+    samples = [elapsed / number] + [t / number for t in timer.repeat(repeat - 1, number)]
+    return {
+        "runs": number * repeat,
+        "min_ms": round(min(samples) * 1000, 4),
+        "median_ms": round(statistics.median(samples) * 1000, 4),
+        "mean_ms": round(statistics.mean(samples) * 1000, 4),
+        "stdev_ms": round(statistics.pstdev(samples) * 1000, 4)
+    }
+
+
+def _read_chapters():
+    return [(md_file.stem, md_file.read_text(encoding="utf-8")) for md_file in sorted(NOTES_DIR.glob("*.md"))]
+
+
+def synthetic_chapter(chapters, size):
+    """把全部教程的章节重复拼接成约size字节的单篇教程，章节标题加上序号避免完全相同"""
+    body = "\n".join(text.split("\n", 1)[1] if "\n" in text else "" for _, text in chapters)
+    parts = ["# 合成教程\n"]
+    length = 0
+    copy = 0
+    while length < size:
+        copy += 1
+        part = body.replace("\n## ", f"\n## [{copy}] ")
+        parts.append(part)
+        length += len(part.encode("utf-8"))
+    return "".join(parts)
+
+
+def parser_cases(quick=False):
+    chapters = _read_chapters()
+    cases = []
+    for name, text in chapters:
+        size = len(text.encode("utf-8"))
+        cases.append(Case(f"parser.sections.{name}", lambda text=text: extract_sections(text), size))
+        cases.append(Case(f"parser.code_blocks.{name}", lambda text=text: extract_code_blocks(text), size))
+    for size in SYNTHETIC_SIZES[:1] if quick else SYNTHETIC_SIZES:
+        text = synthetic_chapter(chapters, size)
+        actual = len(text.encode("utf-8"))
+        label = _format_size(size)
+        cases.append(Case(f"parser.sections.synthetic_{label}", lambda text=text: extract_sections(text), actual))
+        cases.append(Case(f"parser.code_blocks.synthetic_{label}", lambda text=text: extract_code_blocks(text),
+                          actual))
+    return cases
+
+
+def run_cases(quick=False):
+    state = {}
+
+    def setup():
+        from executor import ExecutionEngine
+        # 单个工作进程，测的是一次运行的端到端开销而不是并行度
+        state["engine"] = ExecutionEngine(workers=1)
+
+    def teardown():
+        state.pop("engine").shutdown()
+
+    cases = []
+    for name, code in RUN_SNIPPETS.items():
+        cases.append(Case(f"run.{name}", lambda code=code: state["engine"].run(code, use_cache=False)))
+    cases[0].setup = setup
+    cases[-1].teardown = teardown
+    return cases
+
+
+class _NullSink(io.RawIOBase):
+    """丢弃写入数据、只统计字节数的输出流"""
+
+    def __init__(self):
+        self.written = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.written += len(data)
+        return len(data)
+
+
+def _payload(size):
+    """约size字节（UTF-8 JSON）的教程式响应，中英文混合"""
+    section = {
+        "title": "字符串与正则表达式",
+        "content": "Python的字符串是不可变序列 str objects are immutable sequences.\n" * 8,
+        "code_blocks": ["text = 'hello'\nprint(text.upper())\n"]
+    }
+    unit = len(json.dumps(section, ensure_ascii=False).encode("utf-8"))
+    return {"title": "基准测试", "sections": [section] * max(1, size // unit)}
+
+
+def _make_server(framing, use_zlib):
+    """只初始化输出通道的IPCServer，不启动执行引擎和分派器"""
+    from ipc_server import IPCServer
+    server = IPCServer.__new__(IPCServer)
+    server._stdout = io.TextIOWrapper(io.BufferedWriter(_NullSink()), encoding="utf-8")
+    server._write_lock = threading.Lock()
+    server.framing = framing
+    server.use_zlib = use_zlib
+    server.compress_threshold = 64 * 1024
+    return server
+
+
+def send_cases(quick=False):
+    from ipc_protocol import FRAMING_LINE, FRAMING_FRAME
+    modes = (("line", FRAMING_LINE, False), ("frame", FRAMING_FRAME, False), ("frame_zlib", FRAMING_FRAME, True))
+    servers = {}
+
+    def setup():
+        # 导入ipc_server会加载AI等模块，只在确实运行这组用例时导入
+        for mode, framing, use_zlib in modes:
+            servers[mode] = _make_server(framing, use_zlib)
+
+    cases = []
+    for mode, _, _ in modes:
+        for size in PAYLOAD_SIZES[:-1] if quick else PAYLOAD_SIZES:
+            payload = _payload(size)
+            cases.append(Case(
+                f"send.{mode}.{_format_size(size)}",
+                lambda mode=mode, payload=payload: servers[mode]._send_response(payload, "bench"),
+                len(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+            ))
+    cases[0].setup = setup
+    return cases
+
+
+SUITES = {
+    "parser": parser_cases,
+    "run": run_cases,
+    "send": send_cases
+}
+
+
+def run_suite(name_filter=None, quick=False, repeat=None):
+    """运行全部（或名称包含name_filter的）用例，返回结果文档"""
+    repeat = repeat or (3 if quick else 5)
+    min_time = 0.05 if quick else 0.2
+    results = {}
+    for suite, make_cases in SUITES.items():
+        cases = make_cases(quick)
+        selected = [case for case in cases if not name_filter or name_filter in case.name]
+        if not selected:
+            continue
+        setup = next((case.setup for case in cases if case.setup), None)
+        teardown = next((case.teardown for case in cases if case.teardown), None)
+        if setup:
+            setup()
+        try:
+            for case in selected:
+                stats = measure(case.func, repeat, min_time)
+                if case.size:
+                    stats["bytes"] = case.size
+                    stats["mb_per_s"] = round(case.size / (1024 * 1024) / (stats["median_ms"] / 1000), 2)
+                results[case.name] = stats
+                _print_result(case.name, stats)
+        finally:
+            if teardown:
+                teardown()
+    return {
+        "version": RESULT_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results
+    }
+
+
+def _print_result(name, stats):
+    throughput = f"{stats['mb_per_s']:>10.2f} MB/s" if "mb_per_s" in stats else ""
+    print(f"{name:<42} {stats['median_ms']:>12.4f} ms  (min {stats['min_ms']:.4f}, "
+          f"±{stats['stdev_ms']:.4f}, {stats['runs']} 次){throughput}")
+
+
+def compare(current, baseline, threshold=0.2, name_filter=None):
+    """
+    比较两次结果的中位数，返回[(名称, 基线ms, 当前ms, 比值, 状态)]
+    状态为regressed（慢于基线超过threshold）、improved（快于基线超过threshold）、ok、new或missing
+    name_filter与运行时相同，基线中不符合的用例不参与比较
+    """
+    rows = []
+    current_results = current["results"]
+    baseline_results = {name: stats for name, stats in baseline.get("results", {}).items()
+                        if not name_filter or name_filter in name}
+    for name in sorted(set(current_results) | set(baseline_results)):
+        if name not in baseline_results:
+            rows.append((name, None, current_results[name]["median_ms"], None, "new"))
+            continue
+        if name not in current_results:
+            rows.append((name, baseline_results[name]["median_ms"], None, None, "missing"))
+            continue
+        before = baseline_results[name]["median_ms"]
+        after = current_results[name]["median_ms"]
+        ratio = after / before if before else float("inf")
+        if ratio > 1 + threshold:
+            status = "regressed"
+        elif ratio < 1 - threshold:
+            status = "improved"
+        else:
+            status = "ok"
+        rows.append((name, before, after, round(ratio, 3), status))
+    return rows
+
+
+def _print_comparison(rows, current, baseline):
+    if (current["python"], current["platform"]) != (baseline.get("python"), baseline.get("platform")):
+        print(f"注意：基线生成于 Python {baseline.get('python')} / {baseline.get('platform')}，"
+              f"与当前环境不同，结果仅供参考")
+    print(f"{'用例':<42} {'基线ms':>12} {'当前ms':>12} {'比值':>8}  状态")
+    for name, before, after, ratio, status in rows:
+        before = "-" if before is None else f"{before:.4f}"
+        after = "-" if after is None else f"{after:.4f}"
+        ratio = "-" if ratio is None else f"{ratio:.3f}"
+        print(f"{name:<42} {before:>12} {after:>12} {ratio:>8}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析器、执行引擎和IPC序列化的微基准测试")
+    parser.add_argument("--filter", default=None, help="只运行名称包含该子串的用例，例如 parser.sections")
+    parser.add_argument("--quick", action="store_true", help="减少重复次数，跳过最大的合成教程和响应")
+    parser.add_argument("--repeat", type=int, default=None, help="每个用例重复的轮数")
+    parser.add_argument("--save", default=None, help="把结果保存为JSON（可作为基线）")
+    parser.add_argument("--compare", default=None, help="与基线JSON比较，有退化时以状态码1退出")
+    parser.add_argument("--threshold", type=float, default=0.2, help="判定退化或改善的相对变化，默认0.2")
+    args = parser.parse_args()
+
+    current = run_suite(args.filter, args.quick, args.repeat)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.save}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(current, baseline, args.threshold, args.filter)
+        _print_comparison(rows, current, baseline)
+        if any(row[4] == "regressed" for row in rows):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
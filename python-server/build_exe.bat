@@ -12,6 +12,22 @@ if %errorlevel% neq 0 (
     )
 )
 
+:: 预先解析教程并生成索引，随notes目录一起打包
+echo 正在生成教程索引...
+python tutorial_index.py
+if %errorlevel% neq 0 (
+    echo 生成教程索引失败，请检查错误信息。
+    exit /b 1
+)
+
+:: 预先运行教程示例，评估时直接读取示例的运行结果（只重新运行修改过的代码块）
+echo 正在生成示例运行结果...
+python golden_outputs.py
+if %errorlevel% neq 0 (
+    echo 生成示例运行结果失败，请检查错误信息。
+    exit /b 1
+)
+
 :: 使用spec文件打包
 echo 正在打包Python IPC服务器...
 pyinstaller --clean build_exe.spec
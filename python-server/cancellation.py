@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+请求取消与截止时间
+
+每个带requestId的IPC请求在进入分派器之前登记一个CancelToken。
+cancel命令或截止时间（deadline_ms）到期都会触发取消：排队中的请求不再执行，
+正在运行的代码所在的工作进程被结束，等待调度的模型调用离开队列，进行中的流式响应被关闭。
+执行代码和调用模型的函数在发现取消后抛出RequestCancelled，由IPC服务器返回cancelled状态。
+"""
+
+import time
+import threading
+
+REASON_CANCELLED = "cancelled"
+REASON_TIMEOUT = "timeout"
+
+
+class RequestCancelled(Exception):
+    """请求已被取消或超过截止时间"""
+
+    def __init__(self, reason=REASON_CANCELLED):
+        super().__init__("请求已取消" if reason == REASON_CANCELLED else "请求已超过截止时间")
+        self.reason = reason
+
+
+class CancelToken:
+    """一个请求的取消状态"""
+
+    def __init__(self, deadline_ms=None):
+        self.deadline = time.monotonic() + deadline_ms / 1000 if deadline_ms else None
+        self.reason = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self._timer = None
+        if self.deadline is not None:
+            # 截止时间到达时主动取消，阻塞在网络读取中的流式响应也能被关闭
+            self._timer = threading.Timer(self.remaining(), self.cancel, (REASON_TIMEOUT,))
+            self._timer.daemon = True
+            self._timer.start()
+
+    def cancel(self, reason=REASON_CANCELLED):
+        """取消请求并执行登记的回调，重复调用无效"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if self._timer is not None:
+            self._timer.cancel()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(REASON_TIMEOUT)
+        return self._event.is_set()
+
+    def remaining(self):
+        """距截止时间的秒数，没有截止时间时返回None"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """已取消时抛出RequestCancelled"""
+        if self.cancelled:
+            raise RequestCancelled(self.reason)
+
+    def wait(self, timeout):
+        """等待最多timeout秒，期间被取消时提前返回True"""
+        return self._event.wait(timeout) or self.cancelled
+
+    def on_cancel(self, callback):
+        """
+        登记取消时执行的回调（在调用cancel的线程中执行），已取消时立即执行
+        返回注销回调的函数
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._remove(callback)
+        callback()
+        return lambda: None
+
+    def _remove(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def release(self):
+        """请求结束，停止截止时间计时"""
+        if self._timer is not None:
+            self._timer.cancel()
+        with self._lock:
+            self._callbacks = []
+
+
+class CancelRegistry:
+    """requestId -> CancelToken"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def register(self, request_id, deadline_ms=None):
+        token = CancelToken(deadline_ms)
+        with self._lock:
+            self._tokens[request_id] = token
+        return token
+
+    def get(self, request_id):
+        with self._lock:
+            return self._tokens.get(request_id)
+
+    def cancel(self, request_id):
+        """取消请求，请求不存在（已完成）时返回False"""
+        token = self.get(request_id)
+        if token is None:
+            return False
+        token.cancel(REASON_CANCELLED)
+        return True
+
+    def release(self, request_id):
+        with self._lock:
+            token = self._tokens.pop(request_id, None)
+        if token is not None:
+            token.release()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._tokens)
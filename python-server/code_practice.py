@@ -11,11 +11,12 @@ Python代码跟练系统
 """
 
 import sys
-import os
 import re
-import traceback
 from pathlib import Path
-from ai_helper import AITutor
+from ai_helper import get_ai_tutor
+from md_parser import extract_sections
+from limits import resolve_limits, run_governed
+from grader import grade, namespace_result, TIER_LLM
 # 教程映射表
 TUTORIALS = {
     "演练广场": "chapter00.md",
@@ -67,57 +68,20 @@ def print_usage():
     print("  python code_practice.py basic  # 学习基础语法")
 
 
-def extract_code_blocks(md_content):
-    """从Markdown内容中提取Python代码块"""
-    pattern = r'```python\n(.+?)\n```'
-    return re.findall(pattern, md_content, re.DOTALL)
-
-
-def extract_sections(md_content):
-    """从Markdown内容中提取章节"""
-    sections = []
-    current_section = {"title": "", "content": "", "code_blocks": []}
-
-    lines = md_content.split('\n')
-    for line in lines:
-        if line.startswith('## '):
-            if current_section["title"]:
-                sections.append(current_section)
-            current_section = {"title": line[3:], "content": line + '\n', "code_blocks": []}
-        elif line.startswith('### '):
-            current_section["content"] += line + '\n'
-        else:
-            current_section["content"] += line + '\n'
-
-    if current_section["title"]:
-        sections.append(current_section)
-
-    # 提取每个章节中的代码块
-    for section in sections:
-        section["code_blocks"] = extract_code_blocks(section["content"])
-
-    return sections
-
-
 def run_code(code):
     """运行用户输入的代码并捕获输出和错误"""
     # 创建一个临时的本地命名空间
     local_vars = {}
+    # 按server.ini中的限制运行，防止死循环或大量输出卡住终端
+    result = run_governed(code, globals(), local_vars, resolve_limits("code_practice"))
+    return result["success"], result["output"], local_vars
 
-    try:
-        # 重定向标准输出以捕获print输出
-        import io
-        from contextlib import redirect_stdout
 
-        f = io.StringIO()
-        with redirect_stdout(f):
-            exec(code, globals(), local_vars)
-
-        output = f.getvalue()
-        return True, output, local_vars
-    except Exception as e:
-        error_msg = traceback.format_exc()
-        return False, error_msg, local_vars
+def _run_for_grading(code):
+    """运行示例代码，返回带变量摘要的结果供本地评估比较"""
+    local_vars = {}
+    result = run_governed(code, globals(), local_vars, resolve_limits("code_practice"))
+    return namespace_result(result, local_vars)
 
 
 def evaluate_code(expected_code, user_code, expected_output=None):
@@ -137,18 +101,18 @@ def evaluate_code(expected_code, user_code, expected_output=None):
         print_colored(f"实际输出:\n{user_output}", "RED")
         # 即使输出不匹配，也交给AI进行最终判断
 
-    # 使用AI评估代码
-    try:
-        ai_tutor = AITutor()
-        ai_result = ai_tutor.evaluate_code(expected_code, user_code, user_output)
-
-        if ai_result:
-            return True
-        else:
-            print_colored("AI评估结果: 代码功能实现不正确", "YELLOW")
-            return False
-    except Exception as e:
-        print_colored(f"AI评估失败，回退到传统评估方式: {str(e)}", "YELLOW")
+    # 先在本地判断，无法确认时再使用AI评估代码
+    user_result = namespace_result({"success": success, "output": user_output}, user_vars)
+    verdict = grade(expected_code, user_code, user_result, _run_for_grading, get_ai_tutor)
+    if verdict["passed"]:
+        if verdict["tier"] != TIER_LLM:
+            print_colored(f"本地评估: {verdict['reason']}", "BLUE")
+        return True
+    elif verdict["passed"] is False:
+        print_colored("AI评估结果: 代码功能实现不正确", "YELLOW")
+        return False
+    else:
+        print_colored(f"AI评估失败，回退到传统评估方式: {verdict['error']}", "YELLOW")
 
         # 回退到传统评估方式
         # 检查关键变量
@@ -178,7 +142,7 @@ def practice_code_block(code_block, block_index, section_blocks=None, current_bl
     print(code_block)
     # 初始化AI助手
     try:
-        ai_tutor = AITutor()
+        ai_tutor = get_ai_tutor()
     except Exception as e:
         print_colored(f"AI功能初始化失败: {str(e)}", "RED")
         ai_tutor = None
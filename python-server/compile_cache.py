@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户代码的编译缓存
+
+以源码哈希为键缓存编译后的代码对象：内存中按LRU保留最近使用的条目，
+同时用marshal写入缓存目录，供其他工作进程和下次启动复用。
+哈希中包含解释器的字节码魔数，升级Python后旧缓存自然失效。
+启动时在后台预编译notes目录中所有python代码块，教程自带的示例首次运行也能命中缓存。
+"""
+
+import os
+import time
+import marshal
+import hashlib
+import threading
+import importlib.util
+from pathlib import Path
+from collections import OrderedDict
+from md_parser import parse_document
+from config_loader import get_server_option, get_cache_dir
+
+# 编译时使用的文件名，与直接exec字符串时的回溯信息保持一致
+SOURCE_FILENAME = "<string>"
+
+# 命中来源
+HIT_MEMORY = "memory"
+HIT_DISK = "disk"
+HIT_MISS = "miss"
+
+NOTES_DIR = Path(__file__).parent / "notes"
+
+
+def normalize_source(source):
+    """统一换行符并去掉末尾空白，这些差异不影响编译结果"""
+    return source.replace("\r\n", "\n").rstrip() + "\n"
+
+
+def source_key(source):
+    """规范化源码的缓存键"""
+    digest = hashlib.sha1(importlib.util.MAGIC_NUMBER)
+    digest.update(normalize_source(source).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+class CompileCache:
+    """内存LRU + 磁盘marshal文件的两级编译缓存"""
+
+    def __init__(self, max_entries=None, cache_dir=None):
+        if max_entries is None:
+            max_entries = get_server_option("compile_cache", "max_entries", 256)
+        self.max_entries = max(1, max_entries)
+        self.cache_dir = Path(cache_dir or Path(get_cache_dir()) / "bytecode")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            self._disk = True
+        except OSError:
+            # 缓存目录不可写时只使用内存缓存
+            self._disk = False
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {HIT_MEMORY: 0, HIT_DISK: 0, HIT_MISS: 0}
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}.bin"
+
+    def compile(self, source):
+        """
+        返回(代码对象, 编译耗时毫秒, 命中来源)
+        语法错误照常抛出SyntaxError，不会被缓存
+        """
+        start = time.perf_counter()
+        key = source_key(source)
+        with self._lock:
+            code = self._entries.get(key)
+            if code is not None:
+                self._entries.move_to_end(key)
+                self.hits[HIT_MEMORY] += 1
+                return code, round((time.perf_counter() - start) * 1000, 3), HIT_MEMORY
+
+        hit = HIT_DISK
+        code = self._load(key)
+        if code is None:
+            hit = HIT_MISS
+            code = compile(normalize_source(source), SOURCE_FILENAME, "exec", dont_inherit=True)
+            self._store(key, code)
+
+        with self._lock:
+            self._entries[key] = code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.hits[hit] += 1
+        return code, round((time.perf_counter() - start) * 1000, 3), hit
+
+    def _load(self, key):
+        if not self._disk:
+            return None
+        try:
+            with open(self._path(key), "rb") as f:
+                return marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def _store(self, key, code):
+        if not self._disk:
+            return
+        path = self._path(key)
+        # 多个工作进程可能同时写入同一个键，临时文件名需要区分进程和线程
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                marshal.dump(code, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def contains(self, source):
+        """源码是否已在内存或磁盘缓存中"""
+        key = source_key(source)
+        with self._lock:
+            if key in self._entries:
+                return True
+        return self._disk and self._path(key).exists()
+
+    def prune(self, max_disk_entries=None):
+        """磁盘条目超过上限时删除最久未修改的文件，返回删除的数量"""
+        if not self._disk:
+            return 0
+        if max_disk_entries is None:
+            max_disk_entries = get_server_option("compile_cache", "max_disk_entries", 5000)
+        try:
+            files = sorted(self.cache_dir.glob("*.bin"), key=lambda p: p.stat().st_mtime)
+        except OSError:
+            return 0
+        removed = 0
+        for path in files[:max(0, len(files) - max_disk_entries)]:
+            try:
+                path.unlink()
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def stats(self):
+        """返回缓存状态"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk": self._disk,
+                "hits": dict(self.hits)
+            }
+
+
+def precompile_notes(cache=None, notes_dir=NOTES_DIR):
+    """
+    预编译notes目录中的全部python代码块，已缓存的跳过
+    返回{"blocks", "compiled", "errors", "elapsed_ms"}
+    """
+    cache = cache or get_compile_cache()
+    start = time.perf_counter()
+    blocks = compiled = errors = 0
+    for md_file in sorted(Path(notes_dir).glob("*.md")):
+        document = parse_document(md_file.read_text(encoding="utf-8"))
+        for section in document.sections:
+            for block in section.blocks:
+                if block.lang != "python":
+                    continue
+                blocks += 1
+                if cache.contains(block.text):
+                    continue
+                try:
+                    cache.compile(block.text)
+                    compiled += 1
+                except (SyntaxError, ValueError):
+                    # 教程中有故意写错的示例
+                    errors += 1
+    cache.prune()
+    return {
+        "blocks": blocks,
+        "compiled": compiled,
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2)
+    }
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_compile_cache():
+    """返回进程内共享的编译缓存"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = CompileCache()
+        return _shared_cache
@@ -1,31 +1,97 @@
 from configparser import ConfigParser
 import os
+import threading
 
-def load_config():
-    """加载配置文件"""
-    config = ConfigParser()
+
+_model_config = None
+_model_config_signature = None
+_model_config_lock = threading.Lock()
+
+
+def get_model_config():
+    """
+    返回模型配置快照{"model_name", "api_key", "base_url"}
+    config.ini的修改时间和大小不变时直接返回上次读取的结果，文件被修改（例如保存了新密钥）后自动重新读取
+    """
+    global _model_config, _model_config_signature
     config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    try:
+        stat = os.stat(config_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        signature = None
 
-    if not os.path.exists(config_path):
-        raise FileNotFoundError("配置文件 config.ini 未找到")
+    with _model_config_lock:
+        if _model_config is not None and signature == _model_config_signature:
+            return _model_config
+
+        config = ConfigParser()
+        if signature is not None:
+            config.read(config_path)
+        model_name = config.sections()[0] if config.sections() else "deepseek-chat"
+        base_url = config.get(model_name, 'base_url', fallback=None)
+        if not base_url or base_url == 'your_base_url':
+            base_url = "https://api.deepseek.com"
+        _model_config = {
+            "model_name": model_name,
+            "api_key": config.get(model_name, 'api_key', fallback=None),
+            "base_url": base_url
+        }
+        _model_config_signature = signature
+        return _model_config
 
-    config.read(config_path)
-    return config
 
-def get_api_key():
-    """获取DeepSeek API密钥"""
-    config = load_config()
-    model_name = config.sections()[0] if config.sections() else "deepseek-chat"
-    return config.get(model_name, 'api_key')
+_server_config = None
+_server_config_signature = None
+_server_config_lock = threading.Lock()
 
-def get_base_url():
-    """获取DeepSeek API密钥"""
-    config = load_config()
-    model_name = config.sections()[0] if config.sections() else "deepseek-chat"
+
+def load_server_config():
+    """
+    加载服务端运行参数（server.ini，可选，不存在时全部使用默认值）
+    与get_model_config一样按修改时间和大小缓存解析结果，文件被修改后自动重新读取；
+    返回值为共享对象，调用方不要修改
+    """
+    global _server_config, _server_config_signature
+    config_path = os.path.join(os.path.dirname(__file__), 'server.ini')
     try:
-        base_url = config.get(model_name, 'base_url')
-        if not base_url or base_url == 'your_base_url':
-            return "https://api.deepseek.com"
-        return base_url
-    except:
-        return "https://api.deepseek.com"
+        stat = os.stat(config_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        signature = None
+
+    with _server_config_lock:
+        if _server_config is not None and signature == _server_config_signature:
+            return _server_config
+
+        config = ConfigParser()
+        if signature is not None:
+            config.read(config_path, encoding='utf-8')
+        _server_config = config
+        _server_config_signature = signature
+        return _server_config
+
+
+def get_server_option(section, option, default):
+    """读取服务端运行参数，按默认值的类型进行转换"""
+    config = load_server_config()
+    if not config.has_option(section, option):
+        return default
+    try:
+        if isinstance(default, bool):
+            return config.getboolean(section, option)
+        if isinstance(default, int):
+            return config.getint(section, option)
+        if isinstance(default, float):
+            return config.getfloat(section, option)
+        return config.get(section, option)
+    except ValueError:
+        return default
+
+
+def get_cache_dir():
+    """返回可写的缓存目录（索引、编译缓存等），不存在时自动创建"""
+    default = os.path.join(os.path.expanduser('~'), '.python-track')
+    cache_dir = get_server_option('paths', 'cache_dir', default) or default
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IPC命令并发分派器
+
+按命令类别（AI调用 / 代码执行 / 元数据）把请求分派到独立的线程池，
+慢速的模型调用不会再阻塞教程读取和代码运行。响应通过requestId与请求对应，
+因此可以乱序返回。
+处理中的请求达到上限后，新请求按到达顺序排队，提交本身不阻塞，监听线程可以继续读取取消命令。
+"""
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from config_loader import get_server_option
+
+# 命令类别
+POOL_AI = "ai"
+POOL_EXEC = "exec"
+POOL_META = "meta"
+
+# 命令到类别的映射，未列出的命令归入元数据类
+COMMAND_POOLS = {
+    "get_hint": POOL_AI,
+    "get_solution": POOL_AI,
+    "test": POOL_AI,
+    # 批量评估在自己的线程池中并发运行和调用AI，这里只占用一个线程等待汇总
+    "batch_evaluate": POOL_AI,
+    "run_code": POOL_EXEC,
+    "run_code_simple": POOL_EXEC,
+    "inspect_var": POOL_EXEC,
+    "get_tutorials": POOL_META,
+    "get_tutorial": POOL_META,
+    "get_tutorial_outline": POOL_META,
+    "get_section": POOL_META,
+    "prefetch_sections": POOL_META,
+    "search_tutorials": POOL_META,
+    "model_key": POOL_META,
+    "ai_status": POOL_META,
+}
+
+
+def classify_command(command, payload):
+    """确定命令应进入的线程池"""
+    # 带预期代码的run_code在运行后还要等待AI评估，按AI类处理
+    if command == "run_code" and payload.get("expected_code"):
+        return POOL_AI
+    return COMMAND_POOLS.get(command, POOL_META)
+
+
+class CommandDispatcher:
+    """按类别使用独立线程池处理命令，并限制同时处理中的请求数"""
+
+    def __init__(self, handler, max_in_flight=None, pool_sizes=None):
+        """
+        handler: 处理单条消息的函数，接收解析后的消息字典
+        max_in_flight: 同时处理中的请求上限，达到上限后提交的请求排队等待
+        pool_sizes: {类别: 线程数}，未提供时读取server.ini
+        """
+        self.handler = handler
+        if max_in_flight is None:
+            max_in_flight = get_server_option("dispatcher", "max_in_flight", 32)
+        self.max_in_flight = max(1, max_in_flight)
+
+        sizes = {
+            POOL_AI: get_server_option("dispatcher", "ai_workers", 4),
+            # 代码在执行引擎的工作进程中运行，这里的线程只负责等待结果
+            POOL_EXEC: get_server_option("dispatcher", "exec_workers", 4),
+            POOL_META: get_server_option("dispatcher", "meta_workers", 2),
+        }
+        if pool_sizes:
+            sizes.update(pool_sizes)
+
+        self.pools = {
+            name: ThreadPoolExecutor(max_workers=max(1, size), thread_name_prefix=f"ipc-{name}")
+            for name, size in sizes.items()
+        }
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        # 等待空位的消息，按到达顺序处理
+        self._backlog = deque()
+
+    @property
+    def in_flight(self):
+        """当前处理中的请求数"""
+        with self._lock:
+            return self._in_flight
+
+    @property
+    def queued(self):
+        """等待空位的请求数"""
+        with self._lock:
+            return len(self._backlog)
+
+    def submit(self, data):
+        """提交一条消息，不阻塞；处理中的请求已满时排队，有请求完成后再交给线程池"""
+        with self._lock:
+            if self._in_flight >= self.max_in_flight:
+                self._backlog.append(data)
+                return
+            self._in_flight += 1
+        try:
+            self._start(data)
+        except RuntimeError:
+            # 线程池已关闭
+            self._release()
+            raise
+
+    def withdraw(self, request_id):
+        """从队列中移除requestId对应的消息并返回，消息已开始处理或不存在时返回None"""
+        with self._lock:
+            for data in self._backlog:
+                if data.get("requestId") == request_id:
+                    self._backlog.remove(data)
+                    return data
+        return None
+
+    def _start(self, data):
+        payload = data.get("payload") or {}
+        pool_name = classify_command(data.get("command"), payload)
+        self.pools[pool_name].submit(self._run, data)
+
+    def _run(self, data):
+        try:
+            self.handler(data)
+        finally:
+            self._release()
+
+    def _release(self):
+        """归还一个名额，队列中有消息时把名额直接交给队首的消息"""
+        while True:
+            with self._lock:
+                if not self._backlog:
+                    self._in_flight -= 1
+                    return
+                data = self._backlog.popleft()
+            try:
+                self._start(data)
+                return
+            except RuntimeError:
+                # 线程池已关闭，丢弃排队的消息
+                continue
+
+    def shutdown(self, wait=False):
+        """关闭所有线程池，丢弃排队中的消息"""
+        with self._lock:
+            self._backlog.clear()
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait, cancel_futures=not wait)
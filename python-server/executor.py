@@ -0,0 +1,420 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户代码执行引擎
+
+预先启动一组已导入常用模块的工作进程，run_code通过管道把代码交给空闲的工作进程执行并取回结果。
+用户代码不再运行在IPC服务器进程内：死循环、崩溃或大量内存分配只影响单个工作进程，
+异常退出或达到运行次数上限的工作进程会在后台被替换。
+每次运行都受limits.py中的资源限制约束；工作进程在超时后仍未返回时会被强制结束。
+
+运行结束后工作进程保留最近几次的命名空间，结果中只带变量摘要和快照句柄，
+inspect_var通过句柄回到同一个工作进程中展开变量。
+
+管道上的消息：
+    主进程 -> 工作进程  ("run", 代码, 限制, 流式选项或None)
+                       | ("inspect", 快照编号, 变量名, 路径, 起始序号, 数量) | ("stop",)
+    工作进程 -> 主进程  ("output", 流名称, 文本) | ("result", 结果) | ("inspect", 展开结果或{"error"})
+"""
+
+import io
+import os
+import sys
+import time
+import queue
+import itertools
+import threading
+import multiprocessing
+from config_loader import get_server_option
+from limits import resolve_limits, run_governed, format_limit_message, LIMIT_TIMEOUT, STREAM_STDOUT, STREAM_STDERR
+from result_cache import ResultCache
+from inspector import SnapshotStore, summarize_namespace, inspect_value
+from cancellation import RequestCancelled
+
+DEFAULT_PRELOAD = "math,random,json,re,collections,itertools,functools,datetime,string,time"
+
+# 工作进程自身的超时中断失效时（例如卡在不可中断的调用中），额外等待的秒数
+KILL_GRACE_SECONDS = 2.0
+# 等待工作进程时检查请求是否被取消的间隔
+CANCEL_POLL_SECONDS = 0.05
+
+
+def _isolate_stdio():
+    """工作进程继承了IPC通道的标准输入输出，先把它们指向空设备，防止用户代码读写IPC通道"""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1):
+        try:
+            os.dup2(devnull, fd)
+        except OSError:
+            pass
+    sys.stdin = io.StringIO("")
+    sys.stdout = io.StringIO()
+
+
+def execute_code(code, limits, on_output=None):
+    """
+    在当前进程中按限制运行代码
+    返回(结果, 命名空间)，结果为{"success", "output", "stderr", "limit", "usage", "vars"}
+    """
+    namespace = {}
+    result = run_governed(code, namespace, namespace, limits, on_output)
+    # 运行失败时同样返回已经定义的变量，便于查找出错原因
+    result["vars"] = summarize_namespace(namespace)
+    return result, namespace
+
+
+class _OutputStreamer:
+    """
+    把程序输出按大小和时间批量发送给主进程
+    写入只追加到缓冲区，由后台线程负责发送：超时中断到达时主线程不会停在半条消息上。
+    距上次发送已超过interval的输出立即发送，因此首批输出几乎没有延迟；
+    之后的输出每interval最多发送一批，或在积攒到batch_chars个字符时提前发送。
+    """
+
+    def __init__(self, conn, batch_chars, interval):
+        self.conn = conn
+        self.batch_chars = batch_chars
+        self.interval = interval
+        self._pending = []  # [(流名称, 文本)]，相邻的同名流合并
+        self._pending_chars = 0
+        self._last_flush = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, stream, text):
+        with self._cond:
+            was_empty = not self._pending
+            if self._pending and self._pending[-1][0] == stream:
+                self._pending[-1] = (stream, self._pending[-1][1] + text)
+            else:
+                self._pending.append((stream, text))
+            self._pending_chars += len(text)
+            if was_empty or self._pending_chars >= self.batch_chars:
+                self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._pending and not self._closed and self._pending_chars < self.batch_chars:
+                    # 积攒一个周期内的输出，减少消息数量
+                    self._cond.wait(max(0.0, self._last_flush + self.interval - time.monotonic()))
+                batch = self._pending
+                self._pending = []
+                self._pending_chars = 0
+                self._last_flush = time.monotonic()
+                closed = self._closed
+            for stream, text in batch:
+                self.conn.send(("output", stream, text))
+            if closed:
+                break
+
+    def close(self):
+        """发送剩余的输出并结束发送线程"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+
+
+def _worker_main(conn, preload):
+    """工作进程入口：预导入模块后循环接收代码并返回结果"""
+    _isolate_stdio()
+    for name in preload:
+        try:
+            __import__(name)
+        except ImportError:
+            pass
+
+    snapshots = SnapshotStore()
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            break
+        if message[0] == "stop":
+            break
+        if message[0] == "inspect":
+            _, snapshot_id, name, path, offset, limit = message
+            try:
+                reply = inspect_value(snapshots.get(snapshot_id), name, path, offset, limit)
+            except (LookupError, TypeError) as e:
+                reply = {"error": str(e).strip("'\"")}
+            conn.send(("inspect", reply))
+            continue
+
+        _, code, limits, stream_options = message
+        streamer = _OutputStreamer(conn, **stream_options) if stream_options else None
+        try:
+            result, namespace = execute_code(code, limits, streamer.write if streamer else None)
+            result["snapshot_id"] = snapshots.add(namespace)
+            del namespace
+        except KeyboardInterrupt:
+            # 超时中断在结果生成之后才到达
+            result = {"success": False, "output": "", "stderr": "", "limit": LIMIT_TIMEOUT, "usage": None,
+                      "vars": None, "snapshot_id": None}
+        if streamer is not None:
+            streamer.close()
+        conn.send(("result", result))
+
+
+class _Worker:
+    """一个工作进程及其管道"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, ctx, preload):
+        self.id = next(self._ids)
+        # 运行和展开变量都需要独占管道
+        self.lock = threading.Lock()
+        self.closed = False
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, preload), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.runs = 0
+
+    def stop(self, timeout=1.0):
+        """请求退出，超时后强制结束"""
+        self.closed = True
+        try:
+            self.conn.send(("stop",))
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout if self.process.is_alive() else 0)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class ExecutionEngine:
+    """预启动的工作进程池"""
+
+    def __init__(self, workers=None, max_runs=None, preload=None):
+        if workers is None:
+            workers = get_server_option("executor", "workers", 0)
+        if workers <= 0:
+            workers = min(4, os.cpu_count() or 1)
+        if max_runs is None:
+            max_runs = get_server_option("executor", "max_runs_per_worker", 50)
+        if preload is None:
+            preload = get_server_option("executor", "preload_modules", DEFAULT_PRELOAD)
+        self.workers = workers
+        self.max_runs = max(1, max_runs)
+        self.stream_options = {
+            "batch_chars": max(1, get_server_option("streaming", "batch_chars", 4096)),
+            "interval": max(0, get_server_option("streaming", "interval_ms", 30)) / 1000
+        }
+        self.preload = [name.strip() for name in preload.split(",") if name.strip()]
+
+        # spawn在各平台行为一致，也避免在多线程进程中fork
+        self._ctx = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self.replaced = 0
+        self.result_cache = ResultCache()
+        self.inspect_timeout = get_server_option("inspector", "timeout", 5.0)
+        # 工作进程编号 -> 工作进程，用于按快照句柄找回进程
+        self._workers = {}
+        for _ in range(self.workers):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.preload)
+        with self._lock:
+            self._workers[worker.id] = worker
+        return worker
+
+    def run(self, code, limits=None, on_output=None, use_cache=True, cancel=None):
+        """
+        在空闲的工作进程中按限制运行代码，没有空闲进程时等待
+        提供on_output(stream, text)时，程序输出会在运行过程中分批回调
+        确定性代码的结果会被缓存，use_cache为False时总是重新运行
+        cancel为CancelToken时，等待或运行期间被取消会结束工作进程并抛出RequestCancelled
+        """
+        if limits is None:
+            limits = resolve_limits()
+        if not use_cache:
+            self.result_cache.record_bypass()
+            return self._run_in_worker(code, limits, on_output, cancel)
+
+        key = self.result_cache.key_for(code, limits)
+        if key is None:
+            return self._run_in_worker(code, limits, on_output, cancel)
+        result = self.result_cache.get(key)
+        if result is not None:
+            if on_output is not None:
+                # 缓存结果一次性回放：成功时输出全部来自stdout，失败时输出包含异常信息
+                if result["output"]:
+                    on_output(STREAM_STDOUT if result["success"] else STREAM_STDERR, result["output"])
+                if result["stderr"] and result["success"]:
+                    on_output(STREAM_STDERR, result["stderr"])
+            return result
+        result = self._run_in_worker(code, limits, on_output, cancel)
+        # 快照只属于这一次运行，缓存的结果不带句柄
+        self.result_cache.put(key, dict(result, vars_handle=None))
+        return result
+
+    def _acquire_worker(self, cancel):
+        """取得空闲的工作进程，等待期间被取消时抛出RequestCancelled"""
+        if cancel is None:
+            return self._idle.get()
+        while True:
+            cancel.check()
+            try:
+                return self._idle.get(timeout=CANCEL_POLL_SECONDS)
+            except queue.Empty:
+                pass
+
+    def _run_in_worker(self, code, limits, on_output, cancel=None):
+        worker = self._acquire_worker(cancel)
+        with worker.lock:
+            result, healthy = self._converse(worker, code, limits, on_output, cancel)
+        if not healthy:
+            return result
+        snapshot_id = result.pop("snapshot_id", None)
+        result["vars_handle"] = f"{worker.id}-{snapshot_id}" if snapshot_id else None
+
+        worker.runs += 1
+        if worker.runs >= self.max_runs:
+            # 定期回收，清除用户代码对模块状态的修改
+            self._replace(worker)
+        else:
+            self._idle.put(worker)
+        return result
+
+    def _converse(self, worker, code, limits, on_output, cancel=None):
+        """
+        把代码发给工作进程并等待结果，返回(结果, 进程是否可继续使用)
+        进程超时或崩溃时替换进程并返回说明结果；请求被取消时立即结束进程并抛出RequestCancelled
+        """
+        try:
+            worker.conn.send(("run", code, limits, self.stream_options if on_output else None))
+            deadline = time.monotonic() + limits["timeout"] + KILL_GRACE_SECONDS if limits["timeout"] else None
+            while True:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                if cancel is not None:
+                    if cancel.cancelled:
+                        self._replace(worker, kill=True)
+                        raise RequestCancelled(cancel.reason)
+                    if remaining is None or remaining > CANCEL_POLL_SECONDS:
+                        if not worker.conn.poll(CANCEL_POLL_SECONDS):
+                            continue
+                        remaining = 0.0
+                if not worker.conn.poll(remaining):
+                    # 工作进程没有响应自身的超时中断，强制结束
+                    self._replace(worker)
+                    return {
+                        "success": False,
+                        "output": f"[{format_limit_message(LIMIT_TIMEOUT, limits)}]\n",
+                        "stderr": "",
+                        "limit": LIMIT_TIMEOUT,
+                        "usage": None,
+                        "vars": None,
+                        "vars_handle": None
+                    }, False
+                message = worker.conn.recv()
+                if message[0] == "result":
+                    return message[1], True
+                if on_output is not None:
+                    on_output(message[1], message[2])
+        except (EOFError, OSError):
+            self._replace(worker)
+            return {
+                "success": False,
+                "output": "代码执行进程异常退出（可能是内存不足或解释器崩溃）",
+                "stderr": "",
+                "limit": None,
+                "usage": None,
+                "vars": None,
+                "vars_handle": None
+            }, False
+
+    def inspect(self, handle, name, path=None, offset=0, limit=None):
+        """
+        展开快照中的变量，返回inspector.inspect_value的结果
+        句柄失效、变量名或路径无效时抛出LookupError
+        """
+        try:
+            worker_id, snapshot_id = (int(part) for part in str(handle).split("-"))
+        except ValueError:
+            raise LookupError(f"无效的变量快照句柄: {handle}")
+        with self._lock:
+            worker = self._workers.get(worker_id)
+        if worker is None:
+            raise LookupError("变量快照已失效，请重新运行代码")
+
+        with worker.lock:
+            if worker.closed:
+                raise LookupError("变量快照已失效，请重新运行代码")
+            try:
+                worker.conn.send(("inspect", snapshot_id, name, list(path or []), offset, limit))
+                if not worker.conn.poll(self.inspect_timeout):
+                    # 自定义__repr__等卡住了工作进程
+                    self._replace(worker)
+                    raise LookupError("展开变量超时，变量快照已失效")
+                reply = worker.conn.recv()[1]
+            except (EOFError, OSError):
+                self._replace(worker)
+                raise LookupError("变量快照已失效，请重新运行代码")
+        if "error" in reply:
+            raise LookupError(reply["error"])
+        return reply
+
+    def _replace(self, worker, kill=False):
+        """
+        在后台结束旧进程并启动新进程，调用方无需等待
+        kill为真时不等待进程自行退出（用于取消仍在运行的代码）
+        """
+        with self._lock:
+            self._workers.pop(worker.id, None)
+
+        def replace():
+            # 等待正在进行的变量展开结束
+            with worker.lock:
+                worker.stop(timeout=0 if kill else 1.0)
+            with self._lock:
+                if self._closed:
+                    return
+                self.replaced += 1
+            self._idle.put(self._spawn())
+        threading.Thread(target=replace, daemon=True).start()
+
+    def stats(self):
+        """返回进程池状态"""
+        return {
+            "workers": self.workers,
+            "idle": self._idle.qsize(),
+            "max_runs": self.max_runs,
+            "replaced": self.replaced,
+            "result_cache": self.result_cache.stats()
+        }
+
+    def shutdown(self):
+        """结束所有空闲的工作进程"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+
+_shared_engine = None
+_shared_lock = threading.Lock()
+
+
+def get_execution_engine():
+    """返回进程内共享的执行引擎，首次调用时启动工作进程"""
+    global _shared_engine
+    with _shared_lock:
+        if _shared_engine is None:
+            _shared_engine = ExecutionEngine()
+        return _shared_engine
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地的OpenAI兼容模型服务（只用于压测和离线调试）
+
+实现 POST /chat/completions（也接受 /v1/chat/completions），支持stream与stream_options.include_usage，
+HEAD/GET 任意路径返回200，供AI健康检查探测。回复内容由请求内容和随机种子决定，同样的请求得到同样的回复。
+可配置：
+    latency_ms       收到请求到返回第一个token（或完整回复）的延迟
+    token_delay_ms   流式回复中相邻片段的间隔
+    reply_tokens     每次回复的片段数
+    error_rate       返回500的比例
+    rate_limit_rate  返回429（带Retry-After）的比例
+    jitter           延迟的随机浮动比例，例如0.2表示±20%
+把config.ini中模型的base_url设为本服务的地址（例如 http://127.0.0.1:8765/v1），AITutor即可连接本服务。
+
+使用方法：
+    python fake_model_server.py [--port 8765] [--latency-ms 300] [--token-delay-ms 20] [--reply-tokens 40]
+                                [--error-rate 0] [--rate-limit-rate 0] [--jitter 0] [--seed 0]
+"""
+
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 回复由这些片段组成，按请求内容选择
+_WORDS = ["检查", "循环", "的", "边界", "条件", "，", "变量", "是否", "已经", "初始化", "。", "注意", "缩进",
+          "和", "返回值", "print", "(", ")", "列表", "索引", "从0开始", "range", "参数", "字符串"]
+
+
+class FakeModelServer:
+    """在后台线程中运行的模型服务"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=300, token_delay_ms=20, reply_tokens=40,
+                 error_rate=0.0, rate_limit_rate=0.0, jitter=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.token_delay_ms = token_delay_ms
+        self.reply_tokens = max(1, reply_tokens)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "streamed": 0, "errors": 0, "rate_limited": 0, "probes": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _draw(self):
+        """返回本次请求注入的错误：None、"error"或"rate_limit"；同一种子下的序列固定"""
+        with self._lock:
+            value = self._random.random()
+        if value < self.error_rate:
+            return "error"
+        if value < self.error_rate + self.rate_limit_rate:
+            return "rate_limit"
+        return None
+
+    def _delay(self, milliseconds):
+        if milliseconds <= 0:
+            return
+        if self.jitter:
+            with self._lock:
+                milliseconds *= 1 + self._random.uniform(-self.jitter, self.jitter)
+        time.sleep(milliseconds / 1000)
+
+    def reply_parts(self, request):
+        """按请求内容确定的回复片段"""
+        digest = hashlib.sha256(json.dumps(request.get("messages"), sort_keys=True).encode("utf-8")).digest()
+        words = random.Random(digest).choices(_WORDS, k=self.reply_tokens)
+        return [word if index % 2 else word + " " for index, word in enumerate(words)]
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                server._count("probes")
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_GET(self):
+                self.do_HEAD()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                try:
+                    request = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    request = {}
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "not_found"}})
+                    return
+                server._count("requests")
+                injected = server._draw()
+                if injected == "error":
+                    server._count("errors")
+                    server._delay(server.latency_ms)
+                    self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+                    return
+                if injected == "rate_limit":
+                    server._count("rate_limited")
+                    self._send_json(429, {"error": {"message": "Injected rate limit", "type": "rate_limit"}},
+                                    {"Retry-After": "0.1"})
+                    return
+                if request.get("stream"):
+                    server._count("streamed")
+                    self._stream(request)
+                else:
+                    self._complete(request)
+
+            def _send_json(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _usage(self, request, parts):
+                prompt_tokens = sum(len(str(message.get("content", ""))) for message in request.get("messages") or [])
+                return {
+                    "prompt_tokens": prompt_tokens // 2,
+                    "completion_tokens": len(parts),
+                    "total_tokens": prompt_tokens // 2 + len(parts)
+                }
+
+            def _base(self, request, object_type):
+                return {
+                    "id": "chatcmpl-fake",
+                    "object": object_type,
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake-model")
+                }
+
+            def _complete(self, request):
+                parts = server.reply_parts(request)
+                server._delay(server.latency_ms + server.token_delay_ms * (len(parts) - 1))
+                body = dict(self._base(request, "chat.completion"), choices=[{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(parts)},
+                    "finish_reason": "stop"
+                }], usage=self._usage(request, parts))
+                self._send_json(200, body)
+
+            def _stream(self, request):
+                parts = server.reply_parts(request)
+                server._delay(server.latency_ms)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = self._base(request, "chat.completion.chunk")
+                try:
+                    for index, part in enumerate(parts):
+                        if index:
+                            server._delay(server.token_delay_ms)
+                        delta = {"content": part} if index else {"role": "assistant", "content": part}
+                        self._event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+                    self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                    if (request.get("stream_options") or {}).get("include_usage"):
+                        self._event(dict(base, choices=[], usage=self._usage(request, parts)))
+                    self.wfile.write(b"data: [DONE]\n\n")
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端取消请求后关闭了连接
+                    pass
+                self.close_connection = True
+
+            def _event(self, body):
+                self.wfile.write(b"data: " + json.dumps(body, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地的OpenAI兼容模型服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    parser.add_argument("--token-delay-ms", type=float, default=20)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeModelServer(args.host, args.port, args.latency_ms, args.token_delay_ms, args.reply_tokens,
+                             args.error_rate, args.rate_limit_rate, args.jitter, args.seed).start()
+    print(f"模型服务已启动: {server.base_url}（Ctrl+C退出）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
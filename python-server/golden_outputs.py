@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+教程示例的预期运行结果（golden outputs）
+
+构建时用教程解析器找出notes目录中全部的python代码块，在执行引擎的沙箱中并行运行，
+把输出、最终变量摘要和是否确定性写入notes目录下的golden.json。
+评估用户代码时直接读取示例的运行结果，不必每次重新运行示例；提示和解决方案的提示词中附带示例的输出。
+
+文件格式（UTF-8 JSON）：
+    {"version", "python", "limits", "generated_at", "blocks": {键: 结果}}
+键为代码块按AST规范化后的哈希（与运行结果缓存一致，只改注释或格式不会重新运行），
+结果为{"success", "output", "stderr", "limit", "vars", "deterministic", "locations"}，
+locations列出代码块出现的位置[文件名, 章节序号, 代码块序号]。
+确定性指代码不读取输入、随机数、时间、文件等，且连续两次运行的输出和变量相同；
+只有确定性且运行成功的结果会被评估使用。
+
+重新生成时版本、Python版本和限制都未变化的代码块直接沿用旧结果，只运行新增或修改过的代码块。
+
+使用方法：
+    python golden_outputs.py [--force] [输出路径]
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import tempfile
+import argparse
+import platform
+import threading
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from md_parser import parse_document
+from result_cache import analyze
+from limits import resolve_limits
+from config_loader import get_server_option
+
+GOLDEN_VERSION = 3
+
+NOTES_DIR = Path(__file__).parent / "notes"
+DEFAULT_GOLDEN_PATH = NOTES_DIR / "golden.json"
+
+# 写入文件的运行结果字段
+_RESULT_FIELDS = ("success", "output", "stderr", "limit", "vars")
+
+
+def block_key(code):
+    """代码块的键；无法解析的代码按原文计算"""
+    key, _ = analyze(code)
+    if key is None:
+        key = "raw-" + hashlib.sha1(code.encode("utf-8")).hexdigest()
+    return key
+
+
+def collect_blocks(notes_dir=NOTES_DIR):
+    """返回{键: {"code", "locations"}}，内容相同的代码块只运行一次"""
+    blocks = {}
+    for md_file in sorted(Path(notes_dir).glob("*.md")):
+        document = parse_document(md_file.read_text(encoding="utf-8"))
+        for section_id, section in enumerate(document.sections):
+            exercises = [block for block in section.blocks if block.is_exercise]
+            for block_id, block in enumerate(exercises):
+                entry = blocks.setdefault(block_key(block.text), {"code": block.text, "locations": []})
+                entry["locations"].append([md_file.name, section_id, block_id])
+    return blocks
+
+
+def _same_result(first, second):
+    return all(first[field] == second[field] for field in ("success", "output", "stderr", "vars"))
+
+
+def _run_block(engine, code, limits):
+    """运行代码块，静态分析为确定性的代码再运行一次确认"""
+    result = engine.run(code, limits, use_cache=False)
+    deterministic = analyze(code)[1] and result["limit"] is None
+    if deterministic:
+        deterministic = _same_result(result, engine.run(code, limits, use_cache=False))
+    golden = {field: result[field] for field in _RESULT_FIELDS}
+    golden["deterministic"] = deterministic
+    return golden
+
+
+def _read_artifact(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _environment(limits):
+    return {"version": GOLDEN_VERSION, "python": platform.python_version(), "limits": limits}
+
+
+def generate(notes_dir=NOTES_DIR, output_path=DEFAULT_GOLDEN_PATH, engine=None, force=False, workers=None):
+    """
+    生成（或增量更新）预期运行结果文件
+    engine: 执行引擎，默认使用进程内共享的引擎
+    force: 为真时忽略旧文件，全部重新运行
+    返回{"blocks", "executed", "reused", "deterministic", "failed", "elapsed_ms"}
+    """
+    if engine is None:
+        from executor import get_execution_engine
+        engine = get_execution_engine()
+    start = time.perf_counter()
+    limits = resolve_limits("golden")
+    environment = _environment(limits)
+
+    previous = {} if force else (_read_artifact(output_path) or {})
+    if any(previous.get(name) != value for name, value in environment.items()):
+        # 版本、Python版本或限制变化后旧结果全部作废
+        previous = {}
+    reusable = previous.get("blocks") or {}
+
+    blocks = collect_blocks(notes_dir)
+    results = {}
+    pending = []
+    for key, block in blocks.items():
+        if key in reusable:
+            results[key] = dict(reusable[key], locations=block["locations"])
+        else:
+            pending.append(key)
+
+    def task(key):
+        return key, _run_block(engine, blocks[key]["code"], limits)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers or engine.workers), thread_name_prefix="golden") as pool:
+        for key, golden in pool.map(task, pending):
+            results[key] = dict(golden, locations=blocks[key]["locations"])
+
+    artifact = dict(environment, generated_at=time.strftime("%Y-%m-%dT%H:%M:%S"),
+                    blocks={key: results[key] for key in sorted(results)})
+    output_path = Path(output_path)
+    temp_path = output_path.with_suffix(".tmp")
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(artifact, f, ensure_ascii=False, indent=1)
+    temp_path.replace(output_path)
+
+    return {
+        "blocks": len(results),
+        "executed": len(pending),
+        "reused": len(results) - len(pending),
+        "deterministic": sum(1 for golden in results.values() if golden["deterministic"]),
+        "failed": sum(1 for golden in results.values() if not golden["success"]),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+
+class GoldenOutputs:
+    """只读的预期运行结果，path为None、文件不存在或版本不符时为空"""
+
+    def __init__(self, path=DEFAULT_GOLDEN_PATH):
+        self.path = Path(path) if path else None
+        artifact = (_read_artifact(self.path) if self.path else None) or {}
+        if artifact.get("version") != GOLDEN_VERSION or artifact.get("python") != platform.python_version():
+            # 不同Python版本的输出可能不同（例如错误信息），不能当作预期结果
+            artifact = {}
+        self.blocks = artifact.get("blocks") or {}
+        self.limits = artifact.get("limits")
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, code):
+        """返回代码的预期运行结果；没有记录或结果不确定时返回None"""
+        golden = self.blocks.get(block_key(code or "")) if self.blocks else None
+        if golden is not None and not golden["deterministic"]:
+            golden = None
+        with self._lock:
+            if golden is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return golden
+
+    def stats(self):
+        with self._lock:
+            return {
+                "blocks": len(self.blocks),
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+_shared_golden = None
+_shared_lock = threading.Lock()
+
+
+def get_golden_outputs():
+    """返回进程内共享的预期运行结果；server.ini中[golden] enabled为false时为空"""
+    global _shared_golden
+    with _shared_lock:
+        if _shared_golden is None:
+            enabled = get_server_option("golden", "enabled", True)
+            _shared_golden = GoldenOutputs(DEFAULT_GOLDEN_PATH if enabled else None)
+        return _shared_golden
+
+
+def expected_result(code):
+    """示例代码的预期运行结果（执行引擎的结果格式，运行成功才返回），没有时返回None"""
+    golden = get_golden_outputs().lookup(code)
+    if golden is None or not golden["success"]:
+        return None
+    return dict(golden, usage=None, vars_handle=None, cached=True)
+
+
+def expected_output(code):
+    """示例代码的预期输出，没有时返回None"""
+    golden = get_golden_outputs().lookup(code)
+    return None if golden is None else golden["output"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成教程示例的预期运行结果")
+    parser.add_argument("output", nargs="?", default=str(DEFAULT_GOLDEN_PATH), help="输出路径")
+    parser.add_argument("--force", action="store_true", help="忽略已有结果，全部重新运行")
+    parser.add_argument("--workers", type=int, default=None, help="同时运行的代码块数，默认等于工作进程数")
+    args = parser.parse_args()
+    output = Path(args.output).resolve()
+    # 示例中有读写文件的代码，工作进程继承当前目录，在临时目录中运行避免在源码目录留下文件
+    workdir = tempfile.TemporaryDirectory(prefix="golden-")
+    original_cwd = os.getcwd()
+    os.chdir(workdir.name)
+    try:
+        summary = generate(NOTES_DIR, output, force=args.force, workers=args.workers)
+    finally:
+        # 工作进程和本进程都离开临时目录后才能删除（Windows不能删除正在使用的当前目录）
+        from executor import get_execution_engine
+        get_execution_engine().shutdown()
+        os.chdir(original_cwd)
+        workdir.cleanup()
+    print(f"已生成预期运行结果: {args.output}（{summary['blocks']} 个代码块，运行 {summary['executed']} 个，"
+          f"沿用 {summary['reused']} 个，确定性 {summary['deterministic']} 个，"
+          f"运行失败 {summary['failed']} 个，耗时 {summary['elapsed_ms']} ms）")
+    sys.exit(0)
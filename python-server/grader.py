@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+代码评估
+
+在调用AI之前先做本地判断，依次尝试：
+    ast        用户代码与示例代码的AST相同（忽略注释、空白和格式）
+    output     示例代码的运行结果（优先读取golden_outputs预先生成的结果，没有时在沙箱中运行）与用户代码的输出相同且不为空
+    variables  两者的输出相同（可以为空），且示例代码定义的每个变量在用户代码中类型和值都相同
+都无法确认时才交给AI判断（llm）。本地只判定通过，不判定失败：输出或变量不同的代码仍可能实现了相同的功能。
+每个结论都带有判定层级tier，便于统计本地判定的比例。
+"""
+
+from ai_cache import normalize_code, normalize_output
+from inspector import summarize_namespace
+from config_loader import get_server_option
+from cancellation import RequestCancelled
+from golden_outputs import expected_result as golden_result
+
+TIER_AST = "ast"
+TIER_OUTPUT = "output"
+TIER_VARIABLES = "variables"
+TIER_LLM = "llm"
+
+
+def _verdict(passed, tier, reason=None, error=None):
+    verdict = {"passed": passed, "tier": tier, "reason": reason}
+    if error is not None:
+        verdict["error"] = error
+    return verdict
+
+
+def _comparable_vars(result):
+    """从运行结果的变量摘要中取出{名称: (类型, repr)}；摘要被截断时返回None"""
+    summary = result.get("vars")
+    if not summary or summary.get("truncated"):
+        return None
+    return {entry["name"]: (entry["type"], entry["repr"]) for entry in summary["vars"]}
+
+
+def _vars_match(expected_result, user_result):
+    expected_vars = _comparable_vars(expected_result)
+    user_vars = _comparable_vars(user_result)
+    if not expected_vars or user_vars is None:
+        return False
+    for name, (type_name, value_repr) in expected_vars.items():
+        if user_vars.get(name) != (type_name, value_repr):
+            return False
+        # repr被截断或包含对象地址时无法据此判断值是否相同
+        if value_repr.endswith("…") or " at 0x" in value_repr:
+            return False
+    return True
+
+
+def grade_locally(expected_code, user_code, user_result, run):
+    """
+    本地判定，能确认通过时返回结论，否则返回None
+    user_result: 用户代码的运行结果（含output和vars）
+    run: 运行代码的函数，返回与执行引擎相同格式的结果
+    """
+    if normalize_code(expected_code) == normalize_code(user_code):
+        return _verdict(True, TIER_AST, "代码与示例代码等价")
+
+    expected_result = golden_result(expected_code) or run(expected_code)
+    if not expected_result["success"]:
+        # 示例代码本身无法在沙箱中运行（例如需要输入），无法比较
+        return None
+
+    same_output = normalize_output(expected_result["output"]) == normalize_output(user_result["output"])
+    if same_output and normalize_output(expected_result["output"]):
+        return _verdict(True, TIER_OUTPUT, "输出与示例代码相同")
+    if same_output and _vars_match(expected_result, user_result):
+        return _verdict(True, TIER_VARIABLES, "定义的变量与示例代码相同")
+    return None
+
+
+def grade(expected_code, user_code, user_result, run, get_tutor=None, cancel=None):
+    """
+    评估运行成功的用户代码，返回{"passed", "tier", "reason"}
+    get_tutor: 返回AITutor的函数，只在本地无法确认时调用
+    cancel: 请求的CancelToken，传给AI调用；请求被取消时抛出RequestCancelled
+    未提供get_tutor或AI调用失败时passed为None并附带error
+    """
+    if get_server_option("grader", "local", True):
+        verdict = grade_locally(expected_code, user_code, user_result, run)
+        if verdict is not None:
+            return verdict
+    if get_tutor is None:
+        return _verdict(None, TIER_LLM, error="AI评估不可用")
+    try:
+        passed = get_tutor().evaluate_code(expected_code, user_code, user_result["output"], cancel=cancel)
+    except RequestCancelled:
+        raise
+    except Exception as e:
+        return _verdict(None, TIER_LLM, error=str(e))
+    return _verdict(passed, TIER_LLM)
+
+
+def namespace_result(result, namespace):
+    """为进程内运行（run_governed）的结果补充变量摘要，使其可以用于评估"""
+    return dict(result, vars=summarize_namespace(namespace))
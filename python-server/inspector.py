@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+变量查看器
+
+运行结束后只返回用户变量的精简摘要（类型、长度、截断的repr），摘要大小与用户分配了多少内存无关。
+命名空间本身留在工作进程中，以快照编号引用；inspect_var按路径逐层展开容器并分页返回子项。
+
+路径中的每一项都是上一层子项的序号：列表、元组按下标，字典按条目顺序，集合按迭代顺序，
+其他对象按属性（vars()）顺序。
+"""
+
+import types
+import reprlib
+import itertools
+from collections import OrderedDict
+from config_loader import get_server_option
+
+# 可以展开查看子项的容器类型
+_SEQUENCE_TYPES = (list, tuple)
+_MAPPING_TYPES = (dict,)
+_SET_TYPES = (set, frozenset)
+
+# 不作为用户变量展示的类型
+_HIDDEN_TYPES = (types.ModuleType,)
+
+
+def _make_repr(max_repr):
+    r = reprlib.Repr()
+    r.maxstring = max_repr
+    r.maxother = max_repr
+    r.maxlist = r.maxtuple = r.maxset = r.maxfrozenset = r.maxdict = 10
+    r.maxlevel = 2
+    return r
+
+
+def safe_repr(value, max_repr):
+    """截断的repr，自定义__repr__出错时返回说明文字"""
+    try:
+        text = _make_repr(max_repr).repr(value)
+    except Exception as e:
+        return f"<repr失败: {type(e).__name__}>"
+    if len(text) > max_repr:
+        text = text[:max_repr] + "…"
+    return text
+
+
+def _length(value):
+    """内置容器和字符串的长度，其他对象不调用__len__，避免执行用户代码"""
+    if isinstance(value, (str, bytes, bytearray, range) + _SEQUENCE_TYPES + _MAPPING_TYPES + _SET_TYPES):
+        return len(value)
+    return None
+
+
+def _expandable(value):
+    if isinstance(value, _SEQUENCE_TYPES + _MAPPING_TYPES + _SET_TYPES):
+        return len(value) > 0
+    if isinstance(value, (type, types.FunctionType, types.BuiltinFunctionType) + _HIDDEN_TYPES):
+        return False
+    try:
+        return bool(vars(value))
+    except TypeError:
+        return False
+
+
+def describe(value, max_repr):
+    """单个值的摘要"""
+    return {
+        "type": type(value).__name__,
+        "len": _length(value),
+        "repr": safe_repr(value, max_repr),
+        "expandable": _expandable(value)
+    }
+
+
+def summarize_namespace(namespace, max_vars=None, max_repr=None):
+    """
+    返回用户变量摘要{"vars": [...], "total", "truncated"}
+    跳过下划线开头的名称和导入的模块
+    """
+    if max_vars is None:
+        max_vars = get_server_option("inspector", "max_vars", 50)
+    if max_repr is None:
+        max_repr = get_server_option("inspector", "max_repr", 200)
+    names = [name for name, value in namespace.items()
+             if not name.startswith("_") and not isinstance(value, _HIDDEN_TYPES)]
+    entries = [dict(describe(namespace[name], max_repr), name=name) for name in names[:max_vars]]
+    return {"vars": entries, "total": len(names), "truncated": len(names) > max_vars}
+
+
+def _children(value, offset, limit):
+    """返回(子项总数, [(标签, 值)])，只遍历需要的部分"""
+    if isinstance(value, _SEQUENCE_TYPES):
+        return len(value), [(str(i), value[i]) for i in range(offset, min(len(value), offset + limit))]
+    if isinstance(value, _MAPPING_TYPES):
+        items = itertools.islice(value.items(), offset, offset + limit)
+        return len(value), [(safe_repr(key, 60), item) for key, item in items]
+    if isinstance(value, _SET_TYPES):
+        return len(value), [(str(offset + i), item)
+                            for i, item in enumerate(itertools.islice(value, offset, offset + limit))]
+    attributes = vars(value)
+    items = itertools.islice(attributes.items(), offset, offset + limit)
+    return len(attributes), [(name, item) for name, item in items]
+
+
+def _child_at(value, index):
+    """按序号取第index个子项"""
+    _, children = _children(value, index, 1)
+    if not children:
+        raise IndexError(index)
+    return children[0][1]
+
+
+def inspect_value(namespace, name, path=None, offset=0, limit=None, max_repr=None):
+    """
+    展开namespace[name]按path定位到的值，返回{"type", "len", "repr", "total", "offset", "items"}
+    名称或路径无效时抛出LookupError，值不可展开时抛出TypeError
+    """
+    if limit is None:
+        limit = get_server_option("inspector", "page_size", 50)
+    if max_repr is None:
+        max_repr = get_server_option("inspector", "max_repr", 200)
+    limit = max(1, min(limit, get_server_option("inspector", "max_page_size", 200)))
+    offset = max(0, offset)
+
+    if name not in namespace:
+        raise LookupError(f"变量不存在: {name}")
+    value = namespace[name]
+    for index in path or []:
+        try:
+            value = _child_at(value, int(index))
+        except (IndexError, TypeError, ValueError):
+            raise LookupError(f"路径无效: {path}")
+
+    if not _expandable(value):
+        raise TypeError(f"{type(value).__name__} 类型的值不能展开")
+    total, children = _children(value, offset, limit)
+    return dict(describe(value, max_repr), total=total, offset=offset, items=[
+        dict(describe(child, max_repr), key=label) for label, child in children
+    ])
+
+
+class SnapshotStore:
+    """工作进程中保留的最近几次运行的命名空间"""
+
+    def __init__(self, max_snapshots=None):
+        if max_snapshots is None:
+            max_snapshots = get_server_option("inspector", "max_snapshots", 4)
+        self.max_snapshots = max(0, max_snapshots)
+        self._snapshots = OrderedDict()
+        self._next_id = itertools.count(1)
+
+    def add(self, namespace):
+        """保存命名空间，返回快照编号；不保留快照时返回None"""
+        if not self.max_snapshots:
+            return None
+        snapshot_id = next(self._next_id)
+        self._snapshots[snapshot_id] = namespace
+        while len(self._snapshots) > self.max_snapshots:
+            # 释放最早的命名空间及其中的对象
+            self._snapshots.popitem(last=False)
+        return snapshot_id
+
+    def get(self, snapshot_id):
+        namespace = self._snapshots.get(snapshot_id)
+        if namespace is None:
+            raise LookupError("变量快照已失效，请重新运行代码")
+        return namespace
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IPC输出通道的消息编码
+
+支持两种模式：
+- line：每行一个JSON，超过8KB的消息拆分为stream_chunk（旧协议，作为回退）
+- frame：长度前缀帧，帧头之后直接是UTF-8 JSON正文，较大的正文可用zlib压缩
+
+帧格式（大端）：
+    2字节魔数 0xFA 0xCE | 1字节标志位 | 4字节正文长度 | 正文
+0xFA在UTF-8中不会出现，接收端可以据此区分帧与混入的普通文本。
+"""
+
+import json
+import struct
+import zlib
+
+FRAMING_LINE = "line"
+FRAMING_FRAME = "frame"
+
+FRAME_MAGIC = b"\xfa\xce"
+FRAME_HEADER = struct.Struct(">2sBI")
+FLAG_ZLIB = 0x01
+
+# 旧协议的分块大小
+LINE_CHUNK_SIZE = 8000
+
+
+def encode_frame(message, compress_threshold=None, compress_level=1):
+    """把消息编码为一个完整的帧，正文超过compress_threshold字节时进行zlib压缩"""
+    body = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    flags = 0
+    if compress_threshold is not None and len(body) >= compress_threshold:
+        compressed = zlib.compress(body, compress_level)
+        # 压缩无收益时保留原文
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= FLAG_ZLIB
+    return FRAME_HEADER.pack(FRAME_MAGIC, flags, len(body)) + body
+
+
+def decode_frame(data):
+    """解析一个帧，返回(消息, 已消耗的字节数)；数据不完整时返回(None, 0)"""
+    if len(data) < FRAME_HEADER.size:
+        return None, 0
+    magic, flags, length = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Invalid frame magic")
+    end = FRAME_HEADER.size + length
+    if len(data) < end:
+        return None, 0
+    body = bytes(data[FRAME_HEADER.size:end])
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    return json.loads(body.decode("utf-8")), end
+
+
+def encode_lines(message, request_id=None):
+    """按旧协议把消息编码为若干行JSON（不含换行符）"""
+    json_str = json.dumps(message)
+
+    # 小于8KB直接发送
+    if len(json_str) < LINE_CHUNK_SIZE:
+        return [json_str]
+
+    # 否则分块发送
+    total_chunks = (len(json_str) + LINE_CHUNK_SIZE - 1) // LINE_CHUNK_SIZE
+    lines = [json.dumps({
+        "status": "stream_start",
+        "total_chunks": total_chunks,
+        "requestId": request_id
+    })]
+    for i in range(total_chunks):
+        lines.append(json.dumps({
+            "status": "stream_chunk",
+            "chunk_index": i,
+            "chunk_data": json_str[i * LINE_CHUNK_SIZE:(i + 1) * LINE_CHUNK_SIZE],
+            "requestId": request_id
+        }))
+    lines.append(json.dumps({
+        "status": "stream_end",
+        "requestId": request_id
+    }))
+    return lines
@@ -7,14 +7,28 @@ Python代码跟练系统IPC服务器
 这个服务器通过标准输入/输出与Electron主进程通信，替代原有的HTTP通信方式
 """
 
-import os
 import sys
 import json
 import signal
 import traceback
+import multiprocessing
 from pathlib import Path
-from threading import Thread
-from ai_helper import AITutor
+from threading import Thread, Lock
+from ai_helper import (get_ai_tutor, start_ai_health_monitor, get_ai_status, refresh_ai_status,
+                       coalesce_deltas, get_ai_usage)
+from dispatcher import CommandDispatcher
+from config_loader import get_server_option
+from ipc_protocol import FRAMING_LINE, FRAMING_FRAME, encode_frame, encode_lines
+from tutorial_index import TutorialIndex
+from search_index import get_search_index
+from executor import get_execution_engine
+from limits import resolve_limits
+from compile_cache import get_compile_cache, precompile_notes
+from ai_cache import get_ai_cache
+from grader import grade
+from batch_grader import BatchGrader
+from golden_outputs import get_golden_outputs
+from cancellation import CancelRegistry, RequestCancelled
 
 
 # 教程映射表
@@ -38,11 +52,24 @@ class IPCServer:
     def __init__(self):
         self.running = True
         # 从api_server.py导入的函数
-        from api_server import extract_code_blocks, extract_sections, run_code,operate_model_key
+        from api_server import operate_model_key, tutorial_cache
+        self.tutorial_cache = tutorial_cache
+        # 预构建的教程索引（mmap），不存在时全部走实时解析
+        self.tutorial_index = TutorialIndex.load()
         self.operate_model_key = operate_model_key
-        self.extract_code_blocks = extract_code_blocks
-        self.extract_sections = extract_sections
-        self.run_code = run_code
+        # 保存真实的标准输出，避免被任何redirect_stdout临时替换影响
+        self._stdout = sys.stdout
+        self._write_lock = Lock()
+        # 输出通道编码，默认使用旧的按行JSON协议，客户端可通过negotiate命令切换
+        self.framing = FRAMING_LINE
+        self.use_zlib = False
+        self.compress_threshold = get_server_option("framing", "compress_threshold", 64 * 1024)
+        # 用户代码在预启动的工作进程中运行
+        self.execution_engine = get_execution_engine()
+        # 带requestId的请求在提交前登记取消令牌，cancel命令和deadline_ms通过它中止请求
+        self.cancellations = CancelRegistry()
+        # 按命令类别并发处理请求
+        self.dispatcher = CommandDispatcher(self._process_message)
         # 注册信号处理器
         self._setup_signal_handlers()
 
@@ -50,14 +77,18 @@ class IPCServer:
         """设置信号处理器以确保优雅退出"""
         # 处理SIGTERM信号（进程终止信号）
         def handle_sigterm(signum, frame):
-            print(json.dumps({"status": "shutdown", "message": "Received SIGTERM, shutting down"}), flush=True)
+            self._send_message({"status": "shutdown", "message": "Received SIGTERM, shutting down"})
             self.running = False
+            self.dispatcher.shutdown()
+            self.execution_engine.shutdown()
             sys.exit(0)
 
         # 处理SIGINT信号（键盘中断，如Ctrl+C）
         def handle_sigint(signum, frame):
-            print(json.dumps({"status": "shutdown", "message": "Received SIGINT, shutting down"}), flush=True)
+            self._send_message({"status": "shutdown", "message": "Received SIGINT, shutting down"})
             self.running = False
+            self.dispatcher.shutdown()
+            self.execution_engine.shutdown()
             sys.exit(0)
 
         # 注册信号处理器
@@ -67,7 +98,7 @@ class IPCServer:
                 signal.signal(signal.SIGTERM, handle_sigterm)
                 signal.signal(signal.SIGINT, handle_sigint)
             except (AttributeError, ValueError) as e:
-                print(json.dumps({"status": "warning", "message": f"无法设置信号处理器: {str(e)}"}), flush=True)
+                self._send_message({"status": "warning", "message": f"无法设置信号处理器: {str(e)}"})
         else:
             # Unix/Linux/MacOS平台
             signal.signal(signal.SIGTERM, handle_sigterm)
@@ -75,7 +106,15 @@ class IPCServer:
 
     def start(self):
         """启动IPC服务器"""
-        print(json.dumps({"status": "ready", "message": "IPC server has started"}), flush=True)
+        self._send_message({"status": "ready", "message": "IPC server has started"})
+
+        # 后台加载搜索索引并增量更新，不阻塞启动
+        Thread(target=get_search_index, daemon=True).start()
+        # 后台探测模型服务的可用性，[ai] warm_up只决定是否立即探测（同时预先建立连接）
+        start_ai_health_monitor()
+        # 后台预编译教程中的代码块，工作进程首次运行示例时直接读取编译缓存
+        if get_server_option("compile_cache", "precompile", True):
+            Thread(target=precompile_notes, daemon=True).start()
 
         # 启动输入监听线程
         input_thread = Thread(target=self._listen_for_input)
@@ -87,28 +126,70 @@ class IPCServer:
             input_thread.join()
         except KeyboardInterrupt:
             self.running = False
-            print(json.dumps({"status": "shutdown", "message": "IPC server has shut down"}), flush=True)
+            self.dispatcher.shutdown()
+            self.execution_engine.shutdown()
+            self._send_message({"status": "shutdown", "message": "IPC server has shut down"})
 
     def _listen_for_input(self):
         """监听标准输入的消息"""
         while self.running:
             try:
                 # 从标准输入读取一行JSON数据
-                line =  sys.stdin.readline().encode('utf-8').decode('unicode_escape').strip()
+                raw_line = sys.stdin.readline()
+                if not raw_line:
+                    # 标准输入已关闭（主进程退出）
+                    self.running = False
+                    break
+                line = raw_line.encode('utf-8').decode('unicode_escape').strip()
                 if not line:
                     continue
 
-                # 解析JSON数据
+                # 解析JSON数据后交给分派器，处理中的请求已满时在分派器中排队，不阻塞读取
                 try:
                     data = json.loads(line)
-                    self._process_message(data)
+                    if data.get("command") == "negotiate":
+                        # 协商必须与读取顺序一致，直接在监听线程处理
+                        self._handle_negotiate(data.get("payload") or {}, data.get("requestId"))
+                    elif data.get("command") == "cancel":
+                        # 取消不能排在被取消的请求之后，直接在监听线程处理
+                        self._handle_cancel(data.get("payload") or {}, data.get("requestId"))
+                    else:
+                        request_id = data.get("requestId")
+                        if request_id:
+                            cancel = self.cancellations.register(request_id, data.get("deadline_ms"))
+                            # 排队中的请求被取消或超时后立即结束，不必等到轮到它
+                            cancel.on_cancel(lambda request_id=request_id: self._withdraw_queued(request_id))
+                        self.dispatcher.submit(data)
                 except json.JSONDecodeError as e:
                     self._send_error(f"Invalid JSON data: {str(e)} | {line}")
             except Exception as e:
                 self._send_error(f"Error processing input: {str(e)}")
 
+    def _withdraw_queued(self, request_id):
+        """请求还在分派器中排队时移出队列并发送cancelled消息"""
+        if self.dispatcher.withdraw(request_id) is None:
+            # 已开始处理，由处理函数检查取消状态
+            return
+        self._send_cancelled(RequestCancelled(self.cancellations.get(request_id).reason), request_id)
+        self.cancellations.release(request_id)
+
     def _process_message(self, data):
         """处理接收到的消息"""
+        request_id = data.get("requestId")
+        cancel = self.cancellations.get(request_id) if request_id else None
+        try:
+            if cancel is not None:
+                # 排队期间已被取消或已超过截止时间的请求不再处理
+                cancel.check()
+            self._dispatch_command(data, cancel)
+        except RequestCancelled as e:
+            self._send_cancelled(e, request_id)
+        finally:
+            if request_id:
+                self.cancellations.release(request_id)
+
+    def _dispatch_command(self, data, cancel=None):
+        """按命令调用处理函数；cancel为请求的CancelToken，执行代码和调用模型时用于中止请求"""
         try:
             command = data.get("command")
             payload = data.get("payload", {})
@@ -118,23 +199,55 @@ class IPCServer:
                 self._handle_get_tutorials(request_id)
             elif command == "get_tutorial":
                 self._handle_get_tutorial(payload, request_id)
+            elif command == "get_tutorial_outline":
+                self._handle_get_tutorial_outline(payload, request_id)
+            elif command == "get_section":
+                self._handle_get_section(payload, request_id)
+            elif command == "prefetch_sections":
+                self._handle_prefetch_sections(payload, request_id)
             elif command == "run_code":
-                self._handle_run_code(payload, request_id)
+                self._handle_run_code(payload, request_id, cancel)
             elif command == "run_code_simple":
-                self._handle_run_code_simple(payload, request_id)
+                self._handle_run_code_simple(payload, request_id, cancel)
+            elif command == "batch_evaluate":
+                self._handle_batch_evaluate(payload, request_id, cancel)
             elif command == "test":
                 self._handle_test(payload, request_id)
             elif command == "get_hint":
-                self._handle_get_hint(payload, request_id)
+                self._handle_get_hint(payload, request_id, cancel)
             elif command == "get_solution":
-                self._handle_get_solution(payload, request_id)
+                self._handle_get_solution(payload, request_id, cancel)
             elif command == "model_key":
                 self._handle_model_key(payload, request_id)
+            elif command == "search_tutorials":
+                self._handle_search_tutorials(payload, request_id)
+            elif command == "cache_stats":
+                self._handle_cache_stats(request_id)
+            elif command == "inspect_var":
+                self._handle_inspect_var(payload, request_id)
+            elif command == "ai_status":
+                self._send_response(get_ai_status(), request_id)
             else:
                 self._send_error(f"Unknown command: {command}", request_id)
+        except RequestCancelled:
+            raise
         except Exception as e:
             self._send_error(f"Error processing message: {str(e)}\n{traceback.format_exc()}", data.get("requestId"))
 
+    def _execute(self, code, command, payload, request_id=None, cancel=None):
+        """
+        在执行引擎的工作进程中运行用户代码，资源限制按命令和教程从server.ini读取
+        payload中stream为真时，程序输出在运行过程中以output消息发送，最终结果仍照常返回
+        payload中noCache为真时不使用运行结果缓存
+        请求被取消时结束运行中的工作进程并抛出RequestCancelled
+        """
+        limits = resolve_limits(command, payload.get("tutorialKey"))
+        on_output = None
+        if payload.get("stream"):
+            on_output = lambda stream, text: self._send_output(stream, text, request_id)
+        return self.execution_engine.run(code, limits, on_output, use_cache=not payload.get("noCache"),
+                                         cancel=cancel)
+
     def _handle_get_tutorials(self, request_id=None):
         """处理获取所有教程的请求"""
         tutorials_list = []
@@ -146,37 +259,115 @@ class IPCServer:
             })
         self._send_response({"tutorials": tutorials_list}, request_id)
 
-    def _handle_get_tutorial(self, payload, request_id=None):
-        """处理获取特定教程内容的请求"""
+    def _resolve_tutorial_file(self, payload, request_id=None):
+        """根据tutorialKey定位Markdown文件，失败时发送错误并返回None"""
         tutorial_key = payload.get("tutorialKey")
         if not tutorial_key or tutorial_key not in TUTORIALS:
             self._send_error(f"Tutorial '{tutorial_key}' not found", request_id)
-            return
+            return None
 
-        # 读取Markdown文件
         md_file = Path(__file__).parent / "notes" / TUTORIALS[tutorial_key]
         if not md_file.exists():
             self._send_error(f"Markdown file '{md_file}' not found", request_id)
+            return None
+        return md_file
+
+    def _read_section(self, md_file, section_id):
+        """读取单个章节，id不存在时抛出IndexError"""
+        section = self.tutorial_index.section(md_file, section_id) if self.tutorial_index else None
+        if section is None:
+            section = self.tutorial_cache.get(md_file).section(section_id)
+        return section
+
+    def _handle_get_tutorial(self, payload, request_id=None):
+        """处理获取特定教程内容的请求"""
+        md_file = self._resolve_tutorial_file(payload, request_id)
+        if md_file is None:
             return
 
         try:
-            with open(md_file, 'r', encoding='utf-8') as f:
-                md_content = f.read()
+            # 优先使用预构建索引，索引过期时回退到缓存的实时解析结果
+            tutorial = self.tutorial_index.get(md_file) if self.tutorial_index else None
+            if tutorial is None:
+                tutorial = self.tutorial_cache.get(md_file).to_dict()
+            self._send_response(tutorial, request_id)
+        except Exception as e:
+            self._send_error(f"Error reading tutorial content: {str(e)}", request_id)
 
-            # 提取章节
-            sections = self.extract_sections(md_content)
+    def _handle_get_tutorial_outline(self, payload, request_id=None):
+        """处理获取教程目录的请求，只返回章节标题、id、大小和练习数量"""
+        md_file = self._resolve_tutorial_file(payload, request_id)
+        if md_file is None:
+            return
 
-            # 获取教程标题
-            title = md_content.split('\n')[0].lstrip('#').strip()
+        try:
+            outline = self.tutorial_index.outline(md_file) if self.tutorial_index else None
+            if outline is None:
+                outline = self.tutorial_cache.get(md_file).outline()
+            self._send_response(outline, request_id)
+        except Exception as e:
+            self._send_error(f"Error reading tutorial outline: {str(e)}", request_id)
+
+    def _handle_get_section(self, payload, request_id=None):
+        """处理获取单个章节的请求"""
+        md_file = self._resolve_tutorial_file(payload, request_id)
+        if md_file is None:
+            return
 
-            self._send_response({
-                "title": title,
-                "sections": sections
-            }, request_id)
+        section_id = payload.get("sectionId")
+        try:
+            self._send_response(self._read_section(md_file, section_id), request_id)
+        except IndexError:
+            self._send_error(f"Section '{section_id}' not found", request_id)
         except Exception as e:
-            self._send_error(f"Error reading tutorial content: {str(e)}", request_id)
+            self._send_error(f"Error reading section: {str(e)}", request_id)
+
+    def _handle_prefetch_sections(self, payload, request_id=None):
+        """处理预取章节的请求，一次返回多个章节供客户端缓存，不存在的id会被忽略"""
+        md_file = self._resolve_tutorial_file(payload, request_id)
+        if md_file is None:
+            return
+
+        sections = []
+        try:
+            for section_id in payload.get("sectionIds") or []:
+                try:
+                    sections.append(self._read_section(md_file, section_id))
+                except IndexError:
+                    continue
+            self._send_response({"sections": sections}, request_id)
+        except Exception as e:
+            self._send_error(f"Error reading sections: {str(e)}", request_id)
+
+    def _handle_search_tutorials(self, payload, request_id=None):
+        """处理全文搜索教程的请求"""
+        query = payload.get("query", "")
+        limit = payload.get("limit", 20)
+        if not query.strip():
+            self._send_error("Missing required parameters", request_id)
+            return
+
+        try:
+            keys = {file_name: key for key, file_name in TUTORIALS.items()}
+            results = get_search_index().search(query, limit)
+            for result in results:
+                result["tutorialKey"] = keys.get(result["file"])
+            self._send_response({"results": results}, request_id)
+        except Exception as e:
+            self._send_error(f"Error searching tutorials: {str(e)}", request_id)
+
+    def _handle_cache_stats(self, request_id=None):
+        """处理获取缓存统计的请求"""
+        self._send_response({
+            "tutorial_cache": self.tutorial_cache.stats(),
+            "execution_engine": self.execution_engine.stats(),
+            "compile_cache": get_compile_cache().stats(),
+            "ai_cache": get_ai_cache().stats(),
+            "ai_usage": get_ai_usage(),
+            "golden_outputs": get_golden_outputs().stats()
+        }, request_id)
 
-    def _handle_run_code(self, payload, request_id=None):
+    def _handle_run_code(self, payload, request_id=None, cancel=None):
         """处理运行代码的请求"""
         user_code = payload.get("code", "")
         expected_code = payload.get("expected_code", "")
@@ -186,25 +377,28 @@ class IPCServer:
             return
 
         # 运行代码
-        result = self.run_code(user_code)
+        result = self._execute(user_code, "run_code", payload, request_id, cancel)
 
-        # 如果有预期代码，使用AI评估
+        # 如果有预期代码，先在本地评估，无法确认时再使用AI评估
         ai_evaluation = None
         if expected_code and result["success"]:
-            try:
-                ai_tutor = AITutor()
-                ai_result = ai_tutor.evaluate_code(expected_code, user_code, result["output"])
-                ai_evaluation = {"passed": ai_result}
-            except Exception as e:
-                ai_evaluation = {"error": str(e)}
+            limits = resolve_limits("run_code", payload.get("tutorialKey"))
+            run_expected = lambda code: self.execution_engine.run(code, limits, cancel=cancel)
+            ai_evaluation = grade(expected_code, user_code, result, run_expected, get_ai_tutor, cancel)
 
         self._send_response({
             "success": result["success"],
             "output": result["output"],
+            "stderr": result["stderr"],
+            "limit": result["limit"],
+            "usage": result["usage"],
+            "cached": result.get("cached", False),
+            "vars": result["vars"],
+            "vars_handle": result["vars_handle"],
             "ai_evaluation": ai_evaluation
         }, request_id)
 
-    def _handle_run_code_simple(self, payload, request_id=None):
+    def _handle_run_code_simple(self, payload, request_id=None, cancel=None):
         """处理运行代码的请求"""
         user_code = payload.get("code", "")
 
@@ -213,23 +407,70 @@ class IPCServer:
             return
 
         # 运行代码
-        result = self.run_code(user_code)
+        result = self._execute(user_code, "run_code_simple", payload, request_id, cancel)
 
         self._send_response({
             "success": result["success"],
-            "output": result["output"]
+            "output": result["output"],
+            "stderr": result["stderr"],
+            "limit": result["limit"],
+            "usage": result["usage"],
+            "cached": result.get("cached", False),
+            "vars": result["vars"],
+            "vars_handle": result["vars_handle"]
         }, request_id)
 
+    def _handle_batch_evaluate(self, payload, request_id=None, cancel=None):
+        """
+        批量评估多份代码，submissions为[{"id", "code", "expected_code"}]，
+        未单独提供expected_code的提交使用payload中的expected_code
+        payload中stream为真时每份结果完成后立即以item消息发送，最终响应只包含汇总
+        """
+        submissions = payload.get("submissions") or []
+        if not submissions:
+            self._send_error("No submissions provided", request_id)
+            return
+        default_expected = payload.get("expected_code", "")
+        submissions = [dict(s, expected_code=s.get("expected_code", default_expected)) for s in submissions]
+
+        limits = resolve_limits("batch_evaluate", payload.get("tutorialKey"))
+        run = lambda code: self.execution_engine.run(code, limits, cancel=cancel)
+        on_result = None
+        if payload.get("stream"):
+            on_result = lambda item: self._send_item(item, request_id)
+        results, summary = BatchGrader(run, get_ai_tutor, cancel=cancel).grade_all(submissions, on_result)
+
+        response = {"summary": summary}
+        if not payload.get("stream"):
+            response["results"] = results
+        self._send_response(response, request_id)
+
+    def _handle_inspect_var(self, payload, request_id=None):
+        """处理展开变量的请求，按页返回容器的子项"""
+        handle = payload.get("varsHandle")
+        name = payload.get("name")
+        if not handle or not name:
+            self._send_error("Missing required parameters", request_id)
+            return
+
+        try:
+            result = self.execution_engine.inspect(
+                handle, name, payload.get("path") or [], payload.get("offset", 0), payload.get("limit")
+            )
+            self._send_response(result, request_id)
+        except LookupError as e:
+            self._send_error(str(e).strip("'\""), request_id)
+
     def _handle_test(self, payload, request_id=None):
         """获取代码提示"""
         try:
-            ai_tutor = AITutor()
+            ai_tutor = get_ai_tutor()
             result = ai_tutor.test()
             self._send_response({"test": result}, request_id)
         except Exception as e:
             self._send_error(f"Error getting hint: {str(e)}", request_id)
 
-    def _handle_get_hint(self, payload, request_id=None):
+    def _handle_get_hint(self, payload, request_id=None, cancel=None):
         """处理获取代码提示的请求"""
         user_code = payload.get("code", "")
         expected_code = payload.get("expected_code", "")
@@ -240,17 +481,25 @@ class IPCServer:
             return
 
         try:
-            ai_tutor = AITutor()
+            ai_tutor = get_ai_tutor()
+            if payload.get("stream"):
+                self._stream_ai_response(
+                    ai_tutor.stream_hint(user_code, expected_code, actual_output, cancel), "hint", request_id
+                )
+                return
             hint = ai_tutor.generate_hint(
                 user_code=user_code,
                 expected_output=expected_code,
-                actual_output=actual_output
+                actual_output=actual_output,
+                cancel=cancel
             )
             self._send_response({"hint": hint}, request_id)
+        except RequestCancelled:
+            raise
         except Exception as e:
             self._send_error(f"Error getting hint: {str(e)}", request_id)
 
-    def _handle_get_solution(self, payload, request_id=None):
+    def _handle_get_solution(self, payload, request_id=None, cancel=None):
         """处理获取代码解决方案的请求"""
         user_code = payload.get("code", "")
         expected_code = payload.get("expected_code", "")
@@ -261,17 +510,46 @@ class IPCServer:
             return
 
         try:
-            ai_tutor = AITutor()
+            ai_tutor = get_ai_tutor()
+            if payload.get("stream"):
+                self._stream_ai_response(
+                    ai_tutor.stream_solution(user_code, expected_code, actual_output, cancel), "solution", request_id
+                )
+                return
             solution = ai_tutor.generate_solution(
                 user_code=user_code,
                 expected_output=expected_code,
-                actual_output=actual_output
+                actual_output=actual_output,
+                cancel=cancel
             )
             self._send_response({"solution": solution}, request_id)
+        except RequestCancelled:
+            raise
         except Exception as e:
             self._send_error(f"Error getting solution: {str(e)}", request_id)
 
 
+    def _stream_ai_response(self, events, result_key, request_id=None):
+        """
+        把流式生成的片段以delta消息逐批发送，最后以普通响应返回完整文本和用量统计
+        result_key: 最终响应中完整文本使用的键（hint或solution）
+        """
+        for kind, value in coalesce_deltas(events):
+            if kind == "delta":
+                message = {"status": "delta", "data": value}
+                if request_id:
+                    message["requestId"] = request_id
+                self._send_message(message, request_id)
+            else:
+                self._send_response({
+                    result_key: value["text"],
+                    "usage": value["usage"],
+                    "first_token_ms": value["first_token_ms"],
+                    "elapsed_ms": value["elapsed_ms"],
+                    "error": value["error"],
+                    "cached": value["cached"]
+                }, request_id)
+
     def _handle_model_key(self, payload, request_id=None):
         """处理模型密钥的请求"""
         operate = payload.get("operate", "")
@@ -286,105 +564,121 @@ class IPCServer:
             return
         try:
             response = self.operate_model_key(operate, base_url, model_name,encrypted_api_key, aes_key, iv)
+            if operate != "get":
+                # 配置变化后立即重新探测可用性
+                refresh_ai_status()
             self._send_response({"model_key": response}, request_id)
         except Exception as e:
             self._send_error(f"Error {operate} model key: {str(e)}", request_id)
 
+    def _handle_cancel(self, payload, request_id=None):
+        """
+        取消payload中requestId对应的请求，被取消的请求以cancelled状态结束
+        返回的cancelled为False表示请求已经完成或不存在
+        """
+        target = payload.get("requestId")
+        if not target:
+            self._send_error("Missing required parameters", request_id)
+            return
+        self._send_response({"cancelled": self.cancellations.cancel(target)}, request_id)
+
+    def _handle_negotiate(self, payload, request_id=None):
+        """协商输出通道的编码方式，确认消息仍按当前模式发送，之后的消息使用新模式"""
+        framing = payload.get("framing", FRAMING_LINE)
+        if framing not in (FRAMING_LINE, FRAMING_FRAME):
+            self._send_error(f"Unsupported framing: {framing}", request_id)
+            return
+
+        compression = payload.get("compression") or []
+        use_zlib = framing == FRAMING_FRAME and "zlib" in compression
+        ack = {
+            "status": "success",
+            "data": {
+                "framing": framing,
+                "compression": "zlib" if use_zlib else None,
+                "compress_threshold": self.compress_threshold if use_zlib else None
+            }
+        }
+        if request_id:
+            ack["requestId"] = request_id
+
+        # 在同一临界区内发送确认并切换模式，保证接收端看到的切换点是确定的
+        with self._write_lock:
+            self._write_message_locked(ack, request_id)
+            self.framing = framing
+            self.use_zlib = use_zlib
+
+    def _write_message_locked(self, message, request_id=None):
+        """按当前协商的模式写出一条消息，调用方需持有写锁"""
+        if self.framing == FRAMING_FRAME:
+            threshold = self.compress_threshold if self.use_zlib else None
+            self._stdout.flush()
+            self._stdout.buffer.write(encode_frame(message, threshold))
+            self._stdout.buffer.flush()
+        else:
+            self._stdout.write('\n'.join(encode_lines(message, request_id)) + '\n')
+            self._stdout.flush()
+
+    def _send_message(self, message, request_id=None):
+        """发送一条完整消息，大消息在帧模式下一次写出"""
+        with self._write_lock:
+            self._write_message_locked(message, request_id)
+
     def _send_response(self, data, request_id=None):
-        """发送响应数据（支持流式传输）"""
+        """发送响应数据"""
         response = {
             "status": "success",
             "data": data
         }
         if request_id:
             response["requestId"] = request_id
-
-        # 将响应转换为JSON字符串
-        json_str = json.dumps(response)
-
-        # 如果响应小于8KB，直接发送
-        if len(json_str) < 8000:
-            print(json_str, flush=True)
-            return
-
-        # 否则分块发送
-        chunk_size = 8000  # 每块大小约8KB，减小块大小以避免解析问题
-        total_chunks = (len(json_str) + chunk_size - 1) // chunk_size
-
-        # 发送开始标记
-        print(json.dumps({
-            "status": "stream_start",
-            "total_chunks": total_chunks,
-            "requestId": request_id
-        }), flush=True)
-
-        # 分块发送数据
-        for i in range(total_chunks):
-            chunk = json_str[i * chunk_size:(i + 1) * chunk_size]
-            print(json.dumps({
-                "status": "stream_chunk",
-                "chunk_index": i,
-                "chunk_data": chunk,
-                "requestId": request_id
-            }), flush=True)
-            # 添加小延迟，避免数据发送过快导致接收端缓冲区溢出
-            import time
-            time.sleep(0.01)
-
-        # 发送结束标记
-        print(json.dumps({
-            "status": "stream_end",
-            "requestId": request_id
-        }), flush=True)
+        self._send_message(response, request_id)
+
+    def _send_output(self, stream, text, request_id=None):
+        """发送运行中的程序输出，stream为stdout或stderr"""
+        message = {
+            "status": "output",
+            "stream": stream,
+            "data": text
+        }
+        if request_id:
+            message["requestId"] = request_id
+        self._send_message(message, request_id)
+
+    def _send_item(self, item, request_id=None):
+        """发送批量评估中一份提交的结果"""
+        message = {
+            "status": "item",
+            "data": item
+        }
+        if request_id:
+            message["requestId"] = request_id
+        self._send_message(message, request_id)
+
+    def _send_cancelled(self, error, request_id=None):
+        """发送请求被取消的消息，reason为cancelled（cancel命令）或timeout（超过deadline_ms）"""
+        message = {
+            "status": "cancelled",
+            "reason": error.reason,
+            "message": str(error)
+        }
+        if request_id:
+            message["requestId"] = request_id
+        self._send_message(message, request_id)
 
     def _send_error(self, message, request_id=None):
-        """发送错误消息（支持流式传输）"""
+        """发送错误消息"""
         error = {
             "status": "error",
             "message": message
         }
         if request_id:
             error["requestId"] = request_id
-
-        # 将错误转换为JSON字符串
-        json_str = json.dumps(error)
-
-        # 如果错误消息小于8KB，直接发送
-        if len(json_str) < 8000:
-            print(json_str, flush=True)
-            return
-
-        # 否则分块发送
-        chunk_size = 8000  # 每块大小约8KB，减小块大小以避免解析问题
-        total_chunks = (len(json_str) + chunk_size - 1) // chunk_size
-
-        # 发送开始标记
-        print(json.dumps({
-            "status": "stream_start",
-            "total_chunks": total_chunks,
-            "requestId": request_id
-        }), flush=True)
-
-        # 分块发送数据
-        for i in range(total_chunks):
-            chunk = json_str[i * chunk_size:(i + 1) * chunk_size]
-            print(json.dumps({
-                "status": "stream_chunk",
-                "chunk_index": i,
-                "chunk_data": chunk,
-                "requestId": request_id
-            }), flush=True)
-            # 添加小延迟，避免数据发送过快导致接收端缓冲区溢出
-            import time
-            time.sleep(0.01)
-
-        # 发送结束标记
-        print(json.dumps({
-            "status": "stream_end",
-            "requestId": request_id
-        }), flush=True)
+        self._send_message(error, request_id)
 
 
 if __name__ == "__main__":
+    # 打包后的程序启动执行引擎的子进程时需要
+    multiprocessing.freeze_support()
     server = IPCServer()
     server.start()
@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+用户代码的资源限制
+
+每次运行可以限制墙钟时间、CPU时间、地址空间和捕获的输出大小，限制值来自server.ini：
+    [limits]              全局默认值
+    [limits:<命令名>]      按命令覆盖，例如 [limits:run_code_simple]
+    [limits:<教程名>]      按教程覆盖，例如 [limits:文件操作]，优先级最高
+值为0表示不限制。CPU时间和内存限制依赖resource模块，Windows上只生效时间和输出限制。
+"""
+
+import io
+import sys
+import math
+import time
+import signal
+import _thread
+import threading
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+from config_loader import load_server_config
+from compile_cache import get_compile_cache, HIT_MISS
+
+try:
+    import resource
+except ImportError:
+    # Windows没有resource模块
+    resource = None
+
+DEFAULT_LIMITS = {
+    "timeout": 10.0,      # 墙钟时间（秒）
+    "cpu_time": 10,       # CPU时间（秒）
+    "memory_mb": 512,     # 运行期间新增的地址空间（MB）
+    "max_output": 100000  # 捕获的输出字符数
+}
+
+LIMIT_TIMEOUT = "timeout"
+LIMIT_CPU = "cpu"
+LIMIT_MEMORY = "memory"
+LIMIT_OUTPUT = "output"
+
+# 输出流名称
+STREAM_STDOUT = "stdout"
+STREAM_STDERR = "stderr"
+
+LIMIT_MESSAGES = {
+    LIMIT_TIMEOUT: "运行超时（超过{timeout}秒），已终止",
+    LIMIT_CPU: "CPU时间超过{cpu_time}秒，已终止",
+    LIMIT_MEMORY: "内存使用超过{memory_mb}MB，已终止",
+    LIMIT_OUTPUT: "输出超过{max_output}个字符，其余内容已省略"
+}
+
+
+class CPULimitExceeded(BaseException):
+    """CPU时间超限（由SIGXCPU触发）"""
+
+
+def resolve_limits(command=None, tutorial_key=None):
+    """按 默认值 < 命令 < 教程 的优先级合并限制"""
+    config = load_server_config()
+    limits = dict(DEFAULT_LIMITS)
+    for section in ("limits", f"limits:{command}" if command else None,
+                    f"limits:{tutorial_key}" if tutorial_key else None):
+        if not section or not config.has_section(section):
+            continue
+        for key, default in DEFAULT_LIMITS.items():
+            if not config.has_option(section, key):
+                continue
+            try:
+                limits[key] = type(default)(config.get(section, key))
+            except ValueError:
+                pass
+    return limits
+
+
+def format_limit_message(limit, limits):
+    """返回限制被触发时附加到输出末尾的说明"""
+    return LIMIT_MESSAGES[limit].format(**limits)
+
+
+class CappedOutput(io.TextIOBase):
+    """只保留前limit个字符的输出缓冲区，超出部分直接丢弃；保留的内容同时转发给sink"""
+
+    def __init__(self, limit, sink=None):
+        self.limit = limit
+        self.sink = sink
+        self.truncated = False
+        self._parts = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if self.truncated:
+            return len(text)
+        if self.limit and self._size + len(text) > self.limit:
+            kept = text[:self.limit - self._size]
+            self._size = self.limit
+            self.truncated = True
+        else:
+            kept = text
+            self._size += len(text)
+        self._parts.append(kept)
+        if self.sink is not None and kept:
+            self.sink(kept)
+        return len(text)
+
+    def getvalue(self):
+        return ''.join(self._parts)
+
+
+def _current_address_space():
+    """当前进程的虚拟内存大小（字节），无法获取时返回None（仅Linux支持）"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[0])
+        return pages * resource.getpagesize()
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _apply_rlimits(limits):
+    """设置CPU时间与地址空间的软限制，返回用于恢复的原值"""
+    saved = {}
+    if resource is None:
+        return saved
+
+    if limits["cpu_time"] and hasattr(resource, "RLIMIT_CPU"):
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        # RLIMIT_CPU按进程累计，需要在已用时间的基础上增加
+        target = math.ceil(time.process_time()) + limits["cpu_time"]
+        if hard != resource.RLIM_INFINITY:
+            target = min(target, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_CPU, (target, hard))
+            saved[resource.RLIMIT_CPU] = (soft, hard)
+        except (ValueError, OSError):
+            pass
+
+    baseline = _current_address_space() if limits["memory_mb"] and hasattr(resource, "RLIMIT_AS") else None
+    if baseline is not None:
+        soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+        target = baseline + limits["memory_mb"] * 1024 * 1024
+        if hard != resource.RLIM_INFINITY:
+            target = min(target, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (target, hard))
+            saved[resource.RLIMIT_AS] = (soft, hard)
+        except (ValueError, OSError):
+            pass
+    return saved
+
+
+def _restore_rlimits(saved):
+    for limit_id, value in saved.items():
+        try:
+            resource.setrlimit(limit_id, value)
+        except (ValueError, OSError):
+            pass
+
+
+def _peak_rss_kb():
+    """
+    进程启动以来的峰值常驻内存（KB），不支持时返回None
+    工作进程会连续运行多份代码，这是整个进程生命周期的最高值，不是单次运行的峰值
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS以字节为单位，Linux以KB为单位
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def run_governed(code, globals_, locals_, limits, on_output=None):
+    """
+    在当前线程中按限制运行代码
+    返回{"success", "output", "stderr", "limit", "usage"}，limit为触发的限制名称，未触发时为None
+    usage中的worker_peak_rss_kb为运行进程的生命周期峰值内存（见_peak_rss_kb），不代表本次运行的用量
+    on_output(stream, text)在程序写出内容时被调用，stream为"stdout"或"stderr"；
+    异常信息和限制说明作为stderr在最后转发一次
+    时间限制通过中断主线程实现，只有在主线程中调用时才生效
+    """
+    if on_output is not None:
+        output = CappedOutput(limits["max_output"], lambda text: on_output(STREAM_STDOUT, text))
+        errors = CappedOutput(limits["max_output"], lambda text: on_output(STREAM_STDERR, text))
+    else:
+        output = CappedOutput(limits["max_output"])
+        errors = CappedOutput(limits["max_output"])
+    limit_hit = None
+    success = False
+    text = ""
+
+    # 超时后中断主线程；用锁保证代码结束后不会再发出中断
+    state = {"running": True, "fired": False}
+    state_lock = threading.Lock()
+
+    def on_timeout():
+        with state_lock:
+            if state["running"]:
+                state["fired"] = True
+                _thread.interrupt_main()
+
+    timer = None
+    if limits["timeout"] and threading.current_thread() is threading.main_thread():
+        timer = threading.Timer(limits["timeout"], on_timeout)
+        timer.daemon = True
+
+    previous_xcpu = None
+    if hasattr(signal, "SIGXCPU") and threading.current_thread() is threading.main_thread():
+        def on_xcpu(signum, frame):
+            raise CPULimitExceeded()
+        previous_xcpu = signal.signal(signal.SIGXCPU, on_xcpu)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    saved = {}
+    compile_ms = None
+    compile_hit = HIT_MISS
+    try:
+        try:
+            # 语法错误同样在这里抛出，按普通异常返回回溯信息
+            code, compile_ms, compile_hit = get_compile_cache().compile(code)
+            saved = _apply_rlimits(limits)
+            if timer is not None:
+                timer.start()
+            with redirect_stdout(output), redirect_stderr(errors):
+                exec(code, globals_, locals_)
+            success = True
+        except SystemExit:
+            # 用户代码调用exit()时视为正常结束
+            success = True
+        except KeyboardInterrupt:
+            if not state["fired"]:
+                text = traceback.format_exc()
+            limit_hit = LIMIT_TIMEOUT if state["fired"] else None
+        except CPULimitExceeded:
+            limit_hit = LIMIT_CPU
+        except MemoryError:
+            limit_hit = LIMIT_MEMORY if saved.get(getattr(resource, "RLIMIT_AS", None)) else None
+            text = "" if limit_hit else traceback.format_exc()
+        except BaseException:
+            text = traceback.format_exc()
+        finally:
+            with state_lock:
+                state["running"] = False
+            if timer is not None:
+                timer.cancel()
+            _restore_rlimits(saved)
+    except KeyboardInterrupt:
+        # 中断恰好在代码结束时到达
+        limit_hit = LIMIT_TIMEOUT
+        success = False
+    finally:
+        if previous_xcpu is not None:
+            signal.signal(signal.SIGXCPU, previous_xcpu)
+
+    # 程序自身未写出、只出现在最终结果中的内容（异常信息、限制说明）
+    trailer = text
+    if success:
+        text = output.getvalue()
+        if output.truncated or errors.truncated:
+            limit_hit = LIMIT_OUTPUT
+    elif limit_hit is not None:
+        # 保留触发限制前已经产生的输出
+        text = output.getvalue()
+    if limit_hit is not None:
+        notice = f"[{format_limit_message(limit_hit, limits)}]\n"
+        trailer += notice
+        text += ("\n" if text and not text.endswith("\n") else "") + notice
+    if on_output is not None and trailer:
+        on_output(STREAM_STDERR, trailer)
+
+    return {
+        "success": success,
+        "output": text,
+        "stderr": errors.getvalue(),
+        "limit": limit_hit,
+        "usage": {
+            "wall_ms": round((time.perf_counter() - start_wall) * 1000, 2),
+            "cpu_ms": round((time.process_time() - start_cpu) * 1000, 2),
+            "worker_peak_rss_kb": _peak_rss_kb(),
+            "compile_ms": compile_ms,
+            "compile_cache": compile_hit
+        }
+    }
@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ipc_server的端到端压测
+
+把python-server复制到临时目录，在副本的config.ini中把模型地址指向本地的FakeModelServer
+（见fake_model_server.py），server.ini的缓存目录改到临时目录并默认关闭AI回复缓存，
+然后以子进程启动ipc_server.py，按与Electron主进程相同的方式通过标准输入/输出收发消息。
+按给定的命令比例（get_tutorial、run_code、get_hint、get_solution）保持固定数量的未完成请求，
+结束后按命令报告吞吐量和p50/p95/p99延迟。不会修改源码目录中的配置文件和用户的缓存目录。
+
+使用方法：
+    python load_test.py [--concurrency 8] [--duration 30 | --requests 500]
+                        [--mix get_tutorial=4,run_code=4,get_hint=1,get_solution=1]
+                        [--stream-ai] [--no-cache] [--ai-cache] [--json 结果.json]
+                        [--latency-ms 300] [--token-delay-ms 20] [--reply-tokens 40]
+                        [--error-rate 0] [--rate-limit-rate 0] [--seed 0]
+"""
+
+import sys
+import json
+import time
+import random
+import itertools
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from configparser import ConfigParser
+from md_parser import extract_code_blocks
+from fake_model_server import FakeModelServer
+
+SERVER_DIR = Path(__file__).parent
+DEFAULT_MIX = "get_tutorial=4,run_code=4,get_hint=1,get_solution=1"
+# 等待单个请求的上限（秒），超过后记为超时
+REQUEST_TIMEOUT = 120
+# 读取失败或进程退出时的占位结果
+_LOST = {"status": "error", "message": "ipc_server已退出"}
+
+
+def parse_mix(text):
+    """把"命令=权重,..."解析为[(命令, 权重)]"""
+    mix = []
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        command, _, weight = item.partition("=")
+        mix.append((command.strip(), float(weight or 1)))
+    if not mix:
+        raise ValueError("命令比例为空")
+    return mix
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * fraction))], 2)
+
+
+def prepare_server_dir(workdir, base_url, ai_cache=False):
+    """复制python-server到workdir，改写模型配置和服务端参数，返回副本目录"""
+    target = Path(workdir) / "python-server"
+    shutil.copytree(SERVER_DIR, target, ignore=shutil.ignore_patterns(
+        "__pycache__", "dist", "build", "*.7z", "*.spec"))
+
+    model = ConfigParser()
+    model["load-test"] = {"api_key": "load-test", "base_url": base_url}
+    with open(target / "config.ini", "w") as f:
+        model.write(f)
+
+    server = ConfigParser()
+    server.read(target / "server.ini", encoding="utf-8")
+    for section in ("paths", "ai_cache", "golden"):
+        if not server.has_section(section):
+            server.add_section(section)
+    server.set("paths", "cache_dir", str(Path(workdir) / "cache"))
+    if not ai_cache:
+        # 否则同样的提示请求第二次起都命中缓存，测不到模型调用路径
+        for operation in ("evaluate", "hint", "solution"):
+            server.set("ai_cache", operation, "false")
+    with open(target / "server.ini", "w", encoding="utf-8") as f:
+        server.write(f)
+    return target
+
+
+class IPCClient:
+    """通过标准输入/输出与ipc_server子进程通信，按requestId匹配响应"""
+
+    def __init__(self, server_dir):
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", "ipc_server.py"],
+            cwd=server_dir,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            encoding="utf-8"
+        )
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._chunks = {}
+        self._ids = itertools.count(1)
+        self.intermediate = 0
+        self._ready = threading.Event()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+        if not self._ready.wait(60):
+            self.close()
+            raise RuntimeError("ipc_server没有在60秒内启动")
+
+    def _read_loop(self):
+        for line in self.process.stdout:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            self._handle(message)
+        # 进程退出，唤醒所有等待中的请求
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for slot in pending.values():
+            slot["response"] = _LOST
+            slot["event"].set()
+
+    def _handle(self, message):
+        status = message.get("status")
+        request_id = message.get("requestId")
+        if status == "ready":
+            self._ready.set()
+        elif status == "stream_start":
+            self._chunks[request_id] = [None] * message["total_chunks"]
+        elif status == "stream_chunk":
+            self._chunks[request_id][message["chunk_index"]] = message["chunk_data"]
+        elif status == "stream_end":
+            self._complete(request_id, json.loads("".join(self._chunks.pop(request_id))))
+        elif status in ("output", "delta", "item"):
+            self.intermediate += 1
+        elif request_id:
+            self._complete(request_id, message)
+
+    def _complete(self, request_id, response):
+        with self._lock:
+            slot = self._pending.pop(request_id, None)
+        if slot is not None:
+            slot["response"] = response
+            slot["event"].set()
+
+    def request(self, command, payload, timeout=REQUEST_TIMEOUT):
+        """发送请求并等待最终响应，返回响应消息"""
+        request_id = f"load-{next(self._ids)}"
+        slot = {"event": threading.Event(), "response": None}
+        with self._lock:
+            self._pending[request_id] = slot
+        line = json.dumps({"command": command, "payload": payload, "requestId": request_id})
+        # ipc_server对输入行做unicode_escape解码，反斜杠需要再转义一次
+        line = line.replace("\\", "\\\\")
+        try:
+            with self._write_lock:
+                self.process.stdin.write(line + "\n")
+                self.process.stdin.flush()
+        except OSError:
+            return _LOST
+        if not slot["event"].wait(timeout):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            return {"status": "error", "message": "请求超时"}
+        return slot["response"]
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Workload:
+    """按比例随机生成请求；种子相同时请求序列相同"""
+
+    def __init__(self, mix, tutorials, seed=0, stream_ai=False, no_cache=False):
+        self.commands = [command for command, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.tutorials = tutorials
+        self.stream_ai = stream_ai
+        self.no_cache = no_cache
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # 教程中不读取输入的代码块作为运行和提示请求的代码
+        self.snippets = [code for _, code in self._code_blocks() if "input(" not in code] or ["print('hello')"]
+
+    @staticmethod
+    def _code_blocks():
+        for md_file in sorted((SERVER_DIR / "notes").glob("*.md")):
+            for code in extract_code_blocks(md_file.read_text(encoding="utf-8")):
+                yield md_file.name, code
+
+    def next(self):
+        with self._lock:
+            command = self._random.choices(self.commands, self.weights)[0]
+            tutorial = self._random.choice(self.tutorials)
+            code = self._random.choice(self.snippets)
+            variant = self._random.randrange(1000)
+        if command == "get_tutorial":
+            return command, {"tutorialKey": tutorial}
+        if command in ("run_code", "run_code_simple"):
+            return command, {"code": code, "tutorialKey": tutorial, "noCache": self.no_cache}
+        if command in ("get_hint", "get_solution"):
+            # 用户代码带上序号，避免所有请求的提示词完全相同
+            return command, {
+                "code": f"{code}\nattempt = {variant}",
+                "expected_code": code,
+                "actual_output": "",
+                "stream": self.stream_ai
+            }
+        return command, {}
+
+
+def run_load(client, workload, concurrency, duration=None, requests=None):
+    """
+    保持concurrency个未完成请求，直到经过duration秒或发出requests个请求
+    返回(每个请求的[(命令, 延迟ms, 是否成功, 错误信息)], 总耗时秒)
+    """
+    records = []
+    lock = threading.Lock()
+    issued = [0]
+    start = time.perf_counter()
+    deadline = start + duration if duration else None
+
+    def worker():
+        while True:
+            with lock:
+                if requests is not None and issued[0] >= requests:
+                    return
+                if deadline is not None and time.perf_counter() >= deadline:
+                    return
+                issued[0] += 1
+            command, payload = workload.next()
+            sent = time.perf_counter()
+            response = client.request(command, payload)
+            elapsed = (time.perf_counter() - sent) * 1000
+            ok = response.get("status") == "success"
+            error = None if ok else response.get("message") or response.get("status")
+            with lock:
+                records.append((command, elapsed, ok, error))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(max(1, concurrency))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+
+def summarize(records, elapsed):
+    """按命令汇总：请求数、失败数、吞吐量和延迟分位数"""
+    by_command = {}
+    for command, latency, ok, error in records:
+        entry = by_command.setdefault(command, {"latencies": [], "errors": 0, "error_samples": []})
+        entry["latencies"].append(latency)
+        if not ok:
+            entry["errors"] += 1
+            if len(entry["error_samples"]) < 3 and error not in entry["error_samples"]:
+                entry["error_samples"].append(error)
+
+    def stats(latencies, errors):
+        return {
+            "requests": len(latencies),
+            "errors": errors,
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+            "p50_ms": percentile(latencies, 0.50),
+            "p95_ms": percentile(latencies, 0.95),
+            "p99_ms": percentile(latencies, 0.99),
+            "max_ms": round(max(latencies), 2) if latencies else None
+        }
+
+    summary = {
+        command: dict(stats(entry["latencies"], entry["errors"]), error_samples=entry["error_samples"])
+        for command, entry in sorted(by_command.items())
+    }
+    summary["total"] = stats([record[1] for record in records], sum(1 for record in records if not record[2]))
+    return summary
+
+
+def _print_summary(summary, elapsed):
+    print(f"\n耗时 {elapsed:.1f} 秒")
+    print(f"{'命令':<16} {'请求数':>8} {'失败':>6} {'req/s':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} "
+          f"{'max ms':>10}")
+    for command, stats in summary.items():
+        print(f"{command:<16} {stats['requests']:>8} {stats['errors']:>6} {stats['throughput_rps']:>8} "
+              f"{stats['p50_ms']:>10} {stats['p95_ms']:>10} {stats['p99_ms']:>10} {stats['max_ms']:>10}")
+        for sample in stats.get("error_samples") or []:
+            print(f"    错误示例: {str(sample)[:120]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ipc_server的端到端压测")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时未完成的请求数")
+    parser.add_argument("--duration", type=float, default=None, help="压测时长（秒），默认30")
+    parser.add_argument("--requests", type=int, default=None, help="总请求数，指定后不按时长结束")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"命令及权重，默认 {DEFAULT_MIX}")
+    parser.add_argument("--stream-ai", action="store_true", help="提示和解决方案使用流式响应")
+    parser.add_argument("--no-cache", action="store_true", help="运行代码时跳过运行结果缓存")
+    parser.add_argument("--ai-cache", action="store_true", help="保留AI回复缓存（默认关闭）")
+    parser.add_argument("--seed", type=int, default=0, help="请求序列和错误注入的随机种子")
+    parser.add_argument("--json", default=None, help="把汇总结果保存为JSON")
+    parser.add_argument("--latency-ms", type=float, default=300, help="模型服务返回第一个token前的延迟")
+    parser.add_argument("--token-delay-ms", type=float, default=20, help="流式回复中相邻片段的间隔")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="每次回复的片段数")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="模型服务返回500的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="模型服务返回429的比例")
+    parser.add_argument("--jitter", type=float, default=0.0, help="模型服务延迟的随机浮动比例")
+    args = parser.parse_args()
+    duration = args.duration if args.duration or args.requests else 30.0
+
+    model_server = FakeModelServer(latency_ms=args.latency_ms, token_delay_ms=args.token_delay_ms,
+                                   reply_tokens=args.reply_tokens, error_rate=args.error_rate,
+                                   rate_limit_rate=args.rate_limit_rate, jitter=args.jitter,
+                                   seed=args.seed).start()
+    with tempfile.TemporaryDirectory(prefix="ipc-load-") as workdir:
+        server_dir = prepare_server_dir(workdir, model_server.base_url, args.ai_cache)
+        client = IPCClient(server_dir)
+        try:
+            tutorials = [item["key"] for item in client.request("get_tutorials", {})["data"]["tutorials"]]
+            workload = Workload(parse_mix(args.mix), tutorials, args.seed, args.stream_ai, args.no_cache)
+            print(f"模型服务 {model_server.base_url}，并发 {args.concurrency}，"
+                  f"{f'{args.requests} 个请求' if args.requests else f'{duration} 秒'}，命令比例 {args.mix}")
+            records, elapsed = run_load(client, workload, args.concurrency, duration if not args.requests else None,
+                                        args.requests)
+            ai_status = client.request("ai_status", {}).get("data")
+        finally:
+            client.close()
+            model_server.stop()
+
+    summary = summarize(records, elapsed)
+    _print_summary(summary, elapsed)
+    print(f"\n模型服务: {model_server.stats}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "config": vars(args),
+                "elapsed_s": round(elapsed, 2),
+                "commands": summary,
+                "model_server": model_server.stats,
+                "ai_status": ai_status,
+                "intermediate_messages": client.intermediate
+            }, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存: {args.json}")
+    return 0 if summary["total"]["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
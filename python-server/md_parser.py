@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+教程Markdown解析器
+
+单次线性扫描整篇文档，识别二级标题（## ）分出的章节以及其中的围栏代码块
+（```python、其他语言、~~~）。章节与代码块只记录在共享文本中的偏移，
+文本在序列化（to_dict）时才切片生成，适合处理数MB的章节。
+"""
+
+import re
+
+# 只匹配可能影响结构的行：二级标题，或缩进不超过3个空格的围栏
+_STRUCTURE_PATTERN = re.compile(
+    r'^(?:## (?P<title>.*)|(?P<indent> {0,3})(?P<fence>`{3,}|~{3,})(?P<info>.*))$',
+    re.MULTILINE
+)
+
+
+class CodeBlock:
+    """围栏代码块，start/end为代码正文在共享文本中的偏移，indent为围栏的缩进"""
+
+    __slots__ = ("source", "lang", "indent", "start", "end")
+
+    def __init__(self, source, lang, indent, start, end):
+        self.source = source
+        self.lang = lang
+        self.indent = indent
+        self.start = start
+        self.end = end
+
+    @property
+    def is_exercise(self):
+        """顶格的python代码块作为练习；列表中缩进的代码片段只是示意，不计入练习序号"""
+        return self.lang == "python" and self.indent == 0
+
+    @property
+    def text(self):
+        return self.source[self.start:self.end]
+
+
+class Section:
+    """以二级标题开始的章节，start/end为整个章节（含标题行）在共享文本中的偏移"""
+
+    __slots__ = ("source", "title", "start", "end", "blocks")
+
+    def __init__(self, source, title, start):
+        self.source = source
+        self.title = title
+        self.start = start
+        self.end = start
+        self.blocks = []
+
+    @property
+    def content(self):
+        return self.source[self.start:self.end]
+
+    def code_blocks(self):
+        """返回练习代码块的文本"""
+        return [block.text for block in self.blocks if block.is_exercise]
+
+    @property
+    def size(self):
+        """章节内容的字符数"""
+        return self.end - self.start
+
+    def to_dict(self):
+        """序列化为接口使用的字典"""
+        return {
+            "title": self.title,
+            "content": self.content,
+            "code_blocks": self.code_blocks()
+        }
+
+    def to_outline(self, section_id):
+        """序列化为目录条目，不包含正文"""
+        return {
+            "id": section_id,
+            "title": self.title,
+            "size": self.size,
+            "code_block_count": sum(1 for block in self.blocks if block.is_exercise)
+        }
+
+
+class MarkdownDocument:
+    """解析后的教程文档"""
+
+    __slots__ = ("source", "title", "sections")
+
+    def __init__(self, source, title, sections):
+        self.source = source
+        self.title = title
+        self.sections = sections
+
+    def to_dict(self):
+        """序列化为接口使用的字典"""
+        return {
+            "title": self.title,
+            "sections": [section.to_dict() for section in self.sections]
+        }
+
+    def outline(self):
+        """返回教程目录：标题、章节id、大小和练习数量"""
+        return {
+            "title": self.title,
+            "sections": [section.to_outline(i) for i, section in enumerate(self.sections)]
+        }
+
+    def section(self, section_id):
+        """按id返回单个章节，id不存在时抛出IndexError"""
+        if not isinstance(section_id, int) or not 0 <= section_id < len(self.sections):
+            raise IndexError(section_id)
+        return dict(self.sections[section_id].to_dict(), id=section_id)
+
+
+def _tokenize(source):
+    """单次扫描，按出现顺序产出("heading", 标题, 行首偏移)与CodeBlock"""
+    fence = None  # (围栏字符, 长度, 语言, 缩进, 正文起点)
+
+    for match in _STRUCTURE_PATTERN.finditer(source):
+        marker = match.group("fence")
+
+        if fence is not None:
+            # 代码块内只关心闭合围栏：相同字符、长度不小于开头、没有信息字符串
+            # 因此代码块中的“## ”不会被当作标题
+            if (marker and marker[0] == fence[0] and len(marker) >= fence[1]
+                    and not match.group("info").strip()):
+                yield CodeBlock(source, fence[2], fence[3], fence[4], max(fence[4], match.start() - 1))
+                fence = None
+            continue
+
+        if marker:
+            info = match.group("info").strip()
+            # 反引号围栏的信息字符串中不能再出现反引号
+            if marker[0] == '`' and '`' in info:
+                continue
+            lang = info.split()[0] if info else ""
+            fence = (marker[0], len(marker), lang, len(match.group("indent")), match.end() + 1)
+            continue
+
+        yield "heading", match.group("title"), match.start()
+
+
+def iter_sections(md_content):
+    """逐个产出章节，第一个二级标题之前的内容不属于任何章节"""
+    # 末尾补一个换行，使最后一个章节与按行拼接的旧实现结果一致
+    source = md_content + '\n'
+    current = None
+
+    for token in _tokenize(source):
+        if isinstance(token, CodeBlock):
+            if current is not None:
+                current.blocks.append(token)
+            continue
+
+        if current is not None:
+            current.end = token[2]
+            if current.title:
+                yield current
+        current = Section(source, token[1], token[2])
+
+    if current is not None:
+        current.end = len(source)
+        if current.title:
+            yield current
+
+
+def parse_document(md_content):
+    """解析整篇教程，标题取自第一行"""
+    first_line_end = md_content.find('\n')
+    first_line = md_content if first_line_end == -1 else md_content[:first_line_end]
+    return MarkdownDocument(md_content, first_line.lstrip('#').strip(), list(iter_sections(md_content)))
+
+
+def extract_sections(md_content):
+    """从Markdown内容中提取章节"""
+    return [section.to_dict() for section in iter_sections(md_content)]
+
+
+def extract_code_blocks(md_content):
+    """从Markdown内容中提取Python代码块"""
+    return [token.text for token in _tokenize(md_content + '\n')
+            if isinstance(token, CodeBlock) and token.is_exercise]
@@ -0,0 +1,304 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+AI提示词构建
+
+系统消息由固定的角色说明和各操作的任务说明组成，不含任何用户数据，
+同一操作的每次请求前缀完全相同，可以利用服务商的提示词前缀缓存；用户数据只出现在最后一条消息中。
+各字段按server.ini中的token预算压缩：
+    代码  去掉注释和多余空行，超出预算时保留首尾
+    输出  回溯信息只保留用户代码中的调用帧，连续重复的行合并，超出预算时保留首尾
+token数按字符估算（非ASCII字符每个约1个token，其余约4个字符1个token），用于预算和统计，不要求精确。
+"""
+
+import io
+import re
+import math
+import tokenize
+import threading
+from config_loader import get_server_option
+from ai_cache import OP_EVALUATE, OP_HINT, OP_SOLUTION
+
+SYSTEM_PROMPT = "你是一个资深的Python编程助手"
+
+# 各操作的任务说明，作为系统消息的一部分保持不变
+TASK_HINT = """根据用户提供的信息给出简短的代码提示（1-2句话）。
+请指出问题关键，不要提供完整代码。"""
+
+TASK_SOLUTION = """根据用户提供的信息给出详细解决方案。
+只需要包含正确代码，不需要解释。"""
+
+TASK_EVALUATE = """请评估用户代码是否正确实现了示例代码的功能。
+请分析两段代码的功能是否等价，不要只关注代码的相似性和返回结果的一致性，而是关注功能的一致性。
+当返回结果相同时，请检查用户代码是否实现了与示例代码相同的功能以及输出的内容是否和上下文产生联系。
+如果用户代码实现了与示例代码相同的功能，请回复：'通过'
+如果用户代码没有实现预期功能，请回复：'不通过，原因：<简要说明原因>'"""
+
+# 用户代码编译时使用的文件名，回溯中只有这些帧与用户有关
+_USER_FRAME_PREFIX = '  File "<string>"'
+_TRACEBACK_HEADER = "Traceback (most recent call last):"
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def count_tokens(text):
+    """估算文本的token数"""
+    if not text:
+        return 0
+    wide = len(_NON_ASCII.findall(text))
+    return wide + math.ceil((len(text) - wide) / 4)
+
+
+def _take_tokens(text, budget):
+    """返回text开头不超过budget个token的部分"""
+    used = 0.0
+    for index, char in enumerate(text):
+        used += 1.0 if ord(char) > 0x7f else 0.25
+        if used > budget:
+            return text[:index]
+    return text
+
+
+def truncate_middle(text, max_tokens):
+    """超出预算时保留开头和结尾各一半，中间替换为省略说明"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    half = max(1, max_tokens // 2)
+    head = _take_tokens(text, half)
+    tail = _take_tokens(text[::-1], half)[::-1]
+    # 尽量在整行处截断
+    if "\n" in head:
+        head = head[:head.rindex("\n")]
+    if "\n" in tail:
+        tail = tail[tail.index("\n") + 1:]
+    omitted = text[len(head):len(text) - len(tail)]
+    return f"{head}\n…（省略{omitted.count(chr(10)) + 1}行，约{count_tokens(omitted)}个token）…\n{tail}"
+
+
+def collapse_repeats(text, min_repeats=3):
+    """连续出现min_repeats次以上的相同行只保留一行"""
+    lines = text.split("\n")
+    result = []
+    index = 0
+    while index < len(lines):
+        end = index + 1
+        while end < len(lines) and lines[end] == lines[index]:
+            end += 1
+        result.append(lines[index])
+        if end - index >= min_repeats:
+            result.append(f"…（上一行重复{end - index - 1}次）")
+        else:
+            result.extend(lines[index + 1:end])
+        index = end
+    return "\n".join(result)
+
+
+def compact_traceback(text, max_frames=None):
+    """
+    回溯信息只保留用户代码中的调用帧（没有时保留最后一帧），
+    用户帧超过max_frames个时保留最外层和最内层的几帧，例如深度递归
+    """
+    if _TRACEBACK_HEADER not in text:
+        return text
+    if max_frames is None:
+        max_frames = get_server_option("prompt", "max_traceback_frames", 6)
+    max_frames = max(2, max_frames)
+    lines = text.split("\n")
+    result = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        index += 1
+        result.append(line)
+        if not line.startswith(_TRACEBACK_HEADER):
+            continue
+        # 调用帧：File行及其后缩进的源码行、^标记和"[Previous line repeated ...]"
+        frames = []
+        while index < len(lines) and lines[index].startswith("  "):
+            if lines[index].startswith('  File "') or not frames:
+                frames.append([lines[index]])
+            else:
+                frames[-1].append(lines[index])
+            index += 1
+        user_frames = [frame for frame in frames if frame[0].startswith(_USER_FRAME_PREFIX)] or frames[-1:]
+        if len(user_frames) > max_frames:
+            outer = max_frames // 2
+            inner = max_frames - outer
+            skipped = len(user_frames) - max_frames
+            user_frames = user_frames[:outer] + [[f"  …（省略{skipped}个调用帧）…"]] + user_frames[-inner:]
+        for frame in user_frames:
+            result.extend(frame)
+    return "\n".join(result)
+
+
+# 3.12起f-string被切分为多个词法单元，整个f-string从FSTRING_START到FSTRING_END
+_FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+_FSTRING_END = getattr(tokenize, "FSTRING_END", None)
+
+
+def strip_comments(code):
+    """
+    去掉注释、行尾空白和空行，字符串（包括多行字符串）的内容保持不变；代码无法解析时原样返回
+    """
+    lines = code.split("\n")
+    comments = {}
+    # 行尾位于字符串内部的行，不能修改
+    in_string = set()
+    fstring_starts = []
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(code).readline):
+            if token.type == tokenize.COMMENT:
+                comments[token.start[0]] = token.start[1]
+            elif token.type == tokenize.STRING:
+                in_string.update(range(token.start[0], token.end[0]))
+            elif token.type == _FSTRING_START:
+                fstring_starts.append(token.start[0])
+            elif token.type == _FSTRING_END:
+                in_string.update(range(fstring_starts.pop(), token.end[0]))
+    except (tokenize.TokenError, IndentationError, SyntaxError):
+        return code
+    result = []
+    for row, line in enumerate(lines, 1):
+        if row in in_string:
+            result.append(line)
+            continue
+        if row in comments:
+            line = line[:comments[row]]
+        line = line.rstrip()
+        if line:
+            result.append(line)
+    return "\n".join(result)
+
+
+def compact_code(code, max_tokens):
+    return truncate_middle(strip_comments(code or ""), max_tokens)
+
+
+def compact_output(output, max_tokens):
+    return truncate_middle(collapse_repeats(compact_traceback(str(output or ""))), max_tokens)
+
+
+def _budget(name, default):
+    return get_server_option("prompt", name, default)
+
+
+def build_prompt(operation, task, fields):
+    """
+    构建一次请求的消息列表
+    fields: [(标签, 文本, 类型)]，类型为"code"或"output"，按对应的预算压缩
+    返回{"operation", "messages", "prompt_tokens", "original_tokens"}，后两项为估算值
+    """
+    compact = get_server_option("prompt", "compact", True)
+    budgets = {"code": _budget("code_tokens", 1500), "output": _budget("output_tokens", 600)}
+    system = f"{SYSTEM_PROMPT}\n\n{task}" if task else SYSTEM_PROMPT
+    parts = []
+    original_tokens = count_tokens(system)
+    for label, text, kind in fields:
+        text = "" if text is None else str(text)
+        original_tokens += count_tokens(text)
+        if compact:
+            text = compact_code(text, budgets[kind]) if kind == "code" else compact_output(text, budgets[kind])
+        parts.append(f"{label}：\n{text}" if label else text)
+    user = "\n\n".join(parts)
+    return {
+        "operation": operation,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user}
+        ],
+        "prompt_tokens": count_tokens(system) + count_tokens(user),
+        "original_tokens": original_tokens
+    }
+
+
+def _with_example_output(fields, example_output):
+    """有预先生成的示例运行结果（见golden_outputs）时附在最后"""
+    if example_output is not None:
+        fields.append(("示例代码输出", example_output, "output"))
+    return fields
+
+
+def hint_prompt(user_code, expected_output, actual_output, example_output=None):
+    return build_prompt(OP_HINT, TASK_HINT, _with_example_output([
+        ("用户代码", user_code, "code"),
+        # 调用方传入的expected_output是示例代码，按代码压缩
+        ("预期输出", expected_output, "code"),
+        ("实际输出", actual_output, "output")
+    ], example_output))
+
+
+def solution_prompt(user_code, expected_output, actual_output, example_output=None):
+    return build_prompt(OP_SOLUTION, TASK_SOLUTION, _with_example_output([
+        ("用户代码", user_code, "code"),
+        # 调用方传入的expected_output是示例代码，按代码压缩
+        ("预期输出", expected_output, "code"),
+        ("实际输出", actual_output, "output")
+    ], example_output))
+
+
+def evaluate_prompt(expected_code, user_code, user_output, example_output=None):
+    return build_prompt(OP_EVALUATE, TASK_EVALUATE, _with_example_output([
+        ("示例代码", expected_code, "code"),
+        ("用户代码", user_code, "code"),
+        ("用户代码输出", user_output, "output")
+    ], example_output))
+
+
+def plain_prompt(operation, text):
+    """不带任务说明、不压缩的单条消息，例如可用性测试"""
+    tokens = count_tokens(SYSTEM_PROMPT) + count_tokens(text)
+    return {
+        "operation": operation,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        "prompt_tokens": tokens,
+        "original_tokens": tokens
+    }
+
+
+class UsageStats:
+    """按操作累计的token用量"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._operations = {}
+
+    def record(self, prompt, usage):
+        """
+        记录一次调用；usage为usage_to_dict转换后的服务端用量，
+        未返回用量（例如出错）时为None，只累计估算值
+        """
+        usage = usage or {}
+        with self._lock:
+            stats = self._operations.setdefault(prompt["operation"], {
+                "calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_prompt_tokens": 0,
+                "estimated_prompt_tokens": 0, "saved_prompt_tokens": 0
+            })
+            stats["calls"] += 1
+            stats["prompt_tokens"] += usage.get("prompt_tokens") or 0
+            stats["completion_tokens"] += usage.get("completion_tokens") or 0
+            stats["cached_prompt_tokens"] += usage.get("cached_tokens") or 0
+            stats["estimated_prompt_tokens"] += prompt["prompt_tokens"]
+            stats["saved_prompt_tokens"] += max(0, prompt["original_tokens"] - prompt["prompt_tokens"])
+
+    def snapshot(self):
+        with self._lock:
+            return {operation: dict(stats) for operation, stats in self._operations.items()}
+
+
+def usage_to_dict(usage):
+    """把SDK返回的用量对象转换为字典，包含命中提示词缓存的token数"""
+    if usage is None:
+        return None
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    if cached is None and details is not None:
+        cached = getattr(details, "cached_tokens", None)
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "cached_tokens": cached
+    }
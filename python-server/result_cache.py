@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+确定性代码的运行结果缓存
+
+把代码解析为AST后规范化（忽略空白、注释和格式差异），判断是否为确定性代码：
+不读取输入、不使用随机数、时间、文件、网络、环境变量、对象地址等外部状态，只导入白名单中的纯计算模块，
+也不使用集合（字符串的哈希在每个进程中随机化，集合的迭代顺序可能随进程变化），不定义类
+（实例的默认repr包含对象地址）。
+确定性代码的运行结果按 规范化AST + 资源限制 缓存，再次提交时直接返回；
+非确定性代码总是重新运行。
+"""
+
+import re
+import ast
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from config_loader import get_server_option
+from limits import LIMIT_OUTPUT
+
+# 结果只取决于输入的标准库模块
+PURE_MODULES = {
+    "math", "cmath", "string", "re", "collections", "itertools", "functools", "operator",
+    "fractions", "decimal", "statistics", "heapq", "bisect", "copy", "enum", "dataclasses",
+    "typing", "json", "textwrap", "abc", "numbers", "keyword", "array", "unicodedata", "pprint"
+}
+
+# 读取外部状态或可以绕过分析的内置函数；id返回对象地址，hash对字符串的结果每个进程不同
+IMPURE_BUILTINS = {
+    "input", "open", "exec", "eval", "compile", "__import__", "breakpoint", "help",
+    "globals", "locals", "vars", "getattr", "setattr", "delattr", "memoryview", "exit", "quit",
+    "id", "hash"
+}
+
+# 迭代顺序取决于元素哈希的类型，集合字面量和集合推导式同样处理
+UNORDERED_BUILTINS = {"set", "frozenset"}
+
+# 可以取得任意对象或模块的属性与名称；__init__等普通的双下划线方法不受影响
+IMPURE_DUNDERS = {
+    "__builtins__", "__import__", "__loader__", "__spec__", "__class__", "__subclasses__",
+    "__globals__", "__dict__", "__code__", "__closure__", "__bases__", "__mro__",
+    "__getattribute__", "__reduce__", "__reduce_ex__"
+}
+
+# 只有这些限制被触发时结果仍是确定的；超时、CPU、内存与运行环境有关，不缓存
+CACHEABLE_LIMITS = {None, LIMIT_OUTPUT}
+
+# 默认repr中的对象地址，例如<function f at 0x7f...>，输出中含有地址的结果不缓存
+_ADDRESS_PATTERN = re.compile(r" at 0x[0-9a-fA-F]+>")
+
+
+def _module_root(name):
+    return (name or "").split(".")[0]
+
+
+def analyze(source):
+    """
+    返回(规范化键, 是否确定性)
+    语法错误时返回(None, False)，交给执行引擎给出错误信息
+    """
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return None, False
+
+    deterministic = True
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            if any(_module_root(alias.name) not in PURE_MODULES for alias in node.names):
+                deterministic = False
+        elif isinstance(node, ast.ImportFrom):
+            if node.level or _module_root(node.module) not in PURE_MODULES:
+                deterministic = False
+        elif isinstance(node, ast.Name):
+            if node.id in IMPURE_BUILTINS or node.id in IMPURE_DUNDERS or node.id in UNORDERED_BUILTINS:
+                deterministic = False
+        elif isinstance(node, (ast.Set, ast.SetComp)):
+            deterministic = False
+        elif isinstance(node, ast.ClassDef):
+            # 实例的默认repr包含对象地址，每次运行都不同
+            deterministic = False
+        elif isinstance(node, ast.Attribute):
+            if node.attr in IMPURE_DUNDERS:
+                deterministic = False
+        if not deterministic:
+            break
+
+    # ast.dump不包含行号和注释，格式差异不影响键
+    key = hashlib.sha1(ast.dump(tree, include_attributes=False).encode("utf-8")).hexdigest()
+    return key, deterministic
+
+
+class ResultCache:
+    """确定性代码运行结果的LRU缓存"""
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        """
+        max_entries: 最多缓存的结果数
+        max_bytes: 缓存输出的近似内存上限（字符数）
+        """
+        if max_entries is None:
+            max_entries = get_server_option("result_cache", "max_entries", 512)
+        if max_bytes is None:
+            max_bytes = get_server_option("result_cache", "max_bytes", 16 * 1024 * 1024)
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # key -> (size, result)
+        # 源码 -> (规范化键, 是否确定性)，避免重复解析同一份源码
+        self._analysis = OrderedDict()
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    def _analyze(self, source):
+        digest = hashlib.sha1(source.encode("utf-8", "surrogatepass")).hexdigest()
+        with self._lock:
+            cached = self._analysis.get(digest)
+            if cached is not None:
+                self._analysis.move_to_end(digest)
+                return cached
+        cached = analyze(source)
+        with self._lock:
+            self._analysis[digest] = cached
+            while len(self._analysis) > self.max_entries:
+                self._analysis.popitem(last=False)
+        return cached
+
+    def key_for(self, source, limits):
+        """返回可缓存时的键，非确定性代码返回None"""
+        key, deterministic = self._analyze(source)
+        if not deterministic:
+            with self._lock:
+                self.uncacheable += 1
+            return None
+        limits_key = json.dumps(limits, sort_keys=True)
+        return hashlib.sha1(f"{key}:{limits_key}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """返回缓存结果的副本，未命中时返回None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1], cached=True)
+
+    def put(self, key, result):
+        """缓存一次运行结果，触发了与环境有关的限制或输出中含有对象地址时不缓存"""
+        if result.get("limit") not in CACHEABLE_LIMITS:
+            return
+        if any(_ADDRESS_PATTERN.search(result.get(stream) or "") for stream in ("output", "stderr")):
+            with self._lock:
+                self.uncacheable += 1
+            return
+        size = len(result.get("output") or "") + len(result.get("stderr") or "")
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old[0]
+            self._entries[key] = (size, dict(result))
+            self._total_bytes += size
+            while self._entries and (len(self._entries) > self.max_entries
+                                     or self._total_bytes > self.max_bytes):
+                _, (old_size, _) = self._entries.popitem(last=False)
+                self._total_bytes -= old_size
+                self.evictions += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def clear(self):
+        """清空缓存的结果"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        """返回命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "bypassed": self.bypassed,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
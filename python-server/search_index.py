@@ -0,0 +1,341 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+教程全文搜索
+
+以章节为文档建立倒排索引，标题、正文、代码块分别记录倒排表，按BM25加权求和排序。
+中文按二元组切分，建立索引时同时记录单字，只搜索一个字时按单字匹配；英文和数字按单词切分并转为小写。
+索引持久化到缓存目录，启动时直接加载；notes目录下的文件变化后只重建变化的文件，
+检查文件变化的间隔见server.ini的[search] refresh_interval。
+"""
+
+import os
+import re
+import math
+import pickle
+import hashlib
+import time
+import threading
+from pathlib import Path
+from collections import Counter, defaultdict
+from md_parser import parse_document
+from config_loader import get_cache_dir, get_server_option
+
+INDEX_FORMAT = 2
+
+FIELD_HEADING = "heading"
+FIELD_PROSE = "prose"
+FIELD_CODE = "code"
+# 各字段的权重，标题命中最重要
+FIELD_WEIGHTS = {FIELD_HEADING: 3.0, FIELD_PROSE: 1.0, FIELD_CODE: 0.7}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 流程图不作为代码检索
+NON_CODE_LANGS = {"mermaid"}
+
+SNIPPET_RADIUS = 40
+
+_TOKEN_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[A-Za-z0-9_]+')
+_CJK_START = '\u3400'
+
+
+def tokenize(text, unigrams=False):
+    """
+    切分文本，返回词项列表
+    中文取二元组，单字成段时取单字；unigrams为真时（建立索引）另外记录每个单字，使单字查询也能命中
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text):
+        run = match.group()
+        if run[0] >= _CJK_START:
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+                if unigrams:
+                    tokens.extend(run)
+        else:
+            tokens.append(run.lower())
+    return tokens
+
+
+def _split_fields(section):
+    """把章节拆分为标题、正文、代码三个字段的文本"""
+    source = section.source
+    headings = []
+    prose = []
+    code = []
+    pos = section.start
+    for block in section.blocks:
+        # 代码块之前的文本，去掉围栏所在行
+        fence_line_start = source.rfind('\n', pos, block.start - 1) + 1
+        prose.append(source[pos:max(pos, fence_line_start)])
+        if block.lang not in NON_CODE_LANGS:
+            code.append(block.text)
+        close_line_end = source.find('\n', block.end + 1)
+        pos = section.end if close_line_end == -1 else min(close_line_end + 1, section.end)
+    prose.append(source[pos:section.end])
+
+    prose_lines = []
+    for line in ''.join(prose).split('\n'):
+        if line.startswith('#'):
+            headings.append(line.lstrip('#').strip())
+        else:
+            prose_lines.append(line)
+    # 章节自身的“## ”标题行也在这里被归入标题字段
+    return {
+        FIELD_HEADING: '\n'.join(headings),
+        FIELD_PROSE: '\n'.join(prose_lines),
+        FIELD_CODE: '\n'.join(code)
+    }
+
+
+class SearchIndex:
+    """notes目录的倒排索引"""
+
+    def __init__(self, notes_dir=None, index_path=None):
+        self.notes_dir = Path(notes_dir or Path(__file__).parent / "notes")
+        self.index_path = Path(index_path or Path(get_cache_dir()) / "search_index.pickle")
+        self._lock = threading.Lock()
+        # 串行化refresh，避免并发重建同一文件
+        self._refresh_lock = threading.Lock()
+        # 上次检查notes目录的时间（time.monotonic）
+        self._checked_at = None
+        self._reset()
+        self._load()
+
+    def _reset(self):
+        # 文件名 -> {"signature": (mtime_ns, size), "sha1": ..., "docs": [doc_id, ...]}
+        self.files = {}
+        # doc_id -> {"file", "section_id", "title", "text", "lengths": {字段: 词项数}, "terms": {字段: [词项]}}
+        self.docs = {}
+        # 字段 -> 词项 -> {doc_id: 词频}
+        self.postings = {field: defaultdict(dict) for field in FIELD_WEIGHTS}
+        self.total_lengths = {field: 0 for field in FIELD_WEIGHTS}
+        self.next_doc_id = 0
+
+    def _load(self):
+        """读取持久化的索引，格式不符或损坏时从空索引开始"""
+        try:
+            with open(self.index_path, "rb") as f:
+                state = pickle.load(f)
+            if state.get("format") != INDEX_FORMAT:
+                return
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+            return
+        self.files = state["files"]
+        self.docs = state["docs"]
+        self.postings = {field: defaultdict(dict, postings) for field, postings in state["postings"].items()}
+        self.total_lengths = state["total_lengths"]
+        self.next_doc_id = state["next_doc_id"]
+
+    def save(self):
+        """持久化索引，先写临时文件再替换"""
+        with self._lock:
+            state = {
+                "format": INDEX_FORMAT,
+                "files": self.files,
+                "docs": self.docs,
+                "postings": {field: dict(postings) for field, postings in self.postings.items()},
+                "total_lengths": self.total_lengths,
+                "next_doc_id": self.next_doc_id
+            }
+            tmp_path = str(self.index_path) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.index_path)
+
+    def refresh(self, max_age=None):
+        """
+        检查notes目录，只重建新增或变化的文件并移除已删除的文件；有变化时返回True
+        max_age: 距离上次检查不超过该秒数时不再检查，直接返回False
+        """
+        with self._refresh_lock:
+            now = time.monotonic()
+            if max_age is not None and self._checked_at is not None and now - self._checked_at < max_age:
+                return False
+            changed = self._refresh()
+            self._checked_at = now
+            return changed
+
+    def _refresh(self):
+        changed = False
+        seen = set()
+        for md_file in sorted(self.notes_dir.glob("*.md")):
+            seen.add(md_file.name)
+            stat = md_file.stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            entry = self.files.get(md_file.name)
+            if entry is not None and entry["signature"] == signature:
+                continue
+
+            raw = md_file.read_bytes()
+            sha1 = hashlib.sha1(raw).hexdigest()
+            with self._lock:
+                if entry is not None and entry["sha1"] == sha1:
+                    # 只有修改时间变化（例如打包程序重新解压），内容未变
+                    entry["signature"] = signature
+                    continue
+                self._remove_file_locked(md_file.name)
+                self._add_file_locked(md_file.name, raw.decode("utf-8"), signature, sha1)
+            changed = True
+
+        with self._lock:
+            for file_name in [name for name in self.files if name not in seen]:
+                self._remove_file_locked(file_name)
+                changed = True
+        return changed
+
+    def _add_file_locked(self, file_name, md_content, signature, sha1):
+        doc_ids = []
+        for section_id, section in enumerate(parse_document(md_content).sections):
+            fields = _split_fields(section)
+            doc_id = self.next_doc_id
+            self.next_doc_id += 1
+            terms = {}
+            lengths = {}
+            for field, text in fields.items():
+                tokens = tokenize(text, unigrams=True)
+                lengths[field] = len(tokens)
+                self.total_lengths[field] += len(tokens)
+                counts = Counter(tokens)
+                terms[field] = list(counts)
+                postings = self.postings[field]
+                for term, tf in counts.items():
+                    postings[term][doc_id] = tf
+            self.docs[doc_id] = {
+                "file": file_name,
+                "section_id": section_id,
+                "title": section.title,
+                "text": fields[FIELD_PROSE] + '\n' + fields[FIELD_CODE],
+                "lengths": lengths,
+                "terms": terms
+            }
+            doc_ids.append(doc_id)
+        self.files[file_name] = {"signature": signature, "sha1": sha1, "docs": doc_ids}
+
+    def _remove_file_locked(self, file_name):
+        entry = self.files.pop(file_name, None)
+        if entry is None:
+            return
+        for doc_id in entry["docs"]:
+            doc = self.docs.pop(doc_id)
+            for field, terms in doc["terms"].items():
+                self.total_lengths[field] -= doc["lengths"][field]
+                postings = self.postings[field]
+                for term in terms:
+                    term_postings = postings[term]
+                    term_postings.pop(doc_id, None)
+                    if not term_postings:
+                        del postings[term]
+
+    def search(self, query, limit=20):
+        """按BM25检索，返回[{file, section_id, title, score, snippet, highlights}]"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self.docs)
+            if not doc_count:
+                return []
+            scores = defaultdict(float)
+            for field, weight in FIELD_WEIGHTS.items():
+                postings = self.postings[field]
+                avg_length = (self.total_lengths[field] / doc_count) or 1.0
+                for term in terms:
+                    term_postings = postings.get(term)
+                    if not term_postings:
+                        continue
+                    idf = math.log(1 + (doc_count - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+                    for doc_id, tf in term_postings.items():
+                        length = self.docs[doc_id]["lengths"][field]
+                        norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+                        scores[doc_id] += weight * idf * tf * (BM25_K1 + 1) / norm
+
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+            results = []
+            for doc_id, score in ranked:
+                doc = self.docs[doc_id]
+                snippet, highlights = _make_snippet(doc["text"], terms)
+                results.append({
+                    "file": doc["file"],
+                    "section_id": doc["section_id"],
+                    "title": doc["title"],
+                    "score": round(score, 4),
+                    "snippet": snippet,
+                    "highlights": highlights
+                })
+            return results
+
+    def stats(self):
+        """返回索引规模"""
+        with self._lock:
+            return {
+                "files": len(self.files),
+                "docs": len(self.docs),
+                "terms": {field: len(postings) for field, postings in self.postings.items()}
+            }
+
+
+def _make_snippet(text, terms):
+    """截取首个命中附近的文本，返回(片段, 片段内的高亮区间列表)"""
+    lowered = text.lower()
+    first = -1
+    for term in terms:
+        pos = lowered.find(term)
+        if pos != -1 and (first == -1 or pos < first):
+            first = pos
+    if first == -1:
+        first = 0
+
+    start = max(0, first - SNIPPET_RADIUS)
+    end = min(len(text), first + SNIPPET_RADIUS * 2)
+    snippet = text[start:end].replace('\n', ' ')
+    lowered_snippet = snippet.lower()
+
+    highlights = []
+    for term in terms:
+        pos = lowered_snippet.find(term)
+        while pos != -1:
+            highlights.append([pos, pos + len(term)])
+            pos = lowered_snippet.find(term, pos + len(term))
+    # 合并重叠区间（中文二元组会相互重叠）
+    merged = []
+    for span in sorted(highlights):
+        if merged and span[0] <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], span[1])
+        else:
+            merged.append(span)
+
+    if start > 0:
+        snippet = '…' + snippet
+        merged = [[s + 1, e + 1] for s, e in merged]
+    if end < len(text):
+        snippet += '…'
+    return snippet, merged
+
+
+_shared_index = None
+_shared_lock = threading.Lock()
+
+
+def get_search_index():
+    """
+    返回进程内共享的索引，首次调用时加载持久化文件
+    距离上次检查超过[search] refresh_interval秒时检查笔记是否变化，避免每次搜索都stat全部笔记
+    """
+    global _shared_index
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = SearchIndex()
+    if _shared_index.refresh(get_server_option("search", "refresh_interval", 10.0)):
+        try:
+            _shared_index.save()
+        except OSError:
+            # 缓存目录不可写时仅在内存中使用
+            pass
+    return _shared_index
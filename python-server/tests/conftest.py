@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from pathlib import Path
+
+# 服务端模块位于tests的上一级目录，按平铺模块导入
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
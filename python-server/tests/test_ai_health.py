@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from ai_health import CircuitBreaker, HealthMonitor
+
+
+def _monitor():
+    probed = threading.Event()
+
+    def probe():
+        probed.set()
+        return True
+
+    return HealthMonitor(probe, CircuitBreaker(), interval=60), probed
+
+
+def test_warm_up_probes_immediately():
+    monitor, probed = _monitor()
+    monitor.start(warm_up=True)
+    try:
+        assert probed.wait(2)
+    finally:
+        monitor.stop()
+
+
+def test_without_warm_up_monitor_still_runs():
+    monitor, probed = _monitor()
+    monitor.start(warm_up=False)
+    try:
+        # 不预热时第一次探测推迟到探测间隔之后
+        assert not probed.wait(0.2)
+        monitor.check_now()
+        assert probed.wait(2)
+        assert monitor.status()["available"]
+    finally:
+        monitor.stop()
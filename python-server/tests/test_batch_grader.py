@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from types import SimpleNamespace
+from ai_cache import OP_EVALUATE, OP_HINT, OP_SOLUTION
+from ai_helper import AITutor
+from ai_scheduler import AIScheduler, OP_BATCH_EVALUATE
+from batch_grader import BatchGrader
+from config_loader import get_server_option
+
+
+class _FakeCompletions:
+    """记录同时进行的调用数峰值的模型接口"""
+
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.calls = 0
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.running += 1
+            self.calls += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.delay)
+        with self.lock:
+            self.running -= 1
+        message = SimpleNamespace(content="通过")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def _make_tutor(scheduler, completions):
+    tutor = AITutor()
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    tutor._get_client = lambda: (client, "fake-model")
+    tutor._cache_key = lambda cache: None
+    tutor.scheduler = scheduler
+    return tutor
+
+
+def _run(code):
+    # 每份代码的输出都不同，本地评估无法确认，全部交给AI判断
+    return {"success": True, "output": code, "stderr": "", "limit": None, "vars": None}
+
+
+def _submissions(count):
+    return [{"id": i, "code": f"print({i})", "expected_code": "print('expected')"} for i in range(count)]
+
+
+def test_default_batch_limit_is_configured_llm_concurrency():
+    scheduler = AIScheduler()
+    assert scheduler.operation_limits[OP_BATCH_EVALUATE] == max(1, get_server_option("batch", "llm_concurrency", 4))
+
+
+def test_batch_ai_concurrency_matches_configured_limit():
+    limits = {OP_HINT: 4, OP_SOLUTION: 2, OP_EVALUATE: 1, OP_BATCH_EVALUATE: 3}
+    completions = _FakeCompletions()
+    tutor = _make_tutor(AIScheduler(max_concurrency=6, operation_limits=limits,
+                                    requests_per_minute=0, tokens_per_minute=0), completions)
+    try:
+        results, summary = BatchGrader(_run, lambda: tutor, workers=12).grade_all(_submissions(12))
+    finally:
+        tutor.close()
+
+    assert summary["llm_calls"] == completions.calls == 12
+    assert summary["tiers"] == {"llm": 12}
+    assert all(item["evaluation"]["passed"] for item in results)
+    # 批量评估的并发只受batch_evaluate上限限制，不受单次评估的evaluate_concurrency限制
+    assert completions.peak == 3
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+
+import config_loader
+from config_loader import get_server_option, load_server_config
+
+
+def test_server_config_is_parsed_once(monkeypatch):
+    config = load_server_config()
+    reads = []
+    monkeypatch.setattr(config_loader.ConfigParser, "read",
+                        lambda self, *args, **kwargs: reads.append(args))
+    # server.ini未变化时直接使用缓存的解析结果
+    assert load_server_config() is config
+    get_server_option("dispatcher", "max_in_flight", 32)
+    assert reads == []
+
+
+def test_server_config_reloads_after_change(monkeypatch):
+    config = load_server_config()
+    # 修改时间或大小变化后重新读取
+    monkeypatch.setattr(config_loader, "_server_config_signature", (0, 0))
+    reloaded = load_server_config()
+    assert reloaded is not config
+    assert reloaded.sections() == config.sections()
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from dispatcher import CommandDispatcher
+
+
+def _blocking_dispatcher(max_in_flight):
+    release = threading.Event()
+    handled = []
+
+    def handler(data):
+        release.wait(5)
+        handled.append(data["requestId"])
+
+    dispatcher = CommandDispatcher(handler, max_in_flight=max_in_flight,
+                                   pool_sizes={"ai": 4, "exec": 4, "meta": 4})
+    return dispatcher, release, handled
+
+
+def test_submit_does_not_block_when_full():
+    dispatcher, release, handled = _blocking_dispatcher(2)
+    try:
+        for i in range(5):
+            # 超过上限的消息排队，提交立即返回
+            dispatcher.submit({"command": "run_code", "requestId": f"r{i}"})
+        assert dispatcher.in_flight == 2
+        assert dispatcher.queued == 3
+
+        assert dispatcher.withdraw("r3")["requestId"] == "r3"
+        assert dispatcher.withdraw("r0") is None
+        assert dispatcher.queued == 2
+
+        release.set()
+        deadline = time.monotonic() + 5
+        while dispatcher.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert sorted(handled) == ["r0", "r1", "r2", "r4"]
+        assert dispatcher.in_flight == 0
+        assert dispatcher.queued == 0
+    finally:
+        release.set()
+        dispatcher.shutdown(wait=True)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+from prompt_builder import strip_comments, hint_prompt, solution_prompt
+
+MULTILINE = '''def show():  # 显示帮助
+    text = """第一行   
+
+    # 不是注释
+第三行"""
+
+    # 注释
+    return text
+'''
+
+
+def test_strip_comments_keeps_multiline_string():
+    assert strip_comments(MULTILINE) == (
+        'def show():\n'
+        '    text = """第一行   \n'
+        '\n'
+        '    # 不是注释\n'
+        '第三行"""\n'
+        '    return text'
+    )
+    stripped, original = {}, {}
+    exec(strip_comments(MULTILINE), stripped)
+    exec(MULTILINE, original)
+    assert stripped["show"]() == original["show"]()
+
+
+def test_strip_comments_leaves_unparsable_code():
+    code = 'print("a"  # 注释\n\n'
+    assert strip_comments(code) == code
+
+
+def test_expected_code_is_compacted_as_code():
+    expected_code = "# 计算总和\ntotal = 0\n\nfor i in range(3):\n    total += i\n" + "print(total)\n" * 3
+    for build in (hint_prompt, solution_prompt):
+        user = build("print(1)", expected_code, "1")["messages"][1]["content"]
+        # 按代码压缩：去掉注释和空行，重复的行不会按输出合并
+        assert "预期输出：\ntotal = 0\nfor i in range(3):\n    total += i\nprint(total)\nprint(total)\nprint(total)" in user
+        assert "计算总和" not in user
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+import pytest
+from result_cache import analyze, ResultCache
+
+
+@pytest.mark.parametrize("code", [
+    "print(sum(range(10)))",
+    "items = {'a': 1}\nfor key in items:\n    print(key)",
+    "import math\nprint(math.sqrt(2))",
+])
+def test_deterministic_code(code):
+    assert analyze(code)[1]
+
+
+@pytest.mark.parametrize("code", [
+    "print(id(object()))",
+    "print(hash('abc'))",
+    "print({'a', 'b', 'c'})",
+    "print({c for c in 'abc'})",
+    "print(list(set('abc')))",
+    "print(sorted(frozenset('abc')))",
+    "class A: pass\nprint(A())",
+    "class Point:\n    def __init__(self, x):\n        self.x = x\n\nprint(f'{Point(1)}')",
+    "import random\nprint(random.random())",
+])
+def test_nondeterministic_code(code):
+    assert analyze(code)[1] is False
+
+
+def test_key_ignores_formatting_and_comments():
+    assert analyze("x = 1  # 注释\nprint( x )")[0] == analyze("x=1\nprint(x)")[0]
+
+
+def test_output_with_object_address_is_not_cached():
+    cache = ResultCache(max_entries=4)
+    result = {"success": True, "output": "<function f at 0x7f3a2c1d0e50>\n", "stderr": "", "limit": None}
+    cache.put("key", result)
+    assert cache.get("key") is None
+    cache.put("key", dict(result, output="42\n"))
+    assert cache.get("key")["output"] == "42\n"
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+import os
+from search_index import SearchIndex, tokenize
+
+NOTE = """# 数据结构
+
+## 列表
+
+列表是可变序列，可以通过索引访问元素。
+
+```python
+items = [1, 2, 3]
+print(items[0])
+```
+
+## 字典
+
+字典保存键值对。
+"""
+
+
+def _make_index(tmp_path):
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    (notes_dir / "01.md").write_text(NOTE, encoding="utf-8")
+    return SearchIndex(notes_dir, tmp_path / "index.pickle"), notes_dir
+
+
+def test_tokenize_query_uses_bigrams():
+    assert tokenize("列表 Print") == ["列表", "print"]
+    assert tokenize("列表", unigrams=True) == ["列表", "列", "表"]
+
+
+def test_single_cjk_character_query(tmp_path):
+    index, _ = _make_index(tmp_path)
+    index.refresh()
+    results = index.search("表")
+    assert [result["title"] for result in results][:1] == ["列表"]
+    assert results[0]["highlights"]
+    assert [result["title"] for result in index.search("典")] == ["字典"]
+    assert index.search("列表")[0]["title"] == "列表"
+
+
+def test_refresh_max_age_skips_recent_check(tmp_path):
+    index, notes_dir = _make_index(tmp_path)
+    assert index.refresh(max_age=60)
+    note = notes_dir / "02.md"
+    note.write_text("# 函数\n\n## 装饰器\n\n装饰器包装函数。\n", encoding="utf-8")
+    # 刚检查过，不再stat笔记
+    assert not index.refresh(max_age=60)
+    assert index.search("装饰器") == []
+    assert index.refresh(max_age=0)
+    assert index.search("装饰器")[0]["title"] == "装饰器"
+    os.remove(note)
+    assert index.refresh()
+    assert index.search("装饰器") == []
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+from md_parser import parse_document
+from tutorial_cache import TutorialCache
+from tutorial_index import TutorialIndex, build_index
+
+NOTE = """# 第二章 数据结构
+
+## 2.1 列表
+
+列表是可变序列。
+
+```python
+items = [1, 2, 3]
+print(items)
+```
+
+## 2.2 字典
+
+```python
+scores = {"a": 1}
+print(scores["a"])
+```
+"""
+
+
+def test_crlf_index_matches_live_parse(tmp_path):
+    notes_dir = tmp_path / "notes"
+    notes_dir.mkdir()
+    md_file = notes_dir / "chapter02.md"
+    md_file.write_bytes(NOTE.replace("\n", "\r\n").encode("utf-8"))
+    index_path = tmp_path / "tutorials.idx"
+    assert build_index(notes_dir, index_path) == 1
+
+    index = TutorialIndex.load(index_path)
+    try:
+        live = TutorialCache(parse_document).get(md_file)
+        tutorial = index.get(md_file)
+        assert tutorial == live.to_dict()
+        assert "\r" not in str(tutorial)
+        assert index.outline(md_file) == live.outline()
+        for section_id in range(len(tutorial["sections"])):
+            assert index.section(md_file, section_id) == live.section(section_id)
+    finally:
+        index.close()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+教程解析结果缓存
+
+以文件路径 + 修改时间 + 文件大小为键缓存解析后的教程，按LRU淘汰并限制总内存。
+每次读取都会stat一次文件，笔记在磁盘上被修改后自动重新解析。
+IPC与HTTP两种传输方式共用同一个缓存实例。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from config_loader import get_server_option
+
+
+class TutorialCache:
+    """按(mtime, size)校验的教程LRU缓存"""
+
+    def __init__(self, parser, max_entries=None, max_bytes=None):
+        """
+        parser: 接收Markdown文本、返回解析结果的函数
+        max_entries: 最多缓存的教程数
+        max_bytes: 缓存内容的近似内存上限（字节）
+        """
+        self.parser = parser
+        if max_entries is None:
+            max_entries = get_server_option("tutorial_cache", "max_entries", 32)
+        if max_bytes is None:
+            max_bytes = get_server_option("tutorial_cache", "max_bytes", 32 * 1024 * 1024)
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+
+        self._entries = OrderedDict()  # path -> (signature, size_bytes, tutorial)
+        self._lock = threading.Lock()
+        self._total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, md_file):
+        """返回解析后的教程，文件不存在时抛出FileNotFoundError；返回值为共享对象，调用方不要修改"""
+        path = os.path.abspath(str(md_file))
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        # 解析放在锁外，避免阻塞其他章节的读取
+        with open(path, 'r', encoding='utf-8') as f:
+            md_content = f.read()
+        tutorial = self.parser(md_content)
+        # 解析结果只保存偏移，内存占用以原文大小近似估算
+        size_bytes = stat.st_size
+
+        with self._lock:
+            old = self._entries.pop(path, None)
+            if old is not None:
+                self._total_bytes -= old[1]
+            # 单个条目超过上限时不缓存
+            if size_bytes <= self.max_bytes:
+                self._entries[path] = (signature, size_bytes, tutorial)
+                self._total_bytes += size_bytes
+                self._evict_locked()
+        return tutorial
+
+    def _evict_locked(self):
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._total_bytes > self.max_bytes):
+            _, (_, size_bytes, _) = self._entries.popitem(last=False)
+            self._total_bytes -= size_bytes
+            self.evictions += 1
+
+    def invalidate(self, md_file=None):
+        """移除指定文件的缓存，不提供参数时清空全部"""
+        with self._lock:
+            if md_file is None:
+                self._entries.clear()
+                self._total_bytes = 0
+                return
+            old = self._entries.pop(os.path.abspath(str(md_file)), None)
+            if old is not None:
+                self._total_bytes -= old[1]
+
+    def stats(self):
+        """返回命中率等统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+预构建的教程索引
+
+构建时解析notes目录下的全部Markdown，写出单个二进制索引文件；运行时通过mmap映射，
+get_tutorial直接切片返回章节内容，无需再解析Markdown。
+
+文件格式：
+    4字节魔数 b"PTIX" | 2字节版本 | 2字节保留 | 4字节目录长度 | 目录(UTF-8 JSON) | 正文区
+目录中记录每个笔记文件的源文件大小与SHA-1、标题，以及每个章节在正文区中的起止偏移、
+代码块偏移和内容哈希。
+
+使用方法：
+    python tutorial_index.py [输出路径]
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import hashlib
+import threading
+from pathlib import Path
+from md_parser import parse_document
+
+INDEX_MAGIC = b"PTIX"
+INDEX_VERSION = 4
+INDEX_HEADER = struct.Struct(">4sHHI")
+
+NOTES_DIR = Path(__file__).parent / "notes"
+DEFAULT_INDEX_PATH = NOTES_DIR / "tutorials.idx"
+
+
+def _sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def build_index(notes_dir=NOTES_DIR, output_path=DEFAULT_INDEX_PATH):
+    """解析notes_dir下的全部Markdown并写出索引文件，返回收录的文件数"""
+    blob = bytearray()
+    files = {}
+    for md_file in sorted(Path(notes_dir).glob("*.md")):
+        raw = md_file.read_bytes()
+        # 与实时解析（文本模式读取）一致，把CRLF和CR换行统一为LF，Windows检出的文件也得到相同的内容
+        document = parse_document(raw.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n"))
+
+        sections = []
+        for section in document.sections:
+            content = section.content
+            start = len(blob)
+            # 解析器给出的是字符偏移，正文区按UTF-8字节寻址
+            code_blocks = []
+            for block in section.blocks:
+                if not block.is_exercise:
+                    continue
+                block_start = start + len(content[:block.start - section.start].encode("utf-8"))
+                block_end = block_start + len(block.text.encode("utf-8"))
+                code_blocks.append([block_start, block_end])
+            encoded = content.encode("utf-8")
+            blob += encoded
+            sections.append({
+                "title": section.title,
+                "start": start,
+                "end": len(blob),
+                "size": section.size,
+                "hash": _sha1(encoded),
+                "code_blocks": code_blocks
+            })
+
+        files[md_file.name] = {
+            "size": len(raw),
+            "sha1": _sha1(raw),
+            "title": document.title,
+            "sections": sections
+        }
+
+    directory = json.dumps({"files": files}, ensure_ascii=False).encode("utf-8")
+    tmp_path = str(output_path) + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, len(directory)))
+        f.write(directory)
+        f.write(blob)
+    # 先写临时文件再替换，避免运行中的服务读到不完整的索引
+    os.replace(tmp_path, output_path)
+    return len(files)
+
+
+class TutorialIndex:
+    """内存映射的教程索引，源文件与索引不一致时返回None，由调用方回退到实时解析"""
+
+    def __init__(self, index_path=DEFAULT_INDEX_PATH):
+        self.index_path = Path(index_path)
+        self._file = open(self.index_path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, _, dir_length = INDEX_HEADER.unpack_from(self._mm)
+            if magic != INDEX_MAGIC or version != INDEX_VERSION:
+                raise ValueError(f"Unsupported tutorial index: {self.index_path}")
+            dir_start = INDEX_HEADER.size
+            self._blob_offset = dir_start + dir_length
+            self.files = json.loads(self._mm[dir_start:self._blob_offset].decode("utf-8"))["files"]
+        except Exception:
+            self.close()
+            raise
+        # 已校验过的源文件签名：file_name -> ((mtime_ns, size), 是否一致)
+        self._verified = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, index_path=DEFAULT_INDEX_PATH):
+        """打开索引文件，不存在或格式不符时返回None"""
+        try:
+            return cls(index_path)
+        except (OSError, ValueError):
+            return None
+
+    def close(self):
+        """释放映射和文件句柄"""
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._mm = None
+        self._file.close()
+
+    def is_fresh(self, md_file):
+        """检查源文件是否与索引一致；同一(mtime, size)只计算一次哈希"""
+        md_file = Path(md_file)
+        entry = self.files.get(md_file.name)
+        if entry is None:
+            return False
+        try:
+            stat = md_file.stat()
+        except OSError:
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._verified.get(md_file.name)
+            if cached is not None and cached[0] == signature:
+                return cached[1]
+
+        # 打包后的程序每次启动都会重新解压文件，修改时间不可靠，因此以内容哈希为准
+        fresh = stat.st_size == entry["size"] and _sha1(md_file.read_bytes()) == entry["sha1"]
+        with self._lock:
+            self._verified[md_file.name] = (signature, fresh)
+        return fresh
+
+    def _slice(self, start, end):
+        return self._mm[self._blob_offset + start:self._blob_offset + end].decode("utf-8")
+
+    def _section_dict(self, section):
+        return {
+            "title": section["title"],
+            "content": self._slice(section["start"], section["end"]),
+            "code_blocks": [self._slice(start, end) for start, end in section["code_blocks"]]
+        }
+
+    def get(self, md_file):
+        """从索引切片构造教程数据，索引已过期时返回None"""
+        if not self.is_fresh(md_file):
+            return None
+        entry = self.files[Path(md_file).name]
+        return {
+            "title": entry["title"],
+            "sections": [self._section_dict(section) for section in entry["sections"]]
+        }
+
+    def outline(self, md_file):
+        """返回教程目录，索引已过期时返回None"""
+        if not self.is_fresh(md_file):
+            return None
+        entry = self.files[Path(md_file).name]
+        return {
+            "title": entry["title"],
+            "sections": [{
+                "id": i,
+                "title": section["title"],
+                "size": section["size"],
+                "code_block_count": len(section["code_blocks"])
+            } for i, section in enumerate(entry["sections"])]
+        }
+
+    def section(self, md_file, section_id):
+        """返回单个章节；索引已过期时返回None，id不存在时抛出IndexError"""
+        if not self.is_fresh(md_file):
+            return None
+        sections = self.files[Path(md_file).name]["sections"]
+        if not isinstance(section_id, int) or not 0 <= section_id < len(sections):
+            raise IndexError(section_id)
+        return dict(self._section_dict(sections[section_id]), id=section_id)
+
+
+if __name__ == "__main__":
+    output = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_INDEX_PATH
+    count = build_index(NOTES_DIR, output)
+    print(f"已生成教程索引: {output}（{count} 个文件）")
@@ -4,11 +4,45 @@ import { electronApp, optimizer, is } from '@electron-toolkit/utils'
 import icon from '../../resources/icon.png?asset'
 import { spawn } from 'child_process'
 import fs from 'fs'
+import zlib from 'zlib'
 import stateStore from './store'
 // 存储Python进程引用
 let pythonProcess = null
 // 存储待处理的IPC请求
 let pendingRequests = new Map()
+// 输出通道帧格式，与python-server/ipc_protocol.py保持一致
+const FRAME_MAGIC = Buffer.from([0xfa, 0xce])
+const FRAME_HEADER_SIZE = 7
+const FRAME_FLAG_ZLIB = 0x01
+const NEGOTIATE_REQUEST_ID = '__negotiate__'
+// 请求超时，给AI响应更多时间；批量评估等持续返回中间结果的请求每收到一条重新计时
+const REQUEST_TIMEOUT_MS = 60000
+// 请求带deadline_ms时，在截止时间之后再等待Python返回cancelled状态的时间
+const DEADLINE_GRACE_MS = 2000
+
+// 通知Python停止处理请求（结束运行中的代码、关闭进行中的AI响应）
+function sendCancel(requestId) {
+  if (!pythonProcess || pythonProcess.killed) return
+  pythonProcess.stdin.write(
+    JSON.stringify({ command: 'cancel', payload: { requestId }, requestId: `cancel-${requestId}` }) +
+      '\n'
+  )
+}
+
+// 为待处理的请求设置（或重新设置）超时
+function armRequestTimeout(requestId) {
+  const pending = pendingRequests.get(requestId)
+  if (!pending) return
+  clearTimeout(pending.timer)
+  pending.timer = setTimeout(() => {
+    if (pendingRequests.get(requestId) === pending) {
+      pendingRequests.delete(requestId)
+      // 不再等待结果的请求也不应继续占用工作进程和模型调用
+      sendCancel(requestId)
+      pending.reject(new Error('请求超时'))
+    }
+  }, pending.timeoutMs || REQUEST_TIMEOUT_MS)
+}
 
 // 启动Python IPC服务器
 function startPythonIpcServer() {
@@ -51,131 +85,140 @@ function startPythonIpcServer() {
     env: { ...process.env, PYTHONIOENCODING: 'utf-8' }
   })
 
-  // 设置编码
+  // 设置编码（stdout按字节读取，以便解析长度前缀帧）
   pythonProcess.stdin.setDefaultEncoding('utf8')
-  pythonProcess.stdout.setEncoding('utf8')
   pythonProcess.stderr.setEncoding('utf8')
 
-  // 存储流式传输的数据
+  // 与Python端协商使用长度前缀帧，确认消息之后的输出均为帧
+  let framedMode = false
+  pythonProcess.stdin.write(
+    JSON.stringify({
+      command: 'negotiate',
+      payload: { framing: 'frame', compression: ['zlib'] },
+      requestId: NEGOTIATE_REQUEST_ID
+    }) + '\n'
+  )
+
+  // 存储旧协议流式传输的数据
   const streamBuffers = new Map()
 
   // 处理Python进程的标准输出
-  let dataBuffer = '' // 用于存储不完整的JSON数据
+  let dataBuffer = Buffer.alloc(0) // 用于存储不完整的消息数据
   pythonProcess.stdout.on('data', (data) => {
     try {
-      // 将新数据添加到缓冲区
-      dataBuffer += data.toString()
-
-      // 尝试从缓冲区中提取完整的JSON对象
-      let startIndex = 0
-      let endIndex
-
-      // 循环处理缓冲区中的所有完整JSON对象
-      while ((endIndex = findJsonEnd(dataBuffer, startIndex)) !== -1) {
-        const jsonStr = dataBuffer.substring(startIndex, endIndex + 1)
-        startIndex = endIndex + 1
+      dataBuffer = dataBuffer.length ? Buffer.concat([dataBuffer, data]) : data
+
+      while (dataBuffer.length > 0) {
+        if (framedMode) {
+          // 帧模式：2字节魔数 | 1字节标志位 | 4字节正文长度 | 正文
+          if (dataBuffer[0] !== FRAME_MAGIC[0] || dataBuffer[1] !== FRAME_MAGIC[1]) {
+            // 混入的非帧文本（例如用户代码的线程直接写入stdout），跳到下一个帧头
+            const next = dataBuffer.indexOf(FRAME_MAGIC, 1)
+            const skipped = next === -1 ? dataBuffer : dataBuffer.subarray(0, next)
+            console.warn('跳过非帧数据:', skipped.toString('utf8'))
+            dataBuffer = next === -1 ? Buffer.alloc(0) : dataBuffer.subarray(next)
+            continue
+          }
+          if (dataBuffer.length < FRAME_HEADER_SIZE) break
+          const flags = dataBuffer[2]
+          const length = dataBuffer.readUInt32BE(3)
+          if (dataBuffer.length < FRAME_HEADER_SIZE + length) break
 
-        try {
-          const response = JSON.parse(jsonStr)
-          console.log('Python响应类型:', response.status)
-
-          // 处理流式传输
-          if (response.status === 'stream_start') {
-            // 初始化流缓冲区
-            streamBuffers.set(response.requestId, {
-              chunks: new Array(response['total_chunks']).fill(''),
-              total: response['total_chunks'],
-              received: 0,
-              completed: false // 添加标志表示是否已完成
-            })
-          } else if (response.status === 'stream_chunk') {
-            // 存储数据块
-            const buffer = streamBuffers.get(response.requestId)
-            if (buffer && !buffer.completed) {
-              buffer.chunks[response['chunk_index']] = response['chunk_data']
-              buffer.received++
-
-              // 检查是否所有块都已接收
-              if (buffer.received === buffer.total) {
-                processCompleteStream(response.requestId, buffer)
-              }
-            }
-          } else if (response.status === 'stream_end') {
-            // 标记流传输结束
-            const buffer = streamBuffers.get(response.requestId)
-            if (buffer && !buffer.completed && buffer.received === buffer.total) {
-              processCompleteStream(response.requestId, buffer)
-            }
-          } else if (response.status && pendingRequests.has(response.requestId)) {
-            // 处理常规响应（非流式）
-            const { resolve, reject } = pendingRequests.get(response.requestId)
-            pendingRequests.delete(response.requestId)
-
-            if (response.status === 'error') {
-              reject(new Error(response.message))
-            } else {
-              resolve(response)
+          let body = dataBuffer.subarray(FRAME_HEADER_SIZE, FRAME_HEADER_SIZE + length)
+          dataBuffer = dataBuffer.subarray(FRAME_HEADER_SIZE + length)
+          try {
+            if (flags & FRAME_FLAG_ZLIB) {
+              body = zlib.inflateSync(body)
             }
+            handlePythonResponse(JSON.parse(body.toString('utf8')))
+          } catch (frameError) {
+            console.error('解析帧数据时出错:', frameError)
           }
-        } catch (jsonError) {
-          console.error('解析JSON时出错:', jsonError, '\n原始数据:', jsonStr)
-        }
-      }
-
-      // 保留未处理的数据部分
-      if (startIndex > 0) {
-        dataBuffer = dataBuffer.substring(startIndex)
-      }
+        } else {
+          // 旧协议：每行一个JSON
+          const newlineIndex = dataBuffer.indexOf(0x0a)
+          if (newlineIndex === -1) break
+          const line = dataBuffer.subarray(0, newlineIndex).toString('utf8').trim()
+          dataBuffer = dataBuffer.subarray(newlineIndex + 1)
+          if (!line) continue
 
-      // 如果缓冲区过大，可能是因为接收了不完整的数据，进行清理
-      if (dataBuffer.length > 1000000) {
-        // 1MB限制
-        console.warn('数据缓冲区过大，清理中...')
-        dataBuffer = dataBuffer.substring(dataBuffer.length - 100000) // 保留最后100KB
+          try {
+            handlePythonResponse(JSON.parse(line))
+          } catch (jsonError) {
+            console.error('解析JSON时出错:', jsonError, '\n原始数据:', line)
+          }
+        }
       }
     } catch (error) {
       console.error('处理Python响应时出错:', error)
     }
   })
 
-  // 辅助函数：查找JSON对象的结束位置
-  function findJsonEnd(str, startPos) {
-    try {
-      // 找到可能的JSON开始位置
-      let pos = str.indexOf('{', startPos)
-      if (pos === -1) return -1
-
-      let openBraces = 0
-      let inString = false
-      let escaped = false
-
-      for (let i = pos; i < str.length; i++) {
-        const char = str[i]
-
-        if (inString) {
-          if (escaped) {
-            escaped = false
-          } else if (char === '\\') {
-            escaped = true
-          } else if (char === '"') {
-            inString = false
-          }
-        } else if (char === '"') {
-          inString = true
-        } else if (char === '{') {
-          openBraces++
-        } else if (char === '}') {
-          openBraces--
-          if (openBraces === 0) {
-            return i // 找到JSON结束位置
-          }
+  // 辅助函数：处理一条完整的响应
+  function handlePythonResponse(response) {
+    console.log('Python响应类型:', response.status)
+
+    if (response.requestId === NEGOTIATE_REQUEST_ID) {
+      // 协商确认，之后的数据按帧解析
+      framedMode = response.status === 'success' && response.data.framing === 'frame'
+      return
+    }
+
+    // 处理旧协议的流式传输
+    if (response.status === 'stream_start') {
+      // 初始化流缓冲区
+      streamBuffers.set(response.requestId, {
+        chunks: new Array(response['total_chunks']).fill(''),
+        total: response['total_chunks'],
+        received: 0,
+        completed: false // 添加标志表示是否已完成
+      })
+    } else if (response.status === 'stream_chunk') {
+      // 存储数据块
+      const buffer = streamBuffers.get(response.requestId)
+      if (buffer && !buffer.completed) {
+        buffer.chunks[response['chunk_index']] = response['chunk_data']
+        buffer.received++
+
+        // 检查是否所有块都已接收
+        if (buffer.received === buffer.total) {
+          processCompleteStream(response.requestId, buffer)
         }
       }
-
-      return -1 // 未找到完整的JSON
-    } catch (e) {
-      console.error('查找JSON结束位置时出错:', e)
-      return -1
+    } else if (response.status === 'stream_end') {
+      // 标记流传输结束
+      const buffer = streamBuffers.get(response.requestId)
+      if (buffer && !buffer.completed && buffer.received === buffer.total) {
+        processCompleteStream(response.requestId, buffer)
+      }
+    } else if (
+      response.status === 'output' ||
+      response.status === 'delta' ||
+      response.status === 'item'
+    ) {
+      // 运行中的程序输出、AI回复片段或批量评估的单份结果，转发给发起请求的窗口，请求保持等待最终结果
+      const pending = pendingRequests.get(response.requestId)
+      if (pending) {
+        // 仍在产生中间结果的请求重新计算超时
+        armRequestTimeout(response.requestId)
+      }
+      if (pending && pending.sender && !pending.sender.isDestroyed()) {
+        pending.sender.send(`python-${response.status}`, {
+          requestId: response.requestId,
+          stream: response.stream,
+          data: response.data
+        })
+      }
+    } else if (response.status && pendingRequests.has(response.requestId)) {
+      // 处理常规响应
+      const { resolve, reject } = pendingRequests.get(response.requestId)
+      pendingRequests.delete(response.requestId)
+
+      if (response.status === 'error') {
+        reject(new Error(response.message))
+      } else {
+        resolve(response)
+      }
     }
   }
 
@@ -191,17 +234,8 @@ function startPythonIpcServer() {
         const fullResponse = JSON.parse(fullJson)
         console.log('流式传输完成，重组数据成功')
 
-        // 处理重组后的响应
-        if (pendingRequests.has(requestId)) {
-          const { resolve, reject } = pendingRequests.get(requestId)
-          pendingRequests.delete(requestId)
-
-          if (fullResponse.status === 'error') {
-            reject(new Error(fullResponse.message))
-          } else {
-            resolve(fullResponse)
-          }
-        }
+        // 重组后的消息可能是最终响应，也可能是较大的程序输出
+        handlePythonResponse(fullResponse)
       } catch (parseError) {
         console.error('解析重组数据时出错:', parseError)
         if (pendingRequests.has(requestId)) {
@@ -435,26 +469,24 @@ app.whenReady().then(() => {
 
     return new Promise((resolve, reject) => {
       try {
-        // 生成唯一请求ID
-        const requestId = Date.now().toString() + Math.random().toString().substring(2, 8)
+        // 生成唯一请求ID，需要接收程序输出的请求由渲染进程预先指定
+        const requestId =
+          request.requestId || Date.now().toString() + Math.random().toString().substring(2, 8)
 
         // 添加请求ID到请求中
         const requestWithId = { ...request, requestId }
 
-        // 存储请求的resolve和reject函数
-        pendingRequests.set(requestId, { resolve, reject })
+        // 存储请求的resolve和reject函数，以及用于转发程序输出的窗口
+        // 带deadline_ms的请求由Python在截止时间返回cancelled状态，这里只做兜底
+        const timeoutMs = request.deadline_ms ? request.deadline_ms + DEADLINE_GRACE_MS : null
+        pendingRequests.set(requestId, { resolve, reject, sender: event.sender, timeoutMs })
 
         // 发送请求到Python进程
         const requestString = JSON.stringify(requestWithId) + '\n'
         pythonProcess.stdin.write(requestString)
 
         // 设置超时
-        setTimeout(() => {
-          if (pendingRequests.has(requestId)) {
-            pendingRequests.delete(requestId)
-            reject(new Error('请求超时'))
-          }
-        }, 60000) // 增加到60秒超时，给AI响应更多时间
+        armRequestTimeout(requestId)
       } catch (error) {
         reject(error)
       }
@@ -1,4 +1,38 @@
 import { contextBridge, ipcRenderer } from 'electron'
+// 生成请求ID，data中已指定requestId时使用它（用于之后cancelRequest）
+function newRequestId(prefix, data) {
+  return data.requestId || prefix + Date.now().toString() + Math.random().toString().substring(2, 8)
+}
+
+// 把data拆成请求信封字段（requestId、deadline_ms）和payload
+function splitEnvelope(data) {
+  // eslint-disable-next-line no-unused-vars
+  const { requestId, deadline_ms, ...payload } = data
+  return { deadline_ms, payload }
+}
+
+// 发送带stream标记的请求，并把AI回复片段转发给回调
+async function invokeWithDeltas(command, data, onDelta) {
+  const requestId = newRequestId('ai-', data)
+  const { deadline_ms, payload } = splitEnvelope(data)
+  const listener = (event, message) => {
+    if (message.requestId === requestId) {
+      onDelta(message.data)
+    }
+  }
+  ipcRenderer.on('python-delta', listener)
+  try {
+    return await ipcRenderer.invoke('python-ipc', {
+      command,
+      payload: { ...payload, stream: true },
+      requestId,
+      deadline_ms
+    })
+  } finally {
+    ipcRenderer.removeListener('python-delta', listener)
+  }
+}
+
 // 创建API接口，用于替代原有的HTTP API
 const ipcApi = {
   // 获取所有教程
@@ -15,6 +49,34 @@ const ipcApi = {
       payload: { tutorialKey }
     })
   },
+  // 获取教程目录（不含章节正文）
+  getTutorialOutline: async (tutorialKey) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'get_tutorial_outline',
+      payload: { tutorialKey }
+    })
+  },
+  // 获取单个章节
+  getSection: async (tutorialKey, sectionId) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'get_section',
+      payload: { tutorialKey, sectionId }
+    })
+  },
+  // 预取多个章节（例如当前章节的相邻章节）
+  prefetchSections: async (tutorialKey, sectionIds) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'prefetch_sections',
+      payload: { tutorialKey, sectionIds }
+    })
+  },
+  // 全文搜索教程
+  searchTutorials: async (query, limit) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'search_tutorials',
+      payload: { query, limit }
+    })
+  },
   // 运行代码
   runCode: async (data) => {
     return ipcRenderer.invoke('python-ipc', {
@@ -28,6 +90,62 @@ const ipcApi = {
       payload: data
     })
   },
+  // 运行代码并实时接收输出，onOutput(stream, text)中stream为'stdout'或'stderr'
+  runCodeStreaming: async (data, onOutput, simple = false) => {
+    const requestId = newRequestId('run-', data)
+    const { deadline_ms, payload } = splitEnvelope(data)
+    const listener = (event, message) => {
+      if (message.requestId === requestId) {
+        onOutput(message.stream, message.data)
+      }
+    }
+    ipcRenderer.on('python-output', listener)
+    try {
+      return await ipcRenderer.invoke('python-ipc', {
+        command: simple ? 'run_code_simple' : 'run_code',
+        payload: { ...payload, stream: true },
+        requestId,
+        deadline_ms
+      })
+    } finally {
+      ipcRenderer.removeListener('python-output', listener)
+    }
+  },
+  // 批量评估多份代码，submissions为[{ id, code, expected_code }]，每份结果完成时调用onItem
+  batchEvaluate: async (data, onItem) => {
+    const requestId = newRequestId('batch-', data)
+    const { deadline_ms, payload } = splitEnvelope(data)
+    const listener = (event, message) => {
+      if (message.requestId === requestId) {
+        onItem(message.data)
+      }
+    }
+    ipcRenderer.on('python-item', listener)
+    try {
+      return await ipcRenderer.invoke('python-ipc', {
+        command: 'batch_evaluate',
+        payload: { ...payload, stream: true },
+        requestId,
+        deadline_ms
+      })
+    } finally {
+      ipcRenderer.removeListener('python-item', listener)
+    }
+  },
+  // 取消进行中的请求（requestId为调用时在data中指定的值），被取消的请求以status为'cancelled'的响应结束
+  cancelRequest: async (requestId) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'cancel',
+      payload: { requestId }
+    })
+  },
+  // 展开运行结果中的变量，path为逐层子项序号，按页返回
+  inspectVar: async (varsHandle, name, path = [], offset = 0, limit) => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'inspect_var',
+      payload: { varsHandle, name, path, offset, limit }
+    })
+  },
   test: async (data) => {
     return ipcRenderer.invoke('python-ipc', {
       command: 'test',
@@ -49,6 +167,14 @@ const ipcApi = {
     })
   },
 
+  // 流式获取提示或解决方案，onDelta(text)随生成逐段调用，最终结果与getHint/getSolution相同
+  getHintStreaming: async (data, onDelta) => {
+    return invokeWithDeltas('get_hint', data, onDelta)
+  },
+  getSolutionStreaming: async (data, onDelta) => {
+    return invokeWithDeltas('get_solution', data, onDelta)
+  },
+
   // 获取模型密钥配置
   getModelKeys: async () => {
     return ipcRenderer.invoke('python-ipc', {
@@ -73,6 +199,14 @@ const ipcApi = {
     })
   },
 
+  // 获取AI服务的可用性状态，可频繁轮询
+  getAiStatus: async () => {
+    return ipcRenderer.invoke('python-ipc', {
+      command: 'ai_status',
+      payload: {}
+    })
+  },
+
   // 检查 API 密钥状态
   checkApiKey: async () => {
     return ipcRenderer.invoke('python-ipc', {